@@ -50,6 +50,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'paperflow.instrumentation.RequestMetricsMiddleware',  # first, so it times everything below
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # <-- WhiteNoise
@@ -87,11 +88,73 @@ WSGI_APPLICATION = 'core.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        # PAPERFLOW_DB_NAME points a run at another database, e.g. a generated benchmark catalog
+        'NAME': os.environ.get('PAPERFLOW_DB_NAME', BASE_DIR / 'db.sqlite3'),
     }
 }
 
 
+# Cache
+# File-based so every gunicorn worker shares the same entries and invalidation stamps
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+        # Entries are keyed by row ids, so another database must not share them
+        'KEY_PREFIX': os.environ.get('PAPERFLOW_DB_NAME', ''),
+    }
+}
+
+
+# PaperFlow tuning
+
+# Note view/download counters are buffered per worker and flushed in batches
+PAPERFLOW_COUNTER_FLUSH_INTERVAL = 5  # seconds
+PAPERFLOW_COUNTER_MAX_PENDING = 500   # distinct notes before an early flush
+
+# Background process pool for PDF previews (0 runs jobs inline)
+PAPERFLOW_TASK_WORKERS = 2
+PAPERFLOW_TASK_QUEUE_LIMIT = 64       # pending jobs per worker before new ones are dropped
+
+# Uploaded files are hashed while they stream in (content-addressed note storage)
+FILE_UPLOAD_HANDLERS = [
+    'paperflow.uploads.HashingMemoryFileUploadHandler',
+    'paperflow.uploads.HashingTemporaryFileUploadHandler',
+]
+
+# Widths (px) of the resized copies made of site images; AVIF/WebP when Pillow supports them
+PAPERFLOW_IMAGE_WIDTHS = (320, 640, 1024, 1600)
+
+# Request instrumentation: requests slower than this (ms) are logged with their SQL (None disables)
+PAPERFLOW_SLOW_REQUEST_MS = 1000
+# Bearer token for the diagnostics/metrics endpoints (staff sessions work without it)
+PAPERFLOW_METRICS_TOKEN = os.environ.get('PAPERFLOW_METRICS_TOKEN')
+# Each worker writes its metrics here every few seconds; /api/metrics sums the files (None: this process only)
+PAPERFLOW_METRICS_DIR = BASE_DIR / 'metrics'
+PAPERFLOW_METRICS_WRITE_INTERVAL = 5  # seconds
+
+# Academic years kept per course by the prune_academic_years job
+PAPERFLOW_ACADEMIC_YEARS_TO_KEEP = 2
+
+# Resumable uploads are sent in chunks of at most this many bytes
+PAPERFLOW_UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024
+
+# Note downloads (locked during the free trial)
+PAPERFLOW_DOWNLOADS_ENABLED = False
+# Hand file transfers to the front proxy: None, 'nginx' (X-Accel-Redirect) or 'apache' (X-Sendfile)
+PAPERFLOW_SENDFILE_BACKEND = None
+PAPERFLOW_SENDFILE_URL_PREFIX = '/protected-media/'  # nginx internal location mapped to MEDIA_ROOT
+
+# Cursor-paginated lists (search, students, faculties): rows per page, and the most ?page_size= may ask for
+PAPERFLOW_PAGE_SIZE = 20
+PAPERFLOW_MAX_PAGE_SIZE = 100
+
+# Search suggestions are re-weighted by view count this often (seconds; 0 never):
+# one background reload per worker, as note changes are replayed without one
+PAPERFLOW_SUGGEST_REFRESH_INTERVAL = 60 * 60
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
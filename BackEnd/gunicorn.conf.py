@@ -0,0 +1,32 @@
+# gunicorn.conf.py - picked up automatically when gunicorn starts from BackEnd/
+
+
+def on_starting(server):
+    # Metrics files of the previous run may carry pids this run's workers
+    # are about to be given; archive them before any worker writes
+    import os
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+    django.setup()
+    from paperflow.metrics import archive_stale_files
+    archive_stale_files()
+
+
+def post_worker_init(worker):
+    # Build the in-memory search indexes (typo correction, suggestions)
+    # before the first request needs them
+    from django.db import connection
+    from paperflow.fuzzy import fuzzy_index
+    from paperflow.suggest import prefix_index
+    fuzzy_index.get()
+    prefix_index.get()
+    connection.close()
+
+
+def worker_exit(server, worker):
+    # Write buffered view/download counts and finish queued file deletions
+    # before the worker goes away
+    from paperflow.counters import flush_counters
+    from paperflow.reaper import reaper
+    flush_counters()
+    reaper.drain()
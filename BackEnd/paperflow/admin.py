@@ -166,6 +166,6 @@ class SemesterAdmin(admin.ModelAdmin):
 @admin.register(Note)
 class NoteAdmin(admin.ModelAdmin):
     list_display = ('title', 'semester', 'note_type', 'uploaded_at', 'file_size_mb')
-    list_filter = ('note_type', 'uploaded_at', 'semester__year_level__academic_year__year')
+    list_filter = ('note_type', 'uploaded_at', 'academic_year')
     search_fields = ('title', 'semester__year_level__academic_year__course__name')
     ordering = ('-uploaded_at',)
@@ -0,0 +1,145 @@
+# benchmark.py - In-process latency, query and allocation benchmarks of the read API
+import gc
+import logging
+import math
+import time
+import tracemalloc
+
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from .cache import clear_caches
+from .catalog import CODE_PREFIX
+from .models import YearLevel, Note, Student
+
+
+def sample_paths():
+    """
+    (route name, path) for every read endpoint, pointed at real rows of the
+    current database (the year level with the most notes, so the numbers are worst-case).
+    The view counter is only exercised on generated notes, never real ones.
+    """
+    paths = [
+        ('site-settings', '/api/site-settings/'),
+        ('about-us', '/api/about-us/'),
+        ('how-it-works-list', '/api/how-it-works/'),
+        ('dashboard-api', '/api/dashboard/'),
+        ('statistics-api', '/api/statistics/'),
+        ('faculty-list-api', '/api/faculties/'),
+    ]
+
+    busiest = Note.objects.values('semester__year_level').annotate(count=Count('id')).order_by('-count').first()
+    if busiest is None:
+        return paths
+    year_level = YearLevel.objects.select_related('academic_year__course__faculty').get(
+        pk=busiest['semester__year_level']
+    )
+    course = year_level.academic_year.course
+    note = Note.objects.filter(semester__year_level=year_level).order_by('-id').first()
+    faculty_code, course_code = course.faculty.code, course.code
+    academic_year = year_level.academic_year.year
+    word = note.title.split()[0]
+    longest = max(note.title.split(), key=len)
+
+    paths += [
+        ('faculty-detail-api', f'/api/faculties/{faculty_code}/'),
+        ('faculty-courses-year-api', f'/api/faculties/{faculty_code}/year/{academic_year}/'),
+        ('course-detail-api', f'/api/faculties/{faculty_code}/courses/{course_code}/'),
+        ('year-level-notes-api',
+         f'/api/faculties/{faculty_code}/courses/{course_code}/{academic_year}/year/{year_level.level}/'),
+        ('search-api', f'/api/search/?q={word}'),
+        ('search-api:filtered', f'/api/search/?faculty={faculty_code}&note_type={note.note_type}'),
+        ('search-api:latest', '/api/search/'),
+        # A dropped letter, answered through the did-you-mean retry
+        ('search-api:typo', f'/api/search/?q={longest[:2] + longest[3:]}'),
+        ('search-suggest-api', f'/api/search/suggest/?q={word[:3]}'),
+    ]
+    if faculty_code.startswith(CODE_PREFIX):
+        paths.append(('note-view-api', f'/api/notes/{note.id}/view/'))
+    preview = Note.objects.filter(has_preview=True).values_list('id', flat=True).first()
+    if preview:
+        paths.append(('note-preview-api', f'/api/notes/{preview}/preview/'))
+    student = Student.objects.values_list('id', flat=True).first()
+    if student:
+        paths.append(('student-dashboard-api', f'/api/students/{student}/dashboard/'))
+    return paths
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a sorted list"""
+    if not samples:
+        return None
+    return samples[max(0, math.ceil(fraction * len(samples)) - 1)]
+
+
+def benchmark_path(client, path, iterations, warmup, cold=False):
+    for _ in range(warmup):
+        client.get(path)
+
+    timings = []
+    queries = []
+    status_codes = set()
+    for _ in range(iterations):
+        if cold:
+            clear_caches()
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = client.get(path)
+            timings.append((time.perf_counter() - start) * 1000)
+        queries.append(len(captured))
+        status_codes.add(response.status_code)
+
+    # Allocations are traced in a separate request so tracing does not skew the timings
+    gc.collect()
+    if cold:
+        clear_caches()
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        response = client.get(path)
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    timings.sort()
+    return {
+        'path': path,
+        'status': sorted(status_codes),
+        'iterations': iterations,
+        'p50_ms': round(percentile(timings, 0.50), 2),
+        'p95_ms': round(percentile(timings, 0.95), 2),
+        'p99_ms': round(percentile(timings, 0.99), 2),
+        'mean_ms': round(sum(timings) / len(timings), 2),
+        'max_ms': round(timings[-1], 2),
+        'queries': max(queries),
+        'bytes': len(response.content),
+        'alloc_peak_kb': round((peak - before) / 1024, 1),
+        'alloc_retained_kb': round((after - before) / 1024, 1),
+    }
+
+
+def run_benchmark(iterations=50, warmup=3, cold=False, only=None):
+    """
+    Benchmark every sampled path. `cold` clears every cache before each
+    request; `only` limits the run to route names containing one of the
+    given strings.
+    """
+    # Requests go through the whole middleware stack, addressed to an allowed host
+    client = Client(HTTP_HOST='localhost', raise_request_exception=False)
+    # 404s for unconfigured site content would otherwise log every request
+    request_logger = logging.getLogger('django.request')
+    level = request_logger.level
+    request_logger.setLevel(logging.ERROR)
+    results = {}
+    try:
+        # Keep the benchmark's requests out of the live workers' shared metrics
+        with override_settings(PAPERFLOW_METRICS_DIR=None):
+            for name, path in sample_paths():
+                if only and not any(part in name for part in only):
+                    continue
+                results[name] = benchmark_path(client, path, iterations, warmup, cold)
+    finally:
+        request_logger.setLevel(level)
+    return results
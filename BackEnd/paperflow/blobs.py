@@ -0,0 +1,125 @@
+# blobs.py - Content-addressed, reference-counted storage for note files
+import hashlib
+import os
+import shutil
+from collections import defaultdict
+
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from .models import FileBlob, blob_file_path
+from .reaper import delete_later
+
+
+HASH_BUFFER = 64 * 1024
+
+
+def file_sha256(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_BUFFER), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def content_sha256(file):
+    """SHA-256 of an uploaded file (the upload handlers usually hash it while it streams in)"""
+    digest = getattr(file, 'sha256', None)
+    if digest:
+        return digest
+    hasher = hashlib.sha256()
+    for chunk in file.chunks():
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _claim(sha256, filename, size, write):
+    """
+    Take a reference on the blob for `sha256`, creating it when the content
+    is new. `write(name)` puts the bytes at the blob's storage name and
+    returns the name actually used; it only runs for unseen content.
+    """
+    name = blob_file_path(FileBlob(sha256=sha256), filename)
+    with transaction.atomic():
+        blob = FileBlob.objects.select_for_update().filter(sha256=sha256).first()
+        if blob is None:
+            # A file left behind by a rolled back upload is already the right content
+            if not (default_storage.exists(name) and default_storage.size(name) == size):
+                name = write(name)
+            try:
+                with transaction.atomic():
+                    blob = FileBlob.objects.create(sha256=sha256, file=name, size=size)
+            except IntegrityError:
+                # Another worker stored the same content first
+                blob = FileBlob.objects.select_for_update().get(sha256=sha256)
+        FileBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+        blob.ref_count += 1
+    return blob
+
+
+def store_upload(file):
+    """Store an uploaded file (or reuse identical content) and return its blob"""
+    def write(name):
+        default_storage.delete(name)
+        return default_storage.save(name, file)
+
+    return _claim(content_sha256(file), file.name, file.size, write)
+
+
+def adopt_file(path, sha256, filename):
+    """
+    Put a fully written local file into the store (hard-linked where the
+    filesystem allows, copied otherwise), unless the content is already
+    there. The file itself is removed once the transaction commits, so a
+    rollback leaves it in place for a retry.
+    """
+    def write(name):
+        target = default_storage.path(name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.link(path, target)
+        except OSError:
+            shutil.copyfile(path, target)
+        return name
+
+    blob = _claim(sha256, filename, os.path.getsize(path), write)
+    transaction.on_commit(lambda: _remove_if_exists(path))
+    return blob
+
+
+def _remove_if_exists(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def release_blob(blob_id):
+    """Drop one reference; the file is deleted once no note points at it"""
+    release_blobs({blob_id: 1})
+
+
+def release_blobs(counts):
+    """
+    Drop `{blob_id: references}` in one UPDATE per distinct count (bulk
+    note deletes), then remove blobs no note points at any more.
+    """
+    by_amount = defaultdict(list)
+    for blob_id, amount in counts.items():
+        by_amount[amount].append(blob_id)
+    with transaction.atomic():
+        for amount, blob_ids in by_amount.items():
+            FileBlob.objects.filter(pk__in=blob_ids).update(ref_count=Greatest(F('ref_count') - amount, 0))
+        orphans = list(
+            FileBlob.objects.filter(pk__in=list(counts), ref_count=0, notes__isnull=True)
+            .values_list('pk', 'sha256', 'file')
+        )
+        if not orphans:
+            return
+        FileBlob.objects.filter(pk__in=[pk for pk, _, _ in orphans]).delete()
+        for _, sha256, name in orphans:
+            # The same content may be uploaded again before the reaper gets to it
+            reclaimed = lambda sha256=sha256: FileBlob.objects.filter(sha256=sha256).exists()
+            transaction.on_commit(lambda name=name, keep=reclaimed: delete_later(name, keep=keep))
@@ -0,0 +1,310 @@
+# cache.py - Shared cache helpers and invalidation stamps
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.base import BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.db import connection, transaction
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, so bumps cannot carry changes
+    fcntl = None
+
+from . import metrics
+from .tasks import task_workers
+
+
+logger = logging.getLogger(__name__)
+
+
+GENERATION_KEY = 'paperflow:generation:{}'
+# Changes published under a stamp, replayed by workers still holding the stamp before it
+CHANGES_KEY = 'paperflow:changes:{}:{}'
+CHANGES_TIMEOUT = 60 * 60
+# A snapshot further behind than this reloads instead of replaying
+MAX_REPLAYED = 1000
+COURSE_TREE_KEY = 'paperflow:course-tree:{}:{}:{}'
+COURSE_TREE_TIMEOUT = 60 * 60 * 24
+
+SITE_SETTINGS_SCOPE = 'site-settings'
+ABOUT_US_SCOPE = 'about-us'
+HOW_IT_WORKS_SCOPE = 'how-it-works'
+
+# Snapshots registered per scope, so a bump in this worker is seen immediately
+_snapshots = defaultdict(list)
+
+
+def _stamp_lock_path():
+    """
+    FileBasedCache.incr is a get then a set, so the workers of a host take
+    turns through a lock file kept among the cache files (clear() and
+    culling only remove *.djcache files). None when no lock is needed or
+    none can be taken.
+    """
+    backend = caches['default']
+    if type(backend).incr is not BaseCache.incr or not isinstance(backend, FileBasedCache) or fcntl is None:
+        return None
+    return os.path.join(os.fspath(settings.CACHES['default']['LOCATION']), 'generations.lock')
+
+
+@contextmanager
+def _stamp_lock():
+    path = _stamp_lock_path()
+    if path is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def atomic_incr():
+    """Whether stamps are bumped atomically, so each bump is told a stamp of its own"""
+    return type(caches['default']).incr is not BaseCache.incr or _stamp_lock_path() is not None
+
+
+def get_generation(scope):
+    """
+    Return the current invalidation stamp for a scope.
+    Stamps live in the shared cache so every worker sees the same value.
+    """
+    key = GENERATION_KEY.format(scope)
+    generation = cache.get(key)
+    if generation is None:
+        # Seed with a timestamp so a stamp that was evicted can never
+        # come back with a value an old cache entry was keyed on
+        with _stamp_lock():
+            cache.add(key, time.time_ns(), timeout=None)
+            generation = cache.get(key, 0)
+    return generation
+
+
+def bump_generation(scope, changes=None):
+    """
+    Invalidate everything cached under a scope. `changes` (picklable) are
+    recorded under the new stamp for snapshots to replay instead of reloading.
+    """
+    key = GENERATION_KEY.format(scope)
+    with _stamp_lock():
+        try:
+            generation = cache.incr(key)
+        except ValueError:
+            generation = time.time_ns()
+            cache.set(key, generation, timeout=None)
+        if changes is not None and atomic_incr():
+            cache.set(CHANGES_KEY.format(scope, generation), changes, CHANGES_TIMEOUT)
+    for snapshot in _snapshots[scope]:
+        snapshot.expire()
+    return generation
+
+
+def clear_caches():
+    """Drop everything cached, in the shared cache and in this worker's snapshots"""
+    cache.clear()
+    for snapshots in _snapshots.values():
+        for snapshot in snapshots:
+            snapshot.expire()
+
+
+class ProcessSnapshot:
+    """
+    A value held in worker memory and reloaded only when the shared
+    generation stamp of its scope moves. The stamp is re-checked at most
+    every `check_interval` seconds so hot paths skip the cache read.
+
+    Values given an `apply(value, changes)` are patched in place instead:
+    publish() records the changes under the next stamp and every worker
+    (the publishing one included) replays them. Only a snapshot that cannot
+    replay (a missed record, stamps without an atomic incr) reloads.
+
+    With `background=True` a stale value keeps being served while a thread
+    loads its replacement (one load at a time), and `max_age` (seconds)
+    reloads it that way even when nothing bumped the scope. The first load,
+    and every load with PAPERFLOW_TASK_WORKERS = 0, happens inline.
+    """
+
+    def __init__(self, scope, loader, apply=None, check_interval=5, background=False, max_age=None):
+        self.scope = scope
+        self.loader = loader
+        self.apply = apply
+        self.check_interval = check_interval
+        self.background = background
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._value = None
+        self._generation = None
+        self._checked_at = None
+        self._loaded_at = None
+        self._loading = None
+        _snapshots[scope].append(self)
+
+    def get(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return self._value
+
+        # Read the stamp before loading so a concurrent change is never missed
+        generation = get_generation(self.scope)
+        with self._lock:
+            replayed = generation != self._generation and self._replay(generation)
+            reload = generation != self._generation or (
+                self.max_age is not None and self._loaded_at is not None and now - self._loaded_at >= self.max_age
+            )
+            deferred = reload and self.background and self._value is not None and task_workers() > 0
+            if deferred:
+                if self._loading is None or not self._loading.is_alive():
+                    self._loading = threading.Thread(
+                        target=self._load_in_background, args=(generation,),
+                        name=f'paperflow-snapshot-{self.scope}', daemon=True
+                    )
+                    self._loading.start()
+            elif reload:
+                self._value, self._generation = self._load(generation)
+                self._loaded_at = now
+            self._checked_at = now
+        metrics.inc('paperflow_cache_requests_total', cache=f'snapshot:{self.scope}',
+                    result='stale' if deferred else 'miss' if reload else 'replayed' if replayed else 'hit')
+        return self._value
+
+    def _replay(self, generation):
+        """Patch the held value with every change recorded after its stamp, if all of them are there"""
+        if self.apply is None or self._value is None or self._generation is None or not atomic_incr():
+            return False
+        if not 0 < generation - self._generation <= MAX_REPLAYED:
+            return False
+        keys = [CHANGES_KEY.format(self.scope, stamp) for stamp in range(self._generation + 1, generation + 1)]
+        recorded = cache.get_many(keys)
+        if len(recorded) != len(keys):
+            return False
+        for key in keys:
+            self.apply(self._value, recorded[key])
+        self._generation = generation
+        return True
+
+    def _load(self, generation):
+        """
+        Load the value and the stamp it is current for: `generation`, read
+        before loading, unless something was published meanwhile. Such a
+        change may or may not be in the value, so replaying it could apply it
+        twice; the value gets no stamp and the next check loads again.
+        """
+        value = self.loader()
+        return value, generation if get_generation(self.scope) == generation else None
+
+    def _load_in_background(self, generation):
+        try:
+            value, generation = self._load(generation)
+        except Exception:
+            logger.exception("Reloading %s failed; still serving the previous value", self.scope)
+            return
+        finally:
+            # The thread opened its own database connection
+            connection.close()
+        with self._lock:
+            self._value = value
+            self._generation = generation
+            self._loaded_at = time.monotonic()
+
+    def expire(self):
+        self._checked_at = None
+
+    def publish(self, changes):
+        """Record `changes` (a list) under a new stamp for every worker to replay"""
+        bump_generation(self.scope, changes)
+
+    def publish_on_commit(self, change):
+        """
+        Publish `change` once the transaction commits. Changes queued in one
+        transaction (and savepoint) go out together under a single stamp, so
+        a cascade over many notes is one replay instead of one per note.
+        """
+        pending = self._pending()
+        if pending is None:
+            self.publish([change])
+        else:
+            pending.changes.append(change)
+
+    def reload_on_commit(self):
+        """Have every worker reload once the transaction commits (supersedes queued changes)"""
+        pending = self._pending()
+        if pending is None:
+            bump_generation(self.scope)
+        else:
+            pending.reload = True
+
+    def _pending(self):
+        """The changes queued for the current transaction, or None in autocommit mode"""
+        connection = transaction.get_connection()
+        if not connection.in_atomic_block:
+            return None
+        savepoints = set(connection.savepoint_ids)
+        # A rolled-back savepoint takes its callbacks (and their changes) out of this list
+        for callback_savepoints, callback, _ in connection.run_on_commit:
+            if (isinstance(callback, PendingChanges) and callback.snapshot is self
+                    and not callback.published and callback_savepoints == savepoints):
+                return callback
+        pending = PendingChanges(self)
+        transaction.on_commit(pending)
+        return pending
+
+
+class PendingChanges:
+    """Changes to a snapshot waiting for their transaction to commit"""
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.changes = []
+        self.reload = False
+        self.published = False
+
+    def __call__(self):
+        self.published = True
+        if self.reload:
+            bump_generation(self.snapshot.scope)
+        elif self.changes:
+            self.snapshot.publish(self.changes)
+
+
+def course_scope(course_id):
+    return f'course:{course_id}'
+
+
+def _base_url_hash(request):
+    # Serialized trees contain absolute URLs, so they are cached per host
+    return hashlib.md5(request.build_absolute_uri('/').encode()).hexdigest()[:12]
+
+
+def get_course_tree(course, request, build):
+    """
+    Return the serialized academic tree of a course, building it with
+    `build()` only when nothing under the course changed since last time.
+    """
+    # Notes embed pricing, so a SiteSettings change also retires the tree
+    generation = '{}.{}'.format(
+        get_generation(course_scope(course.pk)),
+        get_generation(SITE_SETTINGS_SCOPE),
+    )
+    key = COURSE_TREE_KEY.format(course.pk, generation, _base_url_hash(request))
+    data = cache.get(key)
+    metrics.inc('paperflow_cache_requests_total', cache='course_tree', result='miss' if data is None else 'hit')
+    if data is None:
+        data = build()
+        cache.set(key, data, COURSE_TREE_TIMEOUT)
+    return data
+
+
+def invalidate_course_tree(course_id):
+    if course_id:
+        bump_generation(course_scope(course_id))
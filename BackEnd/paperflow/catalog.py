@@ -0,0 +1,151 @@
+# catalog.py - Bulk-generated synthetic catalogs for benchmarks and tests
+import itertools
+import random
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .blobs import store_upload
+from .cache import bump_generation
+from .hierarchy import HIERARCHY_SCOPE
+from .models import Faculty, Course, AcademicYear, YearLevel, Semester, Note, FileBlob
+from .search import get_search_backend
+from . import fuzzy, stats, suggest
+
+
+# Faculty codes of generated catalogs start with this, so they are easy to spot
+CODE_PREFIX = 'SYN'
+
+STUB_CONTENT = b'%PDF-1.4\n% Synthetic PaperFlow note\n'
+
+SUBJECTS = (
+    'Programming', 'Data Structures', 'Algorithms', 'Databases', 'Networks', 'Operating Systems',
+    'Software Engineering', 'Web Development', 'Statistics', 'Calculus', 'Linear Algebra',
+    'Accounting', 'Microeconomics', 'Macroeconomics', 'Marketing', 'Business Law', 'Anatomy',
+    'Physiology', 'Biochemistry', 'Pharmacology', 'Organic Chemistry', 'Thermodynamics',
+    'Fluid Mechanics', 'Circuit Theory', 'Research Methods', 'Communication Skills',
+)
+TITLE_FORMATS = (
+    '{subject} Past Paper {year}', '{subject} Lecture Notes', 'Introduction to {subject}',
+    '{subject} Tutorial {number}', '{subject} Revision Guide', 'Advanced {subject}',
+)
+COURSE_TYPES = [code for code, _ in Course.COURSE_TYPES]
+NOTE_TYPES = [code for code, _ in Note.NOTE_TYPES]
+
+
+def stub_blob():
+    """The one stored file every generated note points at"""
+    return store_upload(ContentFile(STUB_CONTENT, name='synthetic.pdf'))
+
+
+def add_notes(semesters, count, blob, rng=None, batch_size=5000):
+    """
+    Spread `count` notes over `semesters` (a list of Semester rows with
+    their course and faculty selected) with bulk_create, so no per-row save() or
+    signal runs. Call `refresh_derived()` afterwards.
+    """
+    rng = rng or random.Random(0)
+    semester_cycle = itertools.cycle(semesters)
+    created = 0
+    while created < count:
+        batch = []
+        for _ in range(min(batch_size, count - created)):
+            semester = next(semester_cycle)
+            academic_year = semester.year_level.academic_year
+            subject = rng.choice(SUBJECTS)
+            title = rng.choice(TITLE_FORMATS).format(
+                subject=subject, year=academic_year.year, number=rng.randint(1, 12)
+            )
+            batch.append(Note(
+                semester=semester,
+                faculty_id=academic_year.course.faculty_id,
+                course_id=academic_year.course_id,
+                academic_year=academic_year.year,
+                faculty_code=academic_year.course.faculty.code.lower(),
+                course_code=academic_year.course.code.lower(),
+                title=title,
+                description=f'{subject} for {academic_year.course.name}',
+                file=blob.file.name,
+                blob=blob,
+                file_size=blob.size,
+                note_type=rng.choice(NOTE_TYPES),
+                is_premium=rng.random() < 0.2,
+                view_count=min(int(rng.paretovariate(1.2)) - 1, 100000),
+            ))
+        Note.objects.bulk_create(batch)
+        created += len(batch)
+    FileBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + created)
+    return created
+
+
+def refresh_derived():
+    """Rebuild what the skipped signals would have kept in step"""
+    stats.rebuild_counters()
+    get_search_backend().rebuild()
+    fuzzy.rebuild_index()
+    suggest.rebuild_index()
+    transaction.on_commit(lambda: bump_generation(HIERARCHY_SCOPE))
+
+
+def generate_catalog(faculties, courses, academic_years, levels, semesters, notes, seed=0,
+                     batch_size=5000, progress=None):
+    """
+    Create `faculties` faculties sharing `courses` courses, each with the
+    most recent `academic_years` years, `levels` year levels of `semesters`
+    semesters, and `notes` notes spread evenly over every semester.
+    Returns counts of the created rows.
+    """
+    rng = random.Random(seed)
+    report = progress or (lambda message: None)
+    this_year = timezone.now().year
+    years = range(this_year - academic_years + 1, this_year + 1)
+
+    with transaction.atomic():
+        created_faculties = Faculty.objects.bulk_create([
+            Faculty(name=f'Synthetic Faculty {number}', code=f'{CODE_PREFIX}{number:04d}',
+                    description='Generated for benchmarking')
+            for number in range(1, faculties + 1)
+        ])
+        created_courses = Course.objects.bulk_create([
+            Course(faculty=created_faculties[number % faculties], name=f'{rng.choice(SUBJECTS)} {number}',
+                   code=f'C{number:04d}', course_type=rng.choice(COURSE_TYPES), duration_years=levels)
+            for number in range(courses)
+        ], batch_size=batch_size)
+        report(f"{len(created_faculties)} faculties, {len(created_courses)} courses")
+
+        created_years = AcademicYear.objects.bulk_create([
+            AcademicYear(course=course, year=year, is_current=year == this_year)
+            for course in created_courses for year in years
+        ], batch_size=batch_size)
+        created_levels = YearLevel.objects.bulk_create([
+            YearLevel(academic_year=academic_year, level=level, name=f'Year {level}')
+            for academic_year in created_years for level in range(1, levels + 1)
+        ], batch_size=batch_size)
+        created_semesters = Semester.objects.bulk_create([
+            Semester(year_level=year_level, semester_number=number, name=f'Semester {number}')
+            for year_level in created_levels for number in range(1, semesters + 1)
+        ], batch_size=batch_size)
+        report(f"{len(created_years)} academic years, {len(created_levels)} year levels, "
+               f"{len(created_semesters)} semesters")
+
+        blob = stub_blob()
+        # store_upload counted a reference for a note that is never created
+        FileBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') - 1)
+        created_notes = add_notes(
+            Semester.objects.filter(year_level__academic_year__course__faculty__in=created_faculties)
+            .select_related('year_level__academic_year__course__faculty').order_by('pk'),
+            notes, blob, rng, batch_size
+        )
+        report(f"{created_notes} notes; rebuilding statistics and the search index")
+        refresh_derived()
+
+    return {
+        'faculties': len(created_faculties),
+        'courses': len(created_courses),
+        'academic_years': len(created_years),
+        'year_levels': len(created_levels),
+        'semesters': len(created_semesters),
+        'notes': created_notes,
+    }
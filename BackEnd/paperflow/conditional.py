@@ -0,0 +1,61 @@
+# conditional.py - Cached, conditional JSON for content that rarely changes
+import hashlib
+
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from . import metrics
+from .cache import ProcessSnapshot
+
+
+class ConditionalContent:
+    """
+    Keeps the rendered JSON of a singleton-style endpoint in worker memory.
+
+    `build(request)` returns `(status_code, data, last_modified)` and only
+    runs after the scope's generation stamp moves. Requests carrying a
+    matching `If-None-Match` / `If-Modified-Since` get a 304 straight from
+    the cached validators, without querying or serializing anything.
+    """
+
+    def __init__(self, scope, build):
+        self.scope = scope
+        self.build = build
+        # Rendered entries per base URL, dropped whenever the scope changes
+        self._entries = ProcessSnapshot(scope, dict)
+
+    def respond(self, request):
+        # The browsable API still gets a regular DRF response
+        if request.accepted_renderer.format != 'json':
+            status_code, data, _ = self.build(request)
+            return Response(data, status=status_code)
+
+        entries = self._entries.get()
+        base_url = request.build_absolute_uri('/')
+        entry = entries.get(base_url)
+        metrics.inc('paperflow_cache_requests_total', cache=f'conditional:{self.scope}',
+                    result='miss' if entry is None else 'hit')
+        if entry is None:
+            status_code, data, last_modified = self.build(request)
+            content = JSONRenderer().render(data)
+            # Strong validator: the bytes only change when an updated_at does
+            etag = '"%s"' % hashlib.sha256(content).hexdigest()[:32]
+            timestamp = int(last_modified.timestamp()) if last_modified else None
+            entry = entries[base_url] = (status_code, content, etag, timestamp)
+
+        status_code, content, etag, timestamp = entry
+        if status_code != status.HTTP_200_OK:
+            return HttpResponse(content, status=status_code, content_type='application/json')
+
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = HttpResponse(content, content_type='application/json')
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        response['Cache-Control'] = 'no-cache'
+        return response
@@ -0,0 +1,119 @@
+# counters.py - Write-behind buffers for note view/download counters
+import atexit
+import logging
+import os
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+
+from .models import Note
+
+
+logger = logging.getLogger(__name__)
+
+
+class CounterBuffer:
+    """
+    Collects per-note increments in worker memory and writes them in
+    batches of `UPDATE ... SET field = field + n`, so request threads never
+    take a database write lock just to count a view.
+    """
+
+    def __init__(self, field):
+        self.field = field
+        self._pending = Counter()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        # Flush statistics (read by monitoring)
+        self.flushes = 0
+        self.flushed_increments = 0
+        self.failed_flushes = 0
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, 'PAPERFLOW_COUNTER_FLUSH_INTERVAL', 5)
+
+    @property
+    def max_pending(self):
+        return getattr(settings, 'PAPERFLOW_COUNTER_MAX_PENDING', 500)
+
+    def add(self, note_id, amount=1):
+        with self._lock:
+            self._pending[note_id] += amount
+            pending = len(self._pending)
+        self._ensure_flusher()
+        if pending >= self.max_pending:
+            self._wake.set()
+
+    def pending(self):
+        with self._lock:
+            return sum(self._pending.values())
+
+    def flush(self):
+        """Write all buffered increments; returns how many were written"""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+        if not pending:
+            return 0
+
+        # One UPDATE per distinct increment instead of one per note
+        by_amount = defaultdict(list)
+        for note_id, amount in pending.items():
+            by_amount[amount].append(note_id)
+        try:
+            with transaction.atomic():
+                for amount, note_ids in by_amount.items():
+                    Note.objects.filter(id__in=note_ids).update(
+                        **{self.field: F(self.field) + amount}
+                    )
+        except Exception:
+            logger.exception("Failed to flush %s increments; keeping them for the next flush", self.field)
+            self.failed_flushes += 1
+            with self._lock:
+                self._pending.update(pending)
+            return 0
+
+        written = sum(pending.values())
+        self.flushes += 1
+        self.flushed_increments += written
+        return written
+
+    def _ensure_flusher(self):
+        # Threads do not survive a fork, so each worker starts its own
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name=f'paperflow-{self.field}-flusher', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            finally:
+                # The flusher thread owns its own connection; do not hold it open
+                connection.close()
+
+
+view_counts = CounterBuffer('view_count')
+download_counts = CounterBuffer('download_count')
+
+
+def flush_counters():
+    """Flush every buffer (called on worker shutdown)"""
+    return view_counts.flush() + download_counts.flush()
+
+
+atexit.register(flush_counters)
@@ -0,0 +1,65 @@
+# facets.py - Filter sidebar counts for search results
+from collections import Counter
+
+from django.db.models import Count
+
+from .cache import ProcessSnapshot
+from .hierarchy import HIERARCHY_SCOPE
+from .models import Course, Note
+
+
+# Facet name (the search query parameter it feeds) -> Note column
+FACET_FIELDS = {
+    'faculty': 'faculty_code',
+    'course': 'course_code',
+    'year': 'academic_year',
+    'note_type': 'note_type',
+}
+
+NOTE_TYPE_LABELS = dict(Note.NOTE_TYPES)
+
+
+def _load_labels():
+    """Lowercase code -> (code, name) for courses and their faculties, in one query"""
+    known = {'faculty': {}, 'course': {}}
+    for code, name, faculty_code, faculty_name in Course.objects.values_list(
+        'code', 'name', 'faculty__code', 'faculty__name'
+    ):
+        known['course'][code.lower()] = (code, name)
+        known['faculty'][faculty_code.lower()] = (faculty_code, faculty_name)
+    return known
+
+
+labels = ProcessSnapshot(HIERARCHY_SCOPE, _load_labels)
+
+
+def _option(facet, value, count, known):
+    if facet in ('faculty', 'course'):
+        code, name = known[facet].get(value, (value.upper(), value.upper()))
+        return {'value': code, 'label': name, 'count': count}
+    if facet == 'year':
+        return {'value': value, 'label': str(value), 'count': count}
+    return {'value': value, 'label': NOTE_TYPE_LABELS.get(value, value), 'count': count}
+
+
+def search_facets(queryset):
+    """
+    Count `queryset` (every match, not just the returned page) by faculty,
+    course, academic year and note type with one GROUP BY over the
+    denormalized note columns; each facet is a rollup of those groups.
+    """
+    groups = queryset.order_by().values(*FACET_FIELDS.values()).annotate(count=Count('id'))
+    totals = {facet: Counter() for facet in FACET_FIELDS}
+    for row in groups:
+        for facet, field in FACET_FIELDS.items():
+            if row[field] not in ('', None):
+                totals[facet][row[field]] += row['count']
+
+    known = labels.get()
+    return {
+        facet: [
+            _option(facet, value, count, known)
+            for value, count in sorted(counts.items(), key=lambda item: (-item[1], str(item[0])))
+        ]
+        for facet, counts in totals.items()
+    }
@@ -0,0 +1,182 @@
+# fuzzy.py - Typo-tolerant matching of search words against the catalog vocabulary
+import bisect
+from array import array
+from collections import Counter
+
+from .cache import ProcessSnapshot
+from .models import Faculty, Course, Note
+from .search import tokenize
+
+
+FUZZY_SCOPE = 'fuzzy-index'
+
+# Text each model contributes to the vocabulary
+INDEXED_FIELDS = {
+    Note: ('title',),
+    Course: ('code', 'name'),
+    Faculty: ('code', 'name'),
+}
+
+# Candidates must share this fraction of trigrams (Dice coefficient) with the word
+MIN_SIMILARITY = 0.3
+# Best trigram matches checked with a real edit distance
+MAX_CANDIDATES = 50
+
+
+def trigrams(word):
+    padded = f'  {word} '
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+
+def edit_distance(a, b, limit):
+    """Levenshtein distance, or limit + 1 once it is certain to exceed `limit`"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def allowed_typos(word):
+    return 1 if len(word) <= 5 else 2
+
+
+class TrigramIndex:
+    """
+    Every distinct word of note titles and course/faculty codes and names,
+    with the number of texts using it. Each trigram maps to an ascending
+    array('I') of word ids, so postings cost four bytes per entry.
+    """
+
+    def __init__(self):
+        self.words = []               # word id -> word
+        self.word_ids = {}            # word -> word id
+        self.uses = array('I')        # word id -> texts containing it (0: no longer in use)
+        self.sizes = array('B')       # word id -> number of trigrams
+        self.postings = {}            # trigram -> array('I') of word ids
+        self.live = []                # sorted words in use, for prefix checks
+
+    def add(self, text, count=1, keep_sorted=True):
+        # Bulk loads pass keep_sorted=False and call sort_live() once at the end
+        for word in set(tokenize(text)):
+            word_id = self.word_ids.get(word)
+            if word_id is None:
+                word_id = self.word_ids[word] = len(self.words)
+                self.words.append(word)
+                self.uses.append(0)
+                grams = trigrams(word)
+                self.sizes.append(min(len(grams), 255))
+                for gram in grams:
+                    self.postings.setdefault(gram, array('I')).append(word_id)
+            if not self.uses[word_id] and keep_sorted:
+                bisect.insort(self.live, word)
+            self.uses[word_id] += count
+
+    def sort_live(self):
+        self.live = sorted(word for word, word_id in self.word_ids.items() if self.uses[word_id])
+
+    def remove(self, text):
+        # Retired words keep their id and postings, and come back if reused
+        for word in set(tokenize(text)):
+            word_id = self.word_ids.get(word)
+            if word_id is None or not self.uses[word_id]:
+                continue
+            self.uses[word_id] -= 1
+            if not self.uses[word_id]:
+                del self.live[bisect.bisect_left(self.live, word)]
+
+    def known(self, word):
+        """True if `word` is, or starts, a word in use (search matches prefixes)"""
+        position = bisect.bisect_left(self.live, word)
+        return position < len(self.live) and self.live[position].startswith(word)
+
+    def closest(self, word):
+        """The word in use nearest to `word`, or None if nothing is close enough"""
+        grams = trigrams(word)
+        shared = Counter()
+        for gram in grams:
+            postings = self.postings.get(gram)
+            if postings is not None:
+                shared.update(postings)
+
+        limit = allowed_typos(word)
+        best = None
+        for word_id, count in shared.most_common(MAX_CANDIDATES):
+            if not self.uses[word_id] or 2 * count / (len(grams) + self.sizes[word_id]) < MIN_SIMILARITY:
+                continue
+            candidate = self.words[word_id]
+            distance, abbreviated = edit_distance(word, candidate, limit), False
+            if distance > limit and len(word) >= 4:
+                # Abbreviations ("devt") are judged against the same-length start of the word
+                distance, abbreviated = edit_distance(word, candidate[:len(word)], 1), True
+            if distance > limit:
+                continue
+            rank = (distance, abbreviated, -self.uses[word_id], candidate)
+            if best is None or rank < best:
+                best = rank
+        return best[-1] if best else None
+
+    def correct(self, query):
+        """`query` with unknown words replaced by their closest match, or None if nothing changed"""
+        words = tokenize(query)
+        corrected = []
+        for word in words:
+            if len(word) >= 3 and not word.isdigit() and not self.known(word):
+                word = self.closest(word) or word
+            corrected.append(word)
+        return ' '.join(corrected) if corrected != words else None
+
+
+def indexed_text(instance):
+    return ' '.join(getattr(instance, field) or '' for field in INDEXED_FIELDS[type(instance)])
+
+
+def stored_text(model, pk):
+    """The indexed text of a row as it is in the database (before a save)"""
+    row = model.objects.filter(pk=pk).values_list(*INDEXED_FIELDS[model]).first()
+    return None if row is None else ' '.join(value or '' for value in row)
+
+
+def _build_trigram_index():
+    # Titles repeat a lot ("... Past Paper 2024"), so each distinct text is tokenized once
+    texts = Counter()
+    for model, fields in INDEXED_FIELDS.items():
+        texts.update(' '.join(value or '' for value in row)
+                     for row in model.objects.values_list(*fields).order_by().iterator())
+    index = TrigramIndex()
+    for text, count in texts.items():
+        index.add(text, count, keep_sorted=False)
+    index.sort_live()
+    return index
+
+
+def apply_changes(index, changes):
+    """Replay published (removed texts, added texts) pairs"""
+    for removed, added in changes:
+        for text in removed:
+            index.remove(text)
+        for text in added:
+            index.add(text)
+
+
+# Built once per worker (see gunicorn.conf.py); every worker replays row changes
+# onto its copy, and reloads in the background only when it missed some
+fuzzy_index = ProcessSnapshot(FUZZY_SCOPE, _build_trigram_index, apply_changes, background=True)
+
+
+def update_index(removed=(), added=()):
+    fuzzy_index.publish_on_commit((list(removed), list(added)))
+
+
+def rebuild_index():
+    fuzzy_index.reload_on_commit()
+
+
+def suggest_query(query):
+    return fuzzy_index.get().correct(query)
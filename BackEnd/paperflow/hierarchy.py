@@ -0,0 +1,90 @@
+# hierarchy.py - Resolving catalog URL codes to objects, and the hierarchy keys copied onto notes
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Lower
+from django.shortcuts import get_object_or_404
+
+from .cache import ProcessSnapshot
+from .models import Course, YearLevel, Semester, Note
+
+
+HIERARCHY_SCOPE = 'hierarchy'
+
+
+def _load_course_codes():
+    return {
+        (faculty_code.lower(), course_code.lower()): course_id
+        for course_id, course_code, faculty_code in Course.objects.values_list(
+            'id', 'code', 'faculty__code'
+        )
+    }
+
+
+# (faculty_code, course_code) -> course id, shared by every request in this worker
+course_codes = ProcessSnapshot(HIERARCHY_SCOPE, _load_course_codes)
+
+
+def resolve_course_id(faculty_code, course_code):
+    """Map URL codes to a course id, normally without touching the database"""
+    course_id = course_codes.get().get((faculty_code.lower(), course_code.lower()))
+    if course_id is None:
+        # The map may lag a few seconds behind another worker's changes
+        course_id = get_object_or_404(
+            Course.objects.values_list('id', flat=True),
+            faculty__code__iexact=faculty_code,
+            code__iexact=course_code
+        )
+    return course_id
+
+
+def resolve_course(faculty_code, course_code):
+    return get_object_or_404(
+        Course.objects.select_related('faculty'),
+        pk=resolve_course_id(faculty_code, course_code)
+    )
+
+
+def resolve_year_level(faculty_code, course_code, year, level):
+    """
+    Resolve a (faculty_code, course_code, year, level) URL tuple to a
+    YearLevel with its academic year, course and faculty in one query.
+    """
+    return get_object_or_404(
+        YearLevel.objects.select_related('academic_year__course__faculty'),
+        academic_year__course_id=resolve_course_id(faculty_code, course_code),
+        academic_year__year=year,
+        level=level
+    )
+
+
+# Note columns copied from above its semester -> path from Semester
+NOTE_HIERARCHY_FIELDS = {
+    'faculty_id': 'year_level__academic_year__course__faculty_id',
+    'course_id': 'year_level__academic_year__course_id',
+    'academic_year': 'year_level__academic_year__year',
+    'faculty_code': 'year_level__academic_year__course__faculty__code',
+    'course_code': 'year_level__academic_year__course__code',
+}
+LOWERCASE_FIELDS = ('faculty_code', 'course_code')
+
+
+def note_hierarchy_keys(semester_id):
+    """The denormalized hierarchy columns for a note in `semester_id`"""
+    row = Semester.objects.filter(pk=semester_id).values_list(*NOTE_HIERARCHY_FIELDS.values()).first()
+    if row is None:
+        return {}
+    keys = dict(zip(NOTE_HIERARCHY_FIELDS, row))
+    for field in LOWERCASE_FIELDS:
+        keys[field] = keys[field].lower()
+    return keys
+
+
+def sync_note_hierarchy(notes=None):
+    """
+    Recopy the hierarchy columns of `notes` (every note by default) from
+    their semesters in one UPDATE; returns the number of rows updated.
+    """
+    semester = Semester.objects.filter(pk=OuterRef('semester_id'))
+    updates = {field: Subquery(semester.values(path)[:1]) for field, path in NOTE_HIERARCHY_FIELDS.items()}
+    for field in LOWERCASE_FIELDS:
+        updates[field] = Lower(updates[field])
+    return (Note.objects.all() if notes is None else notes).update(**updates)
@@ -0,0 +1,86 @@
+# imaging.py - Responsive image variants (runs in pool processes, keep it free of Django)
+import hashlib
+import json
+import os
+
+from PIL import Image, ImageOps, features
+
+
+# format key -> (Pillow format, file extension, save options)
+FORMATS = {
+    'avif': ('AVIF', '.avif', {'quality': 50}),
+    'webp': ('WEBP', '.webp', {'quality': 75, 'method': 4}),
+    'jpeg': ('JPEG', '.jpg', {'quality': 80, 'optimize': True, 'progressive': True}),
+    'png': ('PNG', '.png', {'optimize': True}),
+}
+
+
+def compact_formats():
+    """The modern encodings this Pillow build can write, smallest first"""
+    return [fmt for fmt in ('avif', 'webp') if features.check(fmt)]
+
+
+def _sha256(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _save(image, path, fmt):
+    pil_format, _, options = FORMATS[fmt]
+    # Per process: two pool workers may render the same content at once
+    temp_path = f'{path}.{os.getpid()}.part'
+    image.save(temp_path, pil_format, **options)
+    os.replace(temp_path, path)
+
+
+def render_variants(source_path, media_root, widths, formats):
+    """
+    Write resized copies of an image at each width (never upscaling) in
+    every requested format plus a JPEG/PNG fallback, under
+    `variants/<sha256>/` in `media_root`. Returns the manifest:
+    {sha256, width, height, variants: [{format, width, height, name, size}]}.
+    Content that was rendered before is not touched again.
+    """
+    sha256 = _sha256(source_path)
+    directory = f'variants/{sha256[:2]}/{sha256}'
+    output_dir = os.path.join(media_root, directory)
+    manifest_path = os.path.join(output_dir, 'manifest.json')
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            return json.load(f)
+
+    os.makedirs(output_dir, exist_ok=True)
+    variants = []
+    with Image.open(source_path) as source:
+        image = ImageOps.exif_transpose(source)
+        has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+        fallback = 'png' if has_alpha else 'jpeg'
+
+        targets = [width for width in sorted(widths) if width < image.width]
+        if image.width <= max(widths):
+            targets.append(image.width)
+
+        for width in targets:
+            height = max(1, round(image.height * width / image.width))
+            resized = image if width == image.width else image.resize((width, height), Image.Resampling.LANCZOS)
+            for fmt in [*formats, fallback]:
+                name = f'{directory}/{width}w{FORMATS[fmt][1]}'
+                path = os.path.join(media_root, name)
+                _save(resized, path, fmt)
+                variants.append({
+                    'format': fmt, 'width': width, 'height': height,
+                    'name': name, 'size': os.path.getsize(path),
+                })
+
+        manifest = {'sha256': sha256, 'width': image.width, 'height': image.height, 'variants': variants}
+
+    # Written last: its presence means every variant above is complete
+    temp_path = f'{manifest_path}.{os.getpid()}.part'
+    with open(temp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(temp_path, manifest_path)
+    return manifest
@@ -0,0 +1,206 @@
+# instrumentation.py - Per-endpoint latency and database query accounting
+import bisect
+import hmac
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+
+logger = logging.getLogger('paperflow.slow_requests')
+
+# Histogram bucket upper bounds; the last bucket is everything above
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# SQL kept per request for the slow-request log
+MAX_LOGGED_STATEMENTS = 50
+
+
+class QueryRecorder:
+    """`connection.execute_wrapper` hook that counts and times queries"""
+
+    def __init__(self, keep_sql=False):
+        self.count = 0
+        self.duration = 0.0
+        self.keep_sql = keep_sql
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.duration += elapsed
+            if self.keep_sql and len(self.statements) < MAX_LOGGED_STATEMENTS:
+                self.statements.append((elapsed, sql))
+
+
+class EndpointStats:
+    """Running totals and histograms for one URL name"""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.duration = 0.0
+        self.db_time = 0.0
+        self.queries = 0
+        self.max_queries = 0
+        self.bytes = 0
+        self.latency = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.query_counts = [0] * (len(QUERY_BUCKETS) + 1)
+
+    def observe(self, status_code, duration, queries, db_time, size):
+        self.requests += 1
+        if status_code >= 500:
+            self.errors += 1
+        self.duration += duration
+        self.db_time += db_time
+        self.queries += queries
+        self.max_queries = max(self.max_queries, queries)
+        self.bytes += size
+        self.latency[bisect.bisect_left(LATENCY_BUCKETS_MS, duration * 1000)] += 1
+        self.query_counts[bisect.bisect_left(QUERY_BUCKETS, queries)] += 1
+
+    def as_dict(self):
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'duration': self.duration,
+            'db_time': self.db_time,
+            'queries': self.queries,
+            'max_queries': self.max_queries,
+            'bytes': self.bytes,
+            'latency': list(self.latency),
+            'query_counts': list(self.query_counts),
+        }
+
+
+class RequestStats:
+    """In-process aggregate of every request this worker served, keyed by URL name"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self.started_at = time.time()
+
+    def observe(self, endpoint, status_code, duration, queries, db_time, size):
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = EndpointStats()
+            stats.observe(status_code, duration, queries, db_time, size)
+
+    def snapshot(self):
+        with self._lock:
+            return {endpoint: stats.as_dict() for endpoint, stats in self._endpoints.items()}
+
+
+request_stats = RequestStats()
+
+
+def percentile(histogram, fraction):
+    """Upper bound (ms) of the latency bucket holding the given fraction of requests"""
+    total = sum(histogram)
+    if not total:
+        return None
+    threshold = total * fraction
+    seen = 0
+    for bound, count in zip(LATENCY_BUCKETS_MS + (None,), histogram):
+        seen += count
+        if seen >= threshold:
+            return bound
+    return None
+
+
+def summarize(snapshot):
+    """Human-oriented view of a snapshot, slowest endpoints (by total time) first"""
+    rows = []
+    for endpoint, stats in snapshot.items():
+        requests = stats['requests'] or 1
+        rows.append({
+            'endpoint': endpoint,
+            'requests': stats['requests'],
+            'errors': stats['errors'],
+            'avg_ms': round(stats['duration'] * 1000 / requests, 2),
+            'p50_ms': percentile(stats['latency'], 0.5),
+            'p95_ms': percentile(stats['latency'], 0.95),
+            'avg_queries': round(stats['queries'] / requests, 2),
+            'max_queries': stats['max_queries'],
+            'avg_db_ms': round(stats['db_time'] * 1000 / requests, 2),
+            'avg_bytes': int(stats['bytes'] / requests),
+            'total_seconds': round(stats['duration'], 3),
+        })
+    rows.sort(key=lambda row: row['total_seconds'], reverse=True)
+    return rows
+
+
+def endpoint_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or 'unnamed'
+
+
+def response_size(response):
+    if response.streaming:
+        return int(response.get('Content-Length') or 0)
+    return len(response.content)
+
+
+def metrics_access_allowed(request):
+    """Staff users, or callers presenting PAPERFLOW_METRICS_TOKEN as a bearer token"""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated and user.is_staff:
+        return True
+    token = getattr(settings, 'PAPERFLOW_METRICS_TOKEN', None)
+    if not token:
+        return False
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    supplied = header[7:] if header.startswith('Bearer ') else request.META.get('HTTP_X_METRICS_TOKEN', '')
+    return hmac.compare_digest(supplied.encode(), token.encode())
+
+
+class RequestMetricsMiddleware:
+    """
+    Times every request and counts the queries it runs (DRF and plain views
+    alike), feeding `request_stats`. Requests slower than
+    PAPERFLOW_SLOW_REQUEST_MS are logged with their SQL.
+    """
+
+    def __init__(self, get_response):
+        from .metrics import ensure_writer
+        self.get_response = get_response
+        self.ensure_writer = ensure_writer
+
+    def __call__(self, request):
+        self.ensure_writer()
+        slow_ms = getattr(settings, 'PAPERFLOW_SLOW_REQUEST_MS', None)
+        recorder = QueryRecorder(keep_sql=slow_ms is not None)
+        start = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        endpoint = endpoint_name(request)
+        request_stats.observe(
+            endpoint, response.status_code, duration, recorder.count, recorder.duration, response_size(response)
+        )
+        if slow_ms is not None and duration * 1000 >= slow_ms:
+            self.log_slow_request(request, endpoint, response, duration, recorder)
+        return response
+
+    def log_slow_request(self, request, endpoint, response, duration, recorder):
+        statements = '\n'.join(
+            f'  [{elapsed * 1000:.1f} ms] {sql}' for elapsed, sql in recorder.statements
+        )
+        logger.warning(
+            "Slow request %s %s (%s) -> %s in %.0f ms, %d queries (%.0f ms in DB), pid %d\n%s",
+            request.method, request.get_full_path(), endpoint, response.status_code,
+            duration * 1000, recorder.count, recorder.duration * 1000, os.getpid(), statements
+        )
@@ -0,0 +1,242 @@
+# loadtest.py - Concurrent traffic against a running PaperFlow server
+import http.client
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from urllib.parse import quote, urlsplit
+
+from .benchmark import percentile
+from .models import Note, YearLevel
+
+
+# Relative frequency of each kind of visit
+DEFAULT_MIX = {
+    'landing': 10,     # first page load: site content, dashboard, statistics
+    'hover': 20,       # faculty menu hover: courses and year levels of a year
+    'year-level': 25,  # opening a year level's notes
+    'view': 30,        # previewing / opening a note (a buffered view-count write)
+    'search': 15,
+}
+
+LANDING_PATHS = (
+    ('site-settings', '/api/site-settings/'),
+    ('about-us', '/api/about-us/'),
+    ('how-it-works', '/api/how-it-works/'),
+    ('dashboard', '/api/dashboard/'),
+    ('statistics', '/api/statistics/'),
+)
+
+
+def parse_mix(text):
+    """'view=50,search=10' -> DEFAULT_MIX with those weights replaced"""
+    mix = dict(DEFAULT_MIX)
+    for part in filter(None, (text or '').split(',')):
+        name, _, weight = part.partition('=')
+        if name not in mix:
+            raise ValueError(f"Unknown scenario {name!r} (choose from {', '.join(mix)})")
+        mix[name] = int(weight)
+    if not any(mix.values()):
+        raise ValueError("At least one scenario needs a weight above zero")
+    return mix
+
+
+class Targets:
+    """Real catalog rows to spread the traffic over, sampled once up front"""
+
+    def __init__(self, limit=500, seed=0):
+        rng = random.Random(seed)
+        year_levels = list(YearLevel.objects.values_list(
+            'academic_year__course__faculty__code', 'academic_year__course__code',
+            'academic_year__year', 'level'
+        ).order_by('?')[:limit])
+        notes = list(Note.objects.values_list('id', 'has_preview', 'title').order_by('?')[:limit])
+        if not year_levels or not notes:
+            raise ValueError("The database has no year levels or notes to request; run generate_catalog first")
+
+        self.year_levels = year_levels
+        self.faculty_years = sorted({(faculty, year) for faculty, _, year, _ in year_levels})
+        self.notes = [(note_id, has_preview) for note_id, has_preview, _ in notes]
+        words = {word for _, _, title in notes for word in title.split() if len(word) > 3 and word.isalpha()}
+        self.words = sorted(words) or ['paper']
+        rng.shuffle(self.words)
+
+    def visit(self, scenario, rng):
+        """The (label, path) requests one visit of `scenario` makes, in order"""
+        if scenario == 'landing':
+            return list(LANDING_PATHS)
+        if scenario == 'hover':
+            faculty, year = rng.choice(self.faculty_years)
+            return [('faculty-year', f'/api/faculties/{faculty}/year/{year}/')]
+        if scenario == 'year-level':
+            faculty, course, year, level = rng.choice(self.year_levels)
+            return [('year-level-notes', f'/api/faculties/{faculty}/courses/{course}/{year}/year/{level}/')]
+        if scenario == 'view':
+            note_id, has_preview = rng.choice(self.notes)
+            requests = [('note-preview', f'/api/notes/{note_id}/preview/')] if has_preview else []
+            return requests + [('note-view', f'/api/notes/{note_id}/view/')]
+        if scenario == 'search':
+            query = ' '.join(rng.sample(self.words, k=min(len(self.words), rng.choice((1, 1, 2)))))
+            return [('search', f'/api/search/?q={quote(query)}')]
+        raise ValueError(scenario)
+
+
+class Sample:
+    __slots__ = ('finished', 'label', 'status', 'latency_ms', 'error')
+
+    def __init__(self, finished, label, status, latency_ms, error=None):
+        self.finished = finished
+        self.label = label
+        self.status = status
+        self.latency_ms = latency_ms
+        self.error = error
+
+    @property
+    def failed(self):
+        return self.error is not None or self.status >= 500
+
+
+def summarize_samples(samples, seconds):
+    latencies = sorted(sample.latency_ms for sample in samples)
+    failed = sum(1 for sample in samples if sample.failed)
+    return {
+        'requests': len(samples),
+        'throughput_rps': round(len(samples) / seconds, 1) if seconds else None,
+        'errors': failed,
+        'error_rate': round(failed / len(samples), 4) if samples else 0,
+        'p50_ms': round(percentile(latencies, 0.50), 1) if latencies else None,
+        'p95_ms': round(percentile(latencies, 0.95), 1) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99), 1) if latencies else None,
+        'max_ms': round(latencies[-1], 1) if latencies else None,
+    }
+
+
+class LoadTest:
+    """
+    `concurrency` threads each make visits (picked by `mix` weight) back to
+    back for `duration` seconds, over persistent connections. Samples are
+    summarised every `interval` seconds and once more at the end.
+    """
+
+    def __init__(self, base_url, targets, mix=None, concurrency=16, duration=30, interval=5,
+                 timeout=30, seed=0, report=None):
+        url = urlsplit(base_url)
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.targets = targets
+        self.mix = mix or DEFAULT_MIX
+        self.concurrency = concurrency
+        self.duration = duration
+        self.interval = interval
+        self.timeout = timeout
+        self.seed = seed
+        self.report = report or (lambda window: None)
+        self._samples = []
+        self._lock = threading.Lock()
+
+    def run(self):
+        self.started = time.monotonic()
+        self.deadline = self.started + self.duration
+        threads = [
+            threading.Thread(target=self._worker, args=(index,), name=f'paperflow-load-{index}', daemon=True)
+            for index in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+
+        timeline = []
+        window_start = 0
+        while any(thread.is_alive() for thread in threads):
+            time.sleep(0.2)
+            elapsed = time.monotonic() - self.started
+            if elapsed - window_start >= self.interval:
+                timeline.append(self._window(window_start, elapsed))
+                window_start = elapsed
+        for thread in threads:
+            thread.join()
+        # Requests still in flight at the deadline land in a last, shorter window
+        elapsed = time.monotonic() - self.started
+        if elapsed - window_start > 0.2:
+            timeline.append(self._window(window_start, elapsed))
+
+        by_label = defaultdict(list)
+        for sample in self._samples:
+            by_label[sample.label].append(sample)
+        return {
+            'overall': {
+                **summarize_samples(self._samples, elapsed),
+                'seconds': round(elapsed, 1),
+                'status_codes': dict(Counter(
+                    str(sample.status) if sample.error is None else sample.error for sample in self._samples
+                )),
+            },
+            'endpoints': {label: summarize_samples(samples, elapsed) for label, samples in sorted(by_label.items())},
+            'timeline': timeline,
+        }
+
+    def _window(self, start, end):
+        with self._lock:
+            samples = [
+                sample for sample in self._samples
+                if start <= sample.finished - self.started < end
+            ]
+        window = {'second': round(end, 1), **summarize_samples(samples, end - start)}
+        self.report(window)
+        return window
+
+    def _worker(self, index):
+        rng = random.Random(self.seed * 1000 + index)
+        scenarios, weights = zip(*self.mix.items())
+        connection = None
+        while time.monotonic() < self.deadline:
+            for label, path in self.targets.visit(rng.choices(scenarios, weights)[0], rng):
+                connection, sample = self._get(connection, label, path)
+                with self._lock:
+                    self._samples.append(sample)
+                if time.monotonic() >= self.deadline:
+                    break
+        if connection is not None:
+            connection.close()
+
+    def _get(self, connection, label, path):
+        start = time.perf_counter()
+        try:
+            if connection is None:
+                connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            connection.request('GET', path, headers={'Accept': 'application/json'})
+            response = connection.getresponse()
+            response.read()
+            if response.will_close:
+                # Sync gunicorn workers close every connection
+                connection.close()
+                connection = None
+            status, error = response.status, None
+        except (OSError, http.client.HTTPException) as e:
+            if connection is not None:
+                connection.close()
+            connection, status, error = None, 0, type(e).__name__
+        finished = time.monotonic()
+        return connection, Sample(finished, label, status, (time.perf_counter() - start) * 1000, error)
+
+
+def fetch_metrics(base_url, token, prefixes=('paperflow_counter_', 'paperflow_workers', 'paperflow_task_',
+                                             'paperflow_reaper_')):
+    """Selected series from the server's /api/metrics, or None if it cannot be read"""
+    url = urlsplit(base_url)
+    connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=10)
+    try:
+        connection.request('GET', '/api/metrics', headers={'Authorization': f'Bearer {token}'})
+        response = connection.getresponse()
+        body = response.read().decode()
+    except (OSError, http.client.HTTPException):
+        return None
+    finally:
+        connection.close()
+    if response.status != 200:
+        return None
+    series = {}
+    for line in body.splitlines():
+        if line.startswith(prefixes):
+            name, _, value = line.rpartition(' ')
+            series[name] = float(value)
+    return series
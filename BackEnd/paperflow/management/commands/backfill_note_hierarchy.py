@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from paperflow.hierarchy import sync_note_hierarchy
+
+
+class Command(BaseCommand):
+    help = "Recopy each note's faculty, course and academic year keys from its semester"
+
+    def handle(self, *args, **options):
+        updated = sync_note_hierarchy()
+        self.stdout.write(self.style.SUCCESS(f"Backfilled hierarchy keys on {updated} notes"))
@@ -0,0 +1,94 @@
+import json
+import platform
+import subprocess
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from paperflow.benchmark import run_benchmark
+from paperflow.models import Note
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Request every read endpoint in-process and report p50/p95/p99 latency, "
+        "queries and allocations as JSON (compare runs with --compare)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50, help="Timed requests per endpoint")
+        parser.add_argument('--warmup', type=int, default=3, help="Untimed requests per endpoint first")
+        parser.add_argument('--cold', action='store_true', help="Clear every cache before each request")
+        parser.add_argument('--only', nargs='+', help="Only route names containing one of these strings")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout")
+        parser.add_argument('--compare', help="A previous JSON report to print latency and query changes against")
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError("--iterations must be at least 1")
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+
+        results = run_benchmark(options['iterations'], options['warmup'], options['cold'], options['only'])
+        report = {
+            'meta': {
+                'commit': current_commit(),
+                'created_at': timezone.now().isoformat(),
+                'database': f"{connection.vendor}:{connection.settings_dict['NAME']}",
+                'notes': Note.objects.count(),
+                'iterations': options['iterations'],
+                'cold': options['cold'],
+                'python': platform.python_version(),
+                'django': django.get_version(),
+            },
+            'endpoints': results,
+        }
+
+        output = json.dumps(report, indent=2, default=str)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Benchmarked {len(results)} endpoints -> {options['output']}"))
+        elif not baseline:
+            self.stdout.write(output)
+
+        if baseline:
+            self.write_comparison(baseline, report)
+
+    def write_comparison(self, baseline, report):
+        self.stdout.write(
+            f"Against {baseline['meta'].get('commit')} ({baseline['meta'].get('notes')} notes) -> "
+            f"{report['meta']['commit']} ({report['meta']['notes']} notes)"
+        )
+        self.stdout.write(f"{'endpoint':<28} {'p50 ms':>18} {'p95 ms':>18} {'queries':>10}")
+        for name, now in report['endpoints'].items():
+            before = baseline['endpoints'].get(name)
+            if before is None:
+                self.stdout.write(f"{name:<28} {'(new)':>18}")
+                continue
+            line = (
+                f"{name:<28} {self._change(before['p50_ms'], now['p50_ms']):>18} "
+                f"{self._change(before['p95_ms'], now['p95_ms']):>18} "
+                f"{before['queries']:>4} -> {now['queries']:<4}"
+            )
+            regressed = now['queries'] > before['queries'] or now['p95_ms'] > before['p95_ms'] * 1.2
+            self.stdout.write(self.style.WARNING(line) if regressed else line)
+
+    def _change(self, before, now):
+        percent = (now - before) / before * 100 if before else 0
+        return f"{now:.1f} ({percent:+.0f}%)"
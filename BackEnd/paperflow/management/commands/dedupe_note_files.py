@@ -0,0 +1,46 @@
+import os
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from paperflow.blobs import adopt_file, file_sha256
+from paperflow.models import FileBlob, Note
+
+
+class Command(BaseCommand):
+    help = "Move note files uploaded before the blob store into it, sharing identical content"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None, help="Maximum number of notes to process")
+
+    def handle(self, *args, **options):
+        notes = Note.objects.filter(blob__isnull=True).exclude(file='').only('id', 'file')
+        if options['limit']:
+            notes = notes[:options['limit']]
+
+        moved = missing = saved_bytes = 0
+        adopted = {}    # path -> blob, for legacy notes sharing one file
+        for note in notes.iterator():
+            path = note.file.path
+            blob = adopted.get(path)
+            if blob is None and not os.path.exists(path):
+                missing += 1
+                self.stderr.write(f"Note {note.id}: {note.file.name} is missing")
+                continue
+            with transaction.atomic():
+                if blob is None:
+                    size = os.path.getsize(path)
+                    blob = adopted[path] = adopt_file(path, file_sha256(path), path)
+                    if blob.ref_count > 1:
+                        saved_bytes += size
+                else:
+                    # The file is in the store already: this note only takes a reference
+                    FileBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+                Note.objects.filter(pk=note.pk).update(blob=blob, file=blob.file.name, file_size=blob.size)
+            moved += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {moved} notes into the blob store, freeing {saved_bytes / (1024 * 1024):.1f} MB "
+            f"of duplicates ({missing} files missing)"
+        ))
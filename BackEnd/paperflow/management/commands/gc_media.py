@@ -0,0 +1,69 @@
+import time
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from paperflow.media import expired_upload_sessions, find_orphans, remove_empty_dirs, stale_variant_records
+
+
+class Command(BaseCommand):
+    help = "Delete media files no note, blob, upload or site image references any more"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only list what would be deleted")
+        parser.add_argument('--batch-size', type=int, default=200, help="Files deleted per batch")
+        parser.add_argument('--sleep', type=float, default=0.5, help="Seconds to pause between batches")
+        parser.add_argument('--min-age', type=int, default=3600,
+                            help="Skip files modified within this many seconds (uploads in flight)")
+        parser.add_argument('--upload-ttl', type=int, default=48,
+                            help="Hours after which unfinished chunked uploads are abandoned")
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        sessions = expired_upload_sessions(options['upload_ttl'])
+        stale_variants = stale_variant_records()
+        if dry_run:
+            self.stdout.write(
+                f"Would expire {sessions.count()} upload sessions and "
+                f"{stale_variants.count()} unused image variant sets"
+            )
+            ignore_sessions = sessions
+        else:
+            expired, _ = sessions.delete()
+            dropped, _ = stale_variants.delete()
+            self.stdout.write(f"Expired {expired} upload sessions and {dropped} unused image variant sets")
+            ignore_sessions = None
+
+        deleted = freed = 0
+        batch = []
+        for name, path, size in find_orphans(options['min_age'], ignore_sessions):
+            if dry_run:
+                self.stdout.write(f"{name} ({size} bytes)")
+                deleted += 1
+                freed += size
+                continue
+            batch.append((name, size))
+            if len(batch) >= options['batch_size']:
+                deleted, freed = self._delete(batch, deleted, freed)
+                batch = []
+                time.sleep(options['sleep'])
+        if batch:
+            deleted, freed = self._delete(batch, deleted, freed)
+
+        action = "Would delete" if dry_run else "Deleted"
+        summary = f"{action} {deleted} orphaned files ({freed / (1024 * 1024):.1f} MB)"
+        if not dry_run:
+            summary += f", removed {remove_empty_dirs()} empty directories"
+        self.stdout.write(self.style.SUCCESS(summary))
+
+    def _delete(self, batch, deleted, freed):
+        for name, size in batch:
+            try:
+                default_storage.delete(name)
+            except OSError as e:
+                self.stderr.write(f"{name}: {e}")
+                continue
+            deleted += 1
+            freed += size
+        return deleted, freed
@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from paperflow.catalog import CODE_PREFIX, generate_catalog
+from paperflow.models import Faculty
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-generate a synthetic catalog for benchmarking. Point it at a scratch "
+        "database, e.g. PAPERFLOW_DB_NAME=bench.sqlite3 python manage.py migrate first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--faculties', type=int, default=20)
+        parser.add_argument('--courses', type=int, default=300, help="Courses in total, spread over the faculties")
+        parser.add_argument('--academic-years', type=int, default=2, help="Most recent years per course")
+        parser.add_argument('--levels', type=int, default=4, help="Year levels per academic year")
+        parser.add_argument('--semesters', type=int, default=2, choices=(1, 2), help="Semesters per year level")
+        parser.add_argument('--notes', type=int, default=100000, help="Notes in total, spread over every semester")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed for titles, types and view counts")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows per bulk insert")
+
+    def handle(self, *args, **options):
+        for option in ('faculties', 'courses', 'academic_years', 'levels', 'batch_size'):
+            if options[option] < 1:
+                raise CommandError(f"--{option.replace('_', '-')} must be at least 1")
+        if options['notes'] < 0:
+            raise CommandError("--notes cannot be negative")
+        if Faculty.objects.filter(code__startswith=CODE_PREFIX).exists():
+            raise CommandError(
+                f"This database already has a generated catalog (faculty codes {CODE_PREFIX}...); "
+                f"use a fresh database via PAPERFLOW_DB_NAME"
+            )
+
+        start = time.monotonic()
+        report = generate_catalog(
+            options['faculties'], options['courses'], options['academic_years'], options['levels'],
+            options['semesters'], options['notes'], seed=options['seed'], batch_size=options['batch_size'],
+            progress=self.stdout.write
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {report['faculties']} faculties, {report['courses']} courses, "
+            f"{report['academic_years']} academic years, {report['year_levels']} year levels, "
+            f"{report['semesters']} semesters and {report['notes']} notes "
+            f"in {time.monotonic() - start:.1f}s"
+        ))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from paperflow.variants import IMAGE_FIELDS, generate_variants_now
+
+
+class Command(BaseCommand):
+    help = "Render responsive variants for site images that do not have them yet"
+
+    def handle(self, *args, **options):
+        rendered = failed = 0
+        for model in IMAGE_FIELDS:
+            for instance in model.objects.all():
+                try:
+                    rendered += generate_variants_now(instance)
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"{model.__name__} {instance.pk}: {e}")
+        self.stdout.write(self.style.SUCCESS(f"Rendered variants for {rendered} images ({failed} failed)"))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from paperflow.models import Note
+from paperflow.previews import generate_preview_now
+
+
+class Command(BaseCommand):
+    help = "Generate previews for PDF notes that do not have one yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None, help="Maximum number of notes to process")
+
+    def handle(self, *args, **options):
+        note_ids = Note.objects.filter(
+            Q(has_preview=False) | Q(preview_file='') | Q(preview_file__isnull=True),
+            file__iendswith='.pdf'
+        ).values_list('id', flat=True)
+        if options['limit']:
+            note_ids = note_ids[:options['limit']]
+
+        generated = failed = 0
+        for note_id in list(note_ids):
+            try:
+                if generate_preview_now(note_id):
+                    generated += 1
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"Note {note_id}: {e}")
+        self.stdout.write(self.style.SUCCESS(f"Generated {generated} previews ({failed} failed)"))
@@ -0,0 +1,160 @@
+import json
+import os
+import secrets
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from paperflow.loadtest import LoadTest, Targets, fetch_metrics, parse_mix
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def server_command(server, port, workers, threads):
+    if server == 'gunicorn':
+        # gunicorn.conf.py in BackEnd/ is picked up as in production
+        return ['gunicorn', 'core.wsgi:application', '--bind', f'127.0.0.1:{port}',
+                '--workers', str(workers), '--threads', str(threads)]
+    if server == 'uvicorn':
+        return ['uvicorn', 'core.asgi:application', '--host', '127.0.0.1', '--port', str(port),
+                '--workers', str(workers), '--no-access-log']
+    return [sys.executable, 'manage.py', 'runserver', f'127.0.0.1:{port}', '--noreload']
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive a realistic traffic mix (landing page, faculty hover, year-level notes, "
+        "preview/view, search) from many threads and report throughput, errors and "
+        "latency percentiles over time. Starts its own server unless --url is given; "
+        "use PAPERFLOW_DB_NAME to run against a generated catalog."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help="Load an already running server instead of starting one")
+        parser.add_argument('--server', choices=('gunicorn', 'uvicorn', 'runserver'), default='gunicorn',
+                            help="Server to start: gunicorn (WSGI), uvicorn (core/asgi.py) or runserver")
+        parser.add_argument('--workers', type=int, default=4, help="Server worker processes")
+        parser.add_argument('--threads', type=int, default=1, help="Threads per gunicorn worker")
+        parser.add_argument('--concurrency', type=int, default=16, help="Simultaneous simulated clients")
+        parser.add_argument('--duration', type=float, default=30, help="Seconds of load")
+        parser.add_argument('--interval', type=float, default=5, help="Seconds per timeline window")
+        parser.add_argument('--mix', help="Scenario weights, e.g. view=50,search=10 "
+                                          "(landing, hover, year-level, view, search)")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--metrics-token', default=os.environ.get('PAPERFLOW_METRICS_TOKEN'),
+                            help="Token for the server's /api/metrics (set automatically for a started server)")
+        parser.add_argument('--output', help="Also write the full JSON report to this file")
+
+    def handle(self, *args, **options):
+        try:
+            mix = parse_mix(options['mix'])
+            targets = Targets(seed=options['seed'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        server = None
+        base_url = options['url']
+        token = options['metrics_token']
+        if not base_url:
+            token = token or secrets.token_urlsafe(16)
+            server, base_url = self.start_server(options, token)
+
+        try:
+            before = fetch_metrics(base_url, token) if token else None
+            self.stdout.write(
+                f"Loading {base_url} with {options['concurrency']} clients for {options['duration']:g}s "
+                f"(mix: {', '.join(f'{name}={weight}' for name, weight in mix.items())})"
+            )
+            self.stdout.write(f"{'second':>7} {'req/s':>8} {'errors':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+            load = LoadTest(
+                base_url, targets, mix, options['concurrency'], options['duration'], options['interval'],
+                seed=options['seed'], report=self.write_window
+            )
+            result = load.run()
+            after = fetch_metrics(base_url, token) if token else None
+        finally:
+            if server is not None:
+                self.stop_server(server)
+
+        if after is not None:
+            result['server_metrics'] = {
+                name: value - (before or {}).get(name, 0) if '_total' in name else value
+                for name, value in after.items()
+            }
+        self.write_summary(result)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'options': {key: options[key] for key in (
+                    'url', 'server', 'workers', 'threads', 'concurrency', 'duration', 'seed'
+                )}, 'mix': mix, **result}, f, indent=2)
+                f.write('\n')
+
+    def start_server(self, options, token):
+        port = free_port()
+        command = server_command(options['server'], port, options['workers'], options['threads'])
+        if options['server'] != 'runserver' and not shutil.which(command[0]):
+            raise CommandError(f"{command[0]} is not installed; use --server runserver or --url")
+        base_url = f'http://127.0.0.1:{port}'
+        env = {**os.environ, 'PAPERFLOW_METRICS_TOKEN': token}
+        self.stdout.write(f"Starting {' '.join(command)}")
+        # The server log goes to a file: a pipe nobody reads would fill up and stall it
+        log = tempfile.TemporaryFile()
+        server = subprocess.Popen(command, cwd=settings.BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                log.seek(0)
+                raise CommandError(f"The server exited:\n{log.read().decode()[-2000:]}")
+            try:
+                urllib.request.urlopen(f'{base_url}/api/faculties/', timeout=2).read()
+                return server, base_url
+            except OSError:
+                time.sleep(0.25)
+        self.stop_server(server)
+        raise CommandError("The server did not answer within 30 seconds")
+
+    def stop_server(self, server):
+        server.terminate()
+        try:
+            server.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+    def write_window(self, window):
+        self.stdout.write(
+            f"{window['second']:>7.1f} {window['throughput_rps']:>8.1f} {window['errors']:>7} "
+            f"{window['p50_ms'] or 0:>8.1f} {window['p95_ms'] or 0:>8.1f} {window['p99_ms'] or 0:>8.1f}"
+        )
+
+    def write_summary(self, result):
+        self.stdout.write('')
+        self.stdout.write(f"{'endpoint':<20} {'requests':>9} {'req/s':>8} {'errors':>7} "
+                          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for label, row in result['endpoints'].items():
+            self.stdout.write(
+                f"{label:<20} {row['requests']:>9} {row['throughput_rps']:>8.1f} {row['errors']:>7} "
+                f"{row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f}"
+            )
+        for name, value in result.get('server_metrics', {}).items():
+            self.stdout.write(f"  {name} {value:g}")
+
+        overall = result['overall']
+        summary = (
+            f"{overall['requests']} requests in {overall['seconds']}s: {overall['throughput_rps']} req/s, "
+            f"{overall['error_rate']:.2%} errors, p50 {overall['p50_ms']} ms, p95 {overall['p95_ms']} ms, "
+            f"p99 {overall['p99_ms']} ms (status codes: {overall['status_codes']})"
+        )
+        self.stdout.write(self.style.SUCCESS(summary) if not overall['errors'] else self.style.WARNING(summary))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from paperflow.retention import academic_years_to_keep, prune_academic_years
+
+
+class Command(BaseCommand):
+    help = "Delete academic years beyond the most recent ones of each course (schedule it, e.g. nightly)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep', type=int, default=None,
+                            help="Academic years to keep per course (default: PAPERFLOW_ACADEMIC_YEARS_TO_KEEP)")
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be deleted")
+
+    def handle(self, *args, **options):
+        keep = options['keep'] if options['keep'] is not None else academic_years_to_keep()
+        if keep < 1:
+            raise CommandError("--keep must be at least 1")
+
+        report = prune_academic_years(keep, dry_run=options['dry_run'])
+        action = "Would prune" if options['dry_run'] else "Pruned"
+        self.stdout.write(self.style.SUCCESS(
+            f"{action} {report['academic_years']} academic years across {report['courses']} courses "
+            f"(keeping {keep} each): {report['year_levels']} year levels, "
+            f"{report['semesters']} semesters, {report['notes']} notes"
+        ))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from paperflow.stats import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = "Recount every statistics counter from the catalog tables"
+
+    def handle(self, *args, **options):
+        totals = rebuild_counters()
+        for name, value in sorted(totals.items()):
+            self.stdout.write(f"{name}: {value}")
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(totals)} counters"))
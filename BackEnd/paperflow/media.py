@@ -0,0 +1,116 @@
+# media.py - Finding stored files that no row references any more
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import SiteSettings, AboutUs, HowItWorks, Note, FileBlob, ResponsiveImage, UploadSession
+
+
+# Top-level MEDIA_ROOT directories written by PaperFlow; anything else is left alone
+MANAGED_DIRS = (
+    'notes', 'previews', 'blobs', 'uploads', 'variants',
+    'site_logos', 'backgrounds', 'about', 'how_it_works',
+)
+
+SITE_IMAGE_FIELDS = (
+    (SiteSettings, ('site_logo', 'backgroundimage', 'backgroundimage2')),
+    (AboutUs, ('image',)),
+    (HowItWorks, ('image',)),
+)
+
+
+def expired_upload_sessions(ttl_hours):
+    """Unfinished uploads nobody has touched for `ttl_hours`"""
+    cutoff = timezone.now() - timedelta(hours=ttl_hours)
+    return UploadSession.objects.filter(is_complete=False, updated_at__lt=cutoff)
+
+
+def site_image_names():
+    names = set()
+    for model, fields in SITE_IMAGE_FIELDS:
+        for row in model.objects.values_list(*fields).iterator():
+            names.update(name for name in row if name)
+    return names
+
+
+def stale_variant_records():
+    """ResponsiveImage rows whose source image is no longer used"""
+    return ResponsiveImage.objects.exclude(source__in=site_image_names())
+
+
+def referenced_names(ignore_sessions=None):
+    """
+    Every storage name (or `variants/..` directory prefix) a row points at,
+    read in a handful of bulk queries.
+    """
+    names = set()
+    for row in Note.objects.values_list('file', 'preview_file').iterator():
+        names.update(name for name in row if name)
+    names.update(FileBlob.objects.values_list('file', flat=True).iterator())
+
+    sessions = UploadSession.objects.filter(is_complete=False)
+    if ignore_sessions is not None:
+        sessions = sessions.exclude(pk__in=ignore_sessions.values('pk'))
+    names.update(sessions.values_list('file_name', flat=True).iterator())
+
+    names.update(site_image_names())
+
+    # A variant set is one directory per source hash (variants, manifest, temp files)
+    prefixes = {
+        f'variants/{sha256[:2]}/{sha256}/'
+        for sha256 in ResponsiveImage.objects.exclude(
+            pk__in=stale_variant_records().values('pk')
+        ).values_list('sha256', flat=True).iterator()
+    }
+    return names, prefixes
+
+
+def find_orphans(min_age_seconds, ignore_sessions=None):
+    """
+    Yield (name, path, size) for files under the managed directories that
+    nothing references and that are older than `min_age_seconds`, so
+    uploads and renders still in flight are never touched.
+    """
+    names, prefixes = referenced_names(ignore_sessions)
+    media_root = str(settings.MEDIA_ROOT)
+    cutoff = time.time() - min_age_seconds
+
+    for directory in MANAGED_DIRS:
+        top = os.path.join(media_root, directory)
+        for dirpath, _, filenames in os.walk(top):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, media_root).replace(os.sep, '/')
+                if name in names or _variant_dir(name) in prefixes:
+                    continue
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if stat.st_mtime > cutoff:
+                    continue
+                yield name, path, stat.st_size
+
+
+def _variant_dir(name):
+    # variants/ab/<sha256>/640w.webp -> variants/ab/<sha256>/
+    parts = name.split('/')
+    if parts[0] != 'variants' or len(parts) < 4:
+        return None
+    return '/'.join(parts[:3]) + '/'
+
+
+def remove_empty_dirs():
+    """Drop directories emptied by deletions (the managed roots themselves stay)"""
+    media_root = str(settings.MEDIA_ROOT)
+    removed = 0
+    for directory in MANAGED_DIRS:
+        top = os.path.join(media_root, directory)
+        for dirpath, dirnames, filenames in os.walk(top, topdown=False):
+            if dirpath != top and not os.listdir(dirpath):
+                os.rmdir(dirpath)
+                removed += 1
+    return removed
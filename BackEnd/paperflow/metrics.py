@@ -0,0 +1,345 @@
+# metrics.py - Prometheus metrics aggregated across worker processes
+import atexit
+import fcntl
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+from .instrumentation import LATENCY_BUCKETS_MS, QUERY_BUCKETS, request_stats
+
+
+ARCHIVE_FILE = 'archive.json'
+LOCK_FILE = '.lock'
+
+
+class MetricsRegistry:
+    """Monotonic counters of this process, keyed by (name, sorted label pairs)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += amount
+        ensure_writer()
+
+    def snapshot(self):
+        with self._lock:
+            return [[name, dict(labels), value] for (name, labels), value in self._counters.items()]
+
+
+registry = MetricsRegistry()
+
+
+def inc(name, amount=1, **labels):
+    registry.inc(name, amount, **labels)
+
+
+def _component_metrics():
+    """Cumulative counters and live gauges read from the background components"""
+    from .counters import view_counts, download_counts
+    from .reaper import reaper
+    from .tasks import queue_depth
+
+    counters = []
+    gauges = [['paperflow_task_queue_depth', {}, queue_depth()], ['paperflow_reaper_pending', {}, reaper.pending()]]
+    for buffer in (view_counts, download_counts):
+        labels = {'field': buffer.field}
+        counters += [
+            ['paperflow_counter_flushes_total', labels, buffer.flushes],
+            ['paperflow_counter_flushed_increments_total', labels, buffer.flushed_increments],
+            ['paperflow_counter_failed_flushes_total', labels, buffer.failed_flushes],
+        ]
+        gauges.append(['paperflow_counter_pending', labels, buffer.pending()])
+    counters += [
+        ['paperflow_reaper_deleted_total', {}, reaper.deleted],
+        ['paperflow_reaper_failed_total', {}, reaper.failed],
+    ]
+    return counters, gauges
+
+
+def _start_time(pid):
+    """Clock ticks after boot at which `pid` started, or None where /proc cannot tell"""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # starttime is field 22; the command name before it may contain spaces
+    return int(stat.rsplit(')', 1)[1].split()[19])
+
+
+def process_snapshot():
+    counters, gauges = _component_metrics()
+    return {
+        'pid': os.getpid(),
+        'started': _start_time(os.getpid()),
+        'written_at': time.time(),
+        'endpoints': request_stats.snapshot(),
+        'counters': registry.snapshot() + counters,
+        'gauges': gauges,
+    }
+
+
+# Shared store: one JSON file per worker, merged on scrape
+
+def metrics_dir():
+    return getattr(settings, 'PAPERFLOW_METRICS_DIR', None)
+
+
+def write_interval():
+    return getattr(settings, 'PAPERFLOW_METRICS_WRITE_INTERVAL', 5)
+
+
+def write_process_file():
+    directory = metrics_dir()
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    snapshot = process_snapshot()
+    # pids come back after a container restart, so the start time tells
+    # this process apart from an earlier one that had the same pid
+    key = snapshot['pid'] if snapshot['started'] is None else f"{snapshot['pid']}-{snapshot['started']}"
+    path = os.path.join(directory, f'{key}.json')
+    with open(f'{path}.part', 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(f'{path}.part', path)
+
+
+_writer = None
+_writer_pid = None
+_writer_lock = threading.Lock()
+
+
+def ensure_writer():
+    """Start this worker's periodic writer (threads do not survive a fork)"""
+    global _writer, _writer_pid
+    if _writer_pid == os.getpid() or not metrics_dir():
+        return
+    with _writer_lock:
+        if _writer_pid == os.getpid():
+            return
+        _writer_pid = os.getpid()
+        _writer = threading.Thread(target=_write_forever, name='paperflow-metrics-writer', daemon=True)
+        _writer.start()
+        atexit.register(write_process_file)
+
+
+def _write_forever():
+    while True:
+        time.sleep(write_interval())
+        try:
+            write_process_file()
+        except OSError:
+            pass
+
+
+def _alive(data, strict=False):
+    """
+    Whether the process that wrote `data` still runs. A file without a start
+    time is trusted on its pid alone, unless `strict`.
+    """
+    pid, started = data['pid'], data.get('started')
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    if started is None:
+        return not strict
+    return _start_time(pid) in (started, None)
+
+
+def _empty_totals():
+    return {'endpoints': {}, 'counters': defaultdict(float), 'gauges': defaultdict(float)}
+
+
+def _merge(totals, data, include_gauges):
+    for endpoint, stats in data.get('endpoints', {}).items():
+        merged = totals['endpoints'].get(endpoint)
+        if merged is None:
+            totals['endpoints'][endpoint] = {key: list(value) if isinstance(value, list) else value
+                                             for key, value in stats.items()}
+            continue
+        for key, value in stats.items():
+            if key == 'max_queries':
+                merged[key] = max(merged[key], value)
+            elif isinstance(value, list):
+                merged[key] = [a + b for a, b in zip(merged[key], value)]
+            else:
+                merged[key] += value
+    for name, labels, value in data.get('counters', []):
+        totals['counters'][(name, tuple(sorted(labels.items())))] += value
+    if include_gauges:
+        for name, labels, value in data.get('gauges', []):
+            totals['gauges'][(name, tuple(sorted(labels.items())))] += value
+
+
+def _serializable(totals):
+    return {
+        'endpoints': totals['endpoints'],
+        'counters': [[name, dict(labels), value] for (name, labels), value in totals['counters'].items()],
+    }
+
+
+def _fold_retired(directory, strict=False):
+    """
+    Fold the files of processes that exited into the archive, under the
+    store's lock. Returns the archive and the snapshots of live processes.
+    """
+    live = []
+    with open(os.path.join(directory, LOCK_FILE), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        archive_path = os.path.join(directory, ARCHIVE_FILE)
+        archive = _empty_totals()
+        if os.path.exists(archive_path):
+            with open(archive_path) as f:
+                _merge(archive, json.load(f), include_gauges=False)
+
+        retired = []
+        for filename in os.listdir(directory):
+            if not filename.endswith('.json') or filename == ARCHIVE_FILE:
+                continue
+            path = os.path.join(directory, filename)
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if _alive(data, strict):
+                live.append(data)
+            else:
+                _merge(archive, data, include_gauges=False)
+                retired.append(path)
+
+        if retired:
+            with open(f'{archive_path}.part', 'w') as f:
+                json.dump(_serializable(archive), f)
+            os.replace(f'{archive_path}.part', archive_path)
+            for path in retired:
+                os.remove(path)
+    return archive, live
+
+
+def archive_stale_files():
+    """
+    Archive what earlier runs left behind, before any worker of this one
+    exists (gunicorn's on_starting). Files that cannot prove their process
+    still runs are retired too, as their pid may belong to someone else now.
+    """
+    directory = metrics_dir()
+    if directory and os.path.isdir(directory):
+        _fold_retired(directory, strict=True)
+
+
+def collect():
+    """
+    Totals across every worker that wrote to the store. Files of workers
+    that exited are folded into an archive, so counters stay monotonic
+    across restarts while the directory does not grow.
+    """
+    directory = metrics_dir()
+    totals = _empty_totals()
+    if not directory:
+        _merge(totals, process_snapshot(), include_gauges=True)
+        totals['workers'] = 1
+        return totals
+
+    write_process_file()
+    archive, live = _fold_retired(directory)
+    for data in live:
+        _merge(totals, data, include_gauges=True)
+    _merge(totals, _serializable(archive), include_gauges=False)
+    totals['workers'] = len(live)
+    return totals
+
+
+# Prometheus text exposition format
+
+def _labels(labels, **extra):
+    pairs = list(labels) + sorted(extra.items())
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def _histogram(lines, name, labels, bounds, counts, total, scale=1):
+    cumulative = 0
+    for bound, count in zip(bounds, counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{_labels(labels, le=_number(bound * scale))} {cumulative}')
+    cumulative += counts[-1]
+    lines.append(f'{name}_bucket{_labels(labels, le="+Inf")} {cumulative}')
+    lines.append(f'{name}_sum{_labels(labels)} {_number(total)}')
+    lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+
+
+ENDPOINT_COUNTERS = (
+    ('paperflow_http_requests_total', 'requests', "Requests served, by URL name"),
+    ('paperflow_http_errors_total', 'errors', "Requests that ended in a 5xx response"),
+    ('paperflow_http_response_bytes_total', 'bytes', "Response body bytes sent"),
+    ('paperflow_db_queries_total', 'queries', "Database queries run while serving requests"),
+    ('paperflow_db_query_seconds_total', 'db_time', "Time spent in database queries"),
+)
+
+HELP = {
+    'paperflow_cache_requests_total': ('counter', "Cache lookups by cache and result (hit/miss)"),
+    'paperflow_upload_bytes_total': ('counter', "Bytes received in note uploads"),
+    'paperflow_counter_flushes_total': ('counter', "Batched view/download counter flushes"),
+    'paperflow_counter_flushed_increments_total': ('counter', "Increments written by counter flushes"),
+    'paperflow_counter_failed_flushes_total': ('counter', "Counter flushes that failed and were retried"),
+    'paperflow_reaper_deleted_total': ('counter', "Files deleted by the background reaper"),
+    'paperflow_reaper_failed_total': ('counter', "Background file deletions that failed"),
+    'paperflow_task_queue_depth': ('gauge', "Preview/image jobs waiting on the process pools"),
+    'paperflow_counter_pending': ('gauge', "Buffered counter increments not yet flushed"),
+    'paperflow_reaper_pending': ('gauge', "Files queued for background deletion"),
+}
+
+
+def render(totals):
+    lines = []
+    endpoints = sorted(totals['endpoints'].items())
+
+    for name, key, help_text in ENDPOINT_COUNTERS:
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        for endpoint, stats in endpoints:
+            lines.append(f'{name}{_labels((), endpoint=endpoint)} {_number(stats[key])}')
+
+    name = 'paperflow_http_request_duration_seconds'
+    lines += [f'# HELP {name} Request latency', f'# TYPE {name} histogram']
+    for endpoint, stats in endpoints:
+        _histogram(lines, name, (('endpoint', endpoint),), LATENCY_BUCKETS_MS, stats['latency'],
+                   stats['duration'], scale=0.001)
+
+    name = 'paperflow_db_queries_per_request'
+    lines += [f'# HELP {name} Database queries per request', f'# TYPE {name} histogram']
+    for endpoint, stats in endpoints:
+        _histogram(lines, name, (('endpoint', endpoint),), QUERY_BUCKETS, stats['query_counts'], stats['queries'])
+
+    by_name = defaultdict(list)
+    for (metric, labels), value in list(totals['counters'].items()) + list(totals['gauges'].items()):
+        by_name[metric].append((labels, value))
+    for metric in sorted(by_name):
+        kind, help_text = HELP.get(metric, ('untyped', metric))
+        lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} {kind}']
+        for labels, value in sorted(by_name[metric]):
+            lines.append(f'{metric}{_labels(labels)} {_number(value)}')
+
+    lines += [
+        '# HELP paperflow_workers Worker processes reporting to the metrics store',
+        '# TYPE paperflow_workers gauge',
+        f"paperflow_workers {totals['workers']}",
+    ]
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,64 @@
+# Full-text index for notes. Only created on SQLite builds with FTS5;
+# other databases fall back to the in-memory index in paperflow.search.
+
+from django.db import migrations
+
+
+CREATE_SQL = """
+CREATE VIRTUAL TABLE paperflow_note_fts USING fts5(
+    title, description, course, faculty,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+)
+"""
+
+POPULATE_SQL = """
+INSERT INTO paperflow_note_fts (rowid, title, description, course, faculty)
+SELECT n.id, n.title, COALESCE(n.description, ''),
+       c.code || ' ' || c.name, f.code || ' ' || f.name
+FROM paperflow_note n
+JOIN paperflow_semester s ON s.id = n.semester_id
+JOIN paperflow_yearlevel y ON y.id = s.year_level_id
+JOIN paperflow_academicyear a ON a.id = y.academic_year_id
+JOIN paperflow_course c ON c.id = a.course_id
+JOIN paperflow_faculty f ON f.id = c.faculty_id
+"""
+
+
+def fts5_available(schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return False
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        if cursor.fetchone()[0]:
+            return True
+        # Loadable FTS5 builds do not report the compile option
+        try:
+            cursor.execute("CREATE VIRTUAL TABLE temp.paperflow_fts5_probe USING fts5(x)")
+            cursor.execute("DROP TABLE temp.paperflow_fts5_probe")
+            return True
+        except Exception:
+            return False
+
+
+def create_index(apps, schema_editor):
+    if not fts5_available(schema_editor):
+        return
+    schema_editor.execute(CREATE_SQL)
+    schema_editor.execute(POPULATE_SQL)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS paperflow_note_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paperflow', '0010_statcounter'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
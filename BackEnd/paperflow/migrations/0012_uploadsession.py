@@ -0,0 +1,38 @@
+# Generated by Django 5.2.2 on 2026-10-18 03:28
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paperflow', '0011_note_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=200)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('note_type', models.CharField(choices=[('lecture', 'Lecture Notes'), ('assignment', 'Assignment'), ('exam', 'Past Exam'), ('reference', 'Reference Material'), ('other', 'Other')], default='lecture', max_length=20)),
+                ('is_premium', models.BooleanField(default=False)),
+                ('filename', models.CharField(help_text='Original name of the uploaded file', max_length=255)),
+                ('file_name', models.CharField(editable=False, help_text='Storage name chunks are written to', max_length=500)),
+                ('total_size', models.PositiveBigIntegerField()),
+                ('received_bytes', models.PositiveBigIntegerField(default=0)),
+                ('sha256', models.CharField(blank=True, max_length=64)),
+                ('is_complete', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('note', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='upload_session', to='paperflow.note')),
+                ('semester', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to='paperflow.semester')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
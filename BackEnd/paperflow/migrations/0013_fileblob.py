@@ -0,0 +1,31 @@
+# Generated by Django 5.2.2 on 2026-10-18 03:31
+
+import django.db.models.deletion
+import paperflow.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paperflow', '0012_uploadsession'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('file', models.FileField(upload_to=paperflow.models.blob_file_path)),
+                ('size', models.PositiveBigIntegerField()),
+                ('ref_count', models.PositiveIntegerField(default=0, help_text='Notes pointing at this file')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='blob',
+            field=models.ForeignKey(blank=True, help_text='Shared content-addressed copy of the file', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='notes', to='paperflow.fileblob'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.2 on 2026-10-18 03:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Lower
+
+
+def backfill_hierarchy_keys(apps, schema_editor):
+    Note = apps.get_model('paperflow', 'Note')
+    Semester = apps.get_model('paperflow', 'Semester')
+    semester = Semester.objects.filter(pk=OuterRef('semester_id'))
+    Note.objects.update(
+        faculty_id=Subquery(semester.values('year_level__academic_year__course__faculty_id')[:1]),
+        course_id=Subquery(semester.values('year_level__academic_year__course_id')[:1]),
+        academic_year=Subquery(semester.values('year_level__academic_year__year')[:1]),
+        faculty_code=Lower(Subquery(semester.values('year_level__academic_year__course__faculty__code')[:1])),
+        course_code=Lower(Subquery(semester.values('year_level__academic_year__course__code')[:1])),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paperflow', '0014_responsiveimage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='note',
+            name='academic_year',
+            field=models.PositiveIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='course',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='paperflow.course'),
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='course_code',
+            field=models.CharField(blank=True, editable=False, help_text='Lowercase course code', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='faculty',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='paperflow.faculty'),
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='faculty_code',
+            field=models.CharField(blank=True, editable=False, help_text='Lowercase faculty code', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(fields=['faculty_code', '-uploaded_at'], name='note_faculty_code_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(fields=['course_code', '-uploaded_at'], name='note_course_code_idx'),
+        ),
+        migrations.RunPython(backfill_hierarchy_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.2 on 2026-10-18 03:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paperflow', '0015_note_hierarchy_keys'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(fields=['faculty_code', 'course_code', 'academic_year', 'note_type'], name='note_facets_idx'),
+        ),
+    ]
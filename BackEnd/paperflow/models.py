@@ -1,7 +1,6 @@
 # models.py - Enhanced with Preview and Payment System
-from django.db import models
+from django.db import models, transaction
 from django.core.exceptions import ValidationError
-from PIL import Image
 from django.utils import timezone
 import uuid
 import os
@@ -38,18 +37,6 @@ class SiteSettings(models.Model):
     def __str__(self):
         return self.site_name or "Site Settings"
 
-    def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        if self.site_logo:
-            img_path = self.site_logo.path
-            with Image.open(img_path) as img:
-                max_width = 300
-                if img.width > max_width:
-                    output_size = (max_width, int(img.height * (max_width / img.width)))
-                    output_size = (800, 800)
-                    img = img.resize(output_size, Image.Resampling.LANCZOS)
-                    img.save(img_path)
-
     def logo_preview(self):
         if self.site_logo:
             return f'<img src="{self.site_logo.url}" width="100" style="border-radius:5px;" />'
@@ -90,19 +77,6 @@ class AboutUs(models.Model):
     def __str__(self):
         return self.title
 
-    def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        if self.image:
-            img_path = self.image.path
-            with Image.open(img_path) as img:
-                max_width = 300
-                if img.width > max_width:
-                    ratio = max_width / float(img.width)
-                    new_height = int(img.height * ratio)
-                    output_size = (800, 800)
-                    img = img.resize(output_size, Image.Resampling.LANCZOS)
-                    img.save(img_path)
-
     def image_preview(self):
         if self.image:
             return f'<img src="{self.image.url}" width="150" style="border-radius:5px;" />'
@@ -127,19 +101,6 @@ class HowItWorks(models.Model):
     def __str__(self):
         return f"Step {self.step_number}: {self.step_title}"
 
-    def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        if self.image:
-            img_path = self.image.path
-            with Image.open(img_path) as img:
-                max_width = 300
-                if img.width > max_width:
-                    ratio = max_width / float(img.width)
-                    new_height = int(float(img.height) * ratio)
-                    output_size = (800, 800)
-                    img = img.resize(output_size, Image.Resampling.LANCZOS)
-                    img.save(img_path)
-
     def image_preview(self):
         if self.image:
             return f'<img src="{self.image.url}" width="150" style="border-radius: 5px;" />'
@@ -201,14 +162,7 @@ class AcademicYear(models.Model):
         if self.is_current:
             AcademicYear.objects.filter(course=self.course, is_current=True).update(is_current=False)
         super().save(*args, **kwargs)
-        self.cleanup_old_years()
-    
-    def cleanup_old_years(self):
-        years_to_keep = AcademicYear.objects.filter(course=self.course).order_by('-year')[:2]
-        years_to_delete = AcademicYear.objects.filter(course=self.course).exclude(
-            id__in=[year.id for year in years_to_keep]
-        )
-        years_to_delete.delete()
+        # Old years are pruned by the prune_academic_years command (see retention.py)
 
 
 class YearLevel(models.Model):
@@ -261,6 +215,24 @@ def preview_file_path(instance, filename):
     return f"previews/{instance.semester.year_level.academic_year.course.faculty.code}/{instance.semester.year_level.academic_year.course.code}/{instance.semester.year_level.academic_year.year}/{instance.semester.year_level.name.replace(' ', '_')}/semester_{instance.semester.semester_number}/{filename}"
 
 
+def blob_file_path(instance, filename):
+    # Fanned out by hash prefix so no single directory grows too large
+    sha256 = instance.sha256
+    return f"blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}{os.path.splitext(filename)[1].lower()}"
+
+
+class FileBlob(models.Model):
+    """A stored file, shared by every note with the same content"""
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to=blob_file_path)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0, help_text="Notes pointing at this file")
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.ref_count} refs)"
+
+
 class Note(models.Model):
     NOTE_TYPES = [
         ('lecture', 'Lecture Notes'),
@@ -271,11 +243,24 @@ class Note(models.Model):
     ]
     
     semester = models.ForeignKey(Semester, on_delete=models.CASCADE, related_name='notes')
+    
+    # Copied from the semester's ancestors and kept in step by signals, so
+    # filters hit indexed columns of this table instead of a five-table join
+    faculty = models.ForeignKey(Faculty, on_delete=models.CASCADE, blank=True, null=True, editable=False,
+                                related_name='+')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, blank=True, null=True, editable=False,
+                               related_name='+')
+    academic_year = models.PositiveIntegerField(blank=True, null=True, editable=False, db_index=True)
+    faculty_code = models.CharField(max_length=10, blank=True, editable=False, help_text="Lowercase faculty code")
+    course_code = models.CharField(max_length=10, blank=True, editable=False, help_text="Lowercase course code")
+    
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True, null=True)
     file = models.FileField(upload_to=note_file_path)
+    blob = models.ForeignKey(FileBlob, on_delete=models.PROTECT, blank=True, null=True, related_name='notes',
+                             help_text="Shared content-addressed copy of the file")
     note_type = models.CharField(max_length=20, choices=NOTE_TYPES, default='lecture')
-    uploaded_at = models.DateTimeField(auto_now_add=True)
+    uploaded_at = models.DateTimeField(auto_now_add=True, db_index=True)
     file_size = models.PositiveIntegerField(blank=True, null=True)
     
     # Preview functionality
@@ -291,34 +276,50 @@ class Note(models.Model):
     
     class Meta:
         ordering = ['-uploaded_at']
+        indexes = [
+            models.Index(fields=['faculty_code', '-uploaded_at'], name='note_faculty_code_idx'),
+            models.Index(fields=['course_code', '-uploaded_at'], name='note_course_code_idx'),
+            # Covers the search facet GROUP BY, so it never sorts the table
+            models.Index(fields=['faculty_code', 'course_code', 'academic_year', 'note_type'],
+                         name='note_facets_idx'),
+        ]
     
     def __str__(self):
         return f"{self.title} - {self.semester}"
     
     def save(self, *args, **kwargs):
-        if self.file:
-            self.file_size = self.file.size
-        super().save(*args, **kwargs)
+        # A freshly uploaded file has not been written to storage yet
+        new_upload = bool(self.file) and not self.file._committed
+        if not new_upload:
+            if self.file:
+                self.file_size = self.file.size
+            super().save(*args, **kwargs)
+            return
+        
+        # Store the upload once per distinct content and point this note at it
+        from .blobs import store_upload, release_blob
+        with transaction.atomic():
+            previous_blob_id = None
+            if self.pk:
+                previous_blob_id = Note.objects.filter(pk=self.pk).values_list('blob_id', flat=True).first()
+            self.blob = store_upload(self.file)
+            self.file = self.blob.file.name
+            self.file_size = self.blob.size
+            super().save(*args, **kwargs)
+            if previous_blob_id:
+                release_blob(previous_blob_id)
         
-        # Auto-generate preview for PDF files
-        if self.file and self.file.name.lower().endswith('.pdf') and not self.has_preview:
+        # Auto-generate preview for PDF files (in the background, after commit)
+        if new_upload and self.file.name.lower().endswith('.pdf') and not self.has_preview:
             self.generate_preview()
     
     def generate_preview(self):
-        """Generate preview file from PDF (first page + sample question)"""
-        # This would be implemented with a PDF processing library like PyPDF2
-        # For now, we'll just mark as having preview capability
-        try:
-            # TODO: Implement actual PDF preview generation
-            # - Extract first page
-            # - Extract one sample question/problem
-            # - Create new PDF with just these elements
-            
-            self.has_preview = True
-            self.preview_generated_at = timezone.now()
-            self.save(update_fields=['has_preview', 'preview_generated_at'])
-        except Exception as e:
-            print(f"Error generating preview for {self.title}: {e}")
+        """Queue preview generation from PDF (first page + sample page)"""
+        # Rendering runs on the background process pool once this save commits,
+        # see previews.py; it fills preview_file, has_preview and preview_generated_at
+        from .previews import schedule_preview
+        note_id = self.pk
+        transaction.on_commit(lambda: schedule_preview(note_id))
     
     @property
     def file_size_mb(self):
@@ -409,4 +410,57 @@ class StudentAccess(models.Model):
             return False
         if self.expires_at and timezone.now() > self.expires_at:
             return False
-        return True
\ No newline at end of file
+        return True
+
+
+class StatCounter(models.Model):
+    """Running catalog totals behind the statistics API (kept in step by signals)"""
+    name = models.CharField(max_length=50, unique=True)
+    value = models.BigIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['name']
+    
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+class ResponsiveImage(models.Model):
+    """Resized/re-encoded copies of an uploaded site image, for srcset"""
+    source = models.CharField(max_length=255, unique=True, help_text="Storage name of the original image")
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.PositiveBigIntegerField(help_text="Size of the original when the variants were made")
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    variants = models.JSONField(default=list, help_text="[{format, width, height, name, size}, ...]")
+    generated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.source} ({len(self.variants)} variants)"
+
+
+class UploadSession(models.Model):
+    """A resumable, chunked note upload; the Note is only created on finalize"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    semester = models.ForeignKey(Semester, on_delete=models.CASCADE, related_name='upload_sessions')
+    title = models.CharField(max_length=200)
+    description = models.TextField(blank=True, null=True)
+    note_type = models.CharField(max_length=20, choices=Note.NOTE_TYPES, default='lecture')
+    is_premium = models.BooleanField(default=False)
+    
+    filename = models.CharField(max_length=255, help_text="Original name of the uploaded file")
+    file_name = models.CharField(max_length=500, editable=False, help_text="Storage name chunks are written to")
+    total_size = models.PositiveBigIntegerField()
+    received_bytes = models.PositiveBigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True)
+    is_complete = models.BooleanField(default=False)
+    note = models.OneToOneField(Note, on_delete=models.SET_NULL, blank=True, null=True, related_name='upload_session')
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.filename} ({self.received_bytes}/{self.total_size})"
@@ -0,0 +1,137 @@
+# pagination.py - Keyset (cursor) pagination for the list endpoints
+import base64
+import binascii
+import datetime
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_cursor(values):
+    values = [value.isoformat() if isinstance(value, datetime.datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, length):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (ValueError, binascii.Error):
+        return None
+    if not isinstance(values, list) or len(values) != length:
+        return None
+    return values
+
+
+def cursor_values(queryset, ordering, values):
+    """
+    Convert decoded cursor values with the field (or annotation output
+    field) each one orders by; a tampered cursor raises ValidationError
+    """
+    converted = []
+    for name, value in zip(ordering, values):
+        name = name.lstrip('-')
+        annotation = queryset.query.annotations.get(name)
+        field = annotation.output_field if annotation is not None else queryset.model._meta.get_field(name)
+        if value is None or isinstance(value, (dict, list)):
+            raise ValidationError('Cursor values must be scalars')
+        converted.append(field.to_python(value))
+    return converted
+
+
+def keyset_filter(ordering, values):
+    """
+    Rows strictly after `values` in `ordering` (field names, '-' for
+    descending). The leading field is also bounded on its own, so the
+    database seeks its index instead of scanning from the first row.
+    """
+    after = Q()
+    for position in reversed(range(len(ordering))):
+        field = ordering[position].lstrip('-')
+        lookup = 'lt' if ordering[position].startswith('-') else 'gt'
+        ties = {ordering[index].lstrip('-'): values[index] for index in range(position)}
+        after = Q(**ties, **{f'{field}__{lookup}': values[position]}) | after
+    leading = ordering[0].lstrip('-')
+    bound = 'lte' if ordering[0].startswith('-') else 'gte'
+    return Q(**{f'{leading}__{bound}': values[0]}) & after
+
+
+class KeysetPagination(BasePagination):
+    """
+    Pages follow the last row of the previous one, so a deep page costs the
+    same as the first. `ordering` must end in a unique field. Cursors are
+    opaque and forward-only; `page_size` is capped at PAPERFLOW_MAX_PAGE_SIZE.
+    """
+
+    ordering = ('-uploaded_at', '-id')
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_ordering(self, request, queryset, view):
+        return getattr(view, 'cursor_ordering', None) or self.ordering
+
+    def get_page_size(self, request):
+        default = getattr(settings, 'PAPERFLOW_PAGE_SIZE', 20)
+        limit = getattr(settings, 'PAPERFLOW_MAX_PAGE_SIZE', 100)
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, default))
+        except ValueError:
+            size = default
+        return max(1, min(size, limit))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.page_size = self.get_page_size(request)
+        self.cursor = request.query_params.get(self.cursor_query_param)
+
+        queryset = queryset.order_by(*self.ordering)
+        if self.cursor:
+            values = decode_cursor(self.cursor, len(self.ordering))
+            if values is None:
+                raise NotFound(self.invalid_cursor_message)
+            try:
+                values = cursor_values(queryset, self.ordering, values)
+                queryset = queryset.filter(keyset_filter(self.ordering, values))
+            except (ValueError, TypeError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+
+        # One extra row tells whether there is a next page, without a COUNT
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        token = encode_cursor([getattr(last, field.lstrip('-')) for field in self.ordering])
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, token)
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class StudentPagination(KeysetPagination):
+    ordering = ('id',)
+
+
+class FacultyPagination(KeysetPagination):
+    ordering = ('name', 'id')
@@ -0,0 +1,28 @@
+# pdf.py - PDF preview rendering (runs in pool processes, keep it free of Django)
+import os
+
+
+def render_preview(source_path, output_path):
+    """
+    Write a small PDF with the first page of `source_path` plus one sample
+    page from the middle of the document. Returns `output_path`, or None
+    when the document has no pages.
+    """
+    from pypdf import PdfReader, PdfWriter
+
+    reader = PdfReader(source_path)
+    page_count = len(reader.pages)
+    if not page_count:
+        return None
+
+    writer = PdfWriter()
+    writer.add_page(reader.pages[0])
+    if page_count > 1:
+        writer.add_page(reader.pages[max(1, page_count // 2)])
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    temp_path = f'{output_path}.part'
+    with open(temp_path, 'wb') as output:
+        writer.write(output)
+    os.replace(temp_path, output_path)
+    return output_path
@@ -0,0 +1,84 @@
+# previews.py - Scheduling PDF preview generation in the background
+import os
+
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from .models import Note, preview_file_path
+from .pdf import render_preview
+from .tasks import run_in_process
+
+
+def _preview_job(note_id):
+    """Return (source_path, output_path, preview_name) for a PDF note, or None"""
+    note = Note.objects.select_related(
+        'semester__year_level__academic_year__course__faculty'
+    ).filter(pk=note_id).first()
+    if not note or not note.file or not note.file.name.lower().endswith('.pdf'):
+        return None
+
+    stem = os.path.splitext(os.path.basename(note.file.name))[0]
+    preview_name = _reserve_name(preview_file_path(note, f'{stem}_preview.pdf'))
+    return note.file.path, default_storage.path(preview_name), preview_name
+
+
+def _reserve_name(name):
+    """
+    Claim a free storage name by creating the file empty: two jobs asking
+    get_available_name at once would both be handed the same name. The
+    render replaces the placeholder; one left by a failed render is an
+    orphan for gc_media.
+    """
+    while True:
+        name = default_storage.get_available_name(name)
+        path = default_storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.close(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL))
+        except FileExistsError:
+            continue
+        return name
+
+
+def schedule_preview(note_id):
+    """Queue preview generation on the process pool; returns False if not queued"""
+    job = _preview_job(note_id)
+    if job is None:
+        return False
+    source_path, output_path, preview_name = job
+
+    def store(result):
+        if result:
+            attach_preview(note_id, preview_name)
+        else:
+            default_storage.delete(preview_name)
+
+    queued = run_in_process(render_preview, source_path, output_path, callback=store)
+    if not queued:
+        default_storage.delete(preview_name)
+    return queued
+
+
+def generate_preview_now(note_id):
+    """Render a preview in this process (maintenance commands)"""
+    job = _preview_job(note_id)
+    if job is None:
+        return False
+    source_path, output_path, preview_name = job
+    if not render_preview(source_path, output_path):
+        default_storage.delete(preview_name)
+        return False
+    attach_preview(note_id, preview_name)
+    return True
+
+
+def attach_preview(note_id, preview_name):
+    note = Note.objects.filter(pk=note_id).first()
+    if note is None:
+        # Deleted while the preview was rendering
+        default_storage.delete(preview_name)
+        return
+    note.preview_file.name = preview_name
+    note.has_preview = True
+    note.preview_generated_at = timezone.now()
+    note.save(update_fields=['preview_file', 'has_preview', 'preview_generated_at'])
@@ -0,0 +1,101 @@
+# reaper.py - Deletes stored files off the request thread
+import atexit
+import logging
+import os
+import threading
+from collections import deque
+
+from django.core.files.storage import default_storage
+from django.db import connection
+
+from .tasks import task_workers
+
+
+logger = logging.getLogger(__name__)
+
+
+class FileReaper:
+    """
+    Queue of storage names to delete, worked off by a daemon thread per
+    worker. Anything lost (a crash, a failed delete) is left for the
+    `gc_media` command to find.
+    """
+
+    def __init__(self):
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        # Statistics (read by monitoring)
+        self.deleted = 0
+        self.failed = 0
+
+    def delete(self, name, keep=None):
+        """Queue `name` for deletion; `keep()` is asked again right before deleting"""
+        if not name:
+            return
+        # Inline when background work is switched off (tests, commands)
+        if task_workers() == 0:
+            self._delete(name, keep)
+            return
+        with self._lock:
+            self._pending.append((name, keep))
+        self._ensure_thread()
+        self._wake.set()
+
+    def pending(self):
+        return len(self._pending)
+
+    def drain(self):
+        """Delete everything queued; returns how many files were processed"""
+        processed = 0
+        while True:
+            with self._lock:
+                if not self._pending:
+                    return processed
+                name, keep = self._pending.popleft()
+            self._delete(name, keep)
+            processed += 1
+
+    def _delete(self, name, keep=None):
+        try:
+            if keep is not None and keep():
+                return
+            default_storage.delete(name)
+            self.deleted += 1
+        except Exception:
+            logger.exception("Failed to delete %s; gc_media will retry", name)
+            self.failed += 1
+
+    def _ensure_thread(self):
+        # Threads do not survive a fork, so each worker starts its own
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='paperflow-file-reaper', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            try:
+                self.drain()
+            finally:
+                # `keep` checks may query; the reaper thread owns its own connection
+                connection.close()
+
+
+reaper = FileReaper()
+
+
+def delete_later(name, keep=None):
+    """Remove a stored file in the background"""
+    reaper.delete(name, keep)
+
+
+atexit.register(reaper.drain)
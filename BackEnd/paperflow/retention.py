@@ -0,0 +1,111 @@
+# retention.py - Pruning old academic years in bulk (replaces the per-save cleanup)
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from .blobs import release_blobs
+from .cache import invalidate_course_tree
+from .models import AcademicYear, YearLevel, Semester, Note, Payment, StudentAccess, UploadSession
+from .reaper import delete_later
+from .search import remove_notes
+from . import fuzzy, stats, suggest
+
+
+def academic_years_to_keep():
+    return getattr(settings, 'PAPERFLOW_ACADEMIC_YEARS_TO_KEEP', 2)
+
+
+def expired_academic_years(keep):
+    """Every course's academic years beyond its `keep` most recent ones"""
+    ranked = AcademicYear.objects.annotate(
+        position=Window(RowNumber(), partition_by=F('course_id'), order_by=F('year').desc())
+    )
+    return AcademicYear.objects.filter(pk__in=ranked.filter(position__gt=keep).values('pk'))
+
+
+def delete_rows(queryset):
+    """
+    Delete the rows of `queryset` with a single DELETE ... WHERE pk IN
+    (subquery): nothing is loaded, cascaded or signalled
+    """
+    meta = queryset.model._meta
+    connection = connections[queryset.db]
+    quote = connection.ops.quote_name
+    # Compiled for the queryset's own database, not the default one
+    subquery, params = queryset.values('pk').query.get_compiler(queryset.db).as_sql()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(meta.db_table)} WHERE {quote(meta.pk.column)} IN ({subquery})', params
+        )
+        return cursor.rowcount
+
+
+def prune_academic_years(keep=None, dry_run=False):
+    """
+    Delete expired academic years with everything under them, using a
+    fixed number of set-based statements however many courses and notes
+    are involved. Returns counts of what was (or would be) deleted.
+    """
+    keep = keep if keep is not None else academic_years_to_keep()
+    years = list(expired_academic_years(keep).values_list('pk', 'course_id'))
+    year_ids = [pk for pk, _ in years]
+    course_ids = {course_id for _, course_id in years}
+
+    year_levels = YearLevel.objects.filter(academic_year__in=year_ids)
+    semesters = Semester.objects.filter(year_level__academic_year__in=year_ids)
+    notes = Note.objects.filter(semester__year_level__academic_year__in=year_ids)
+    report = {
+        'courses': len(course_ids),
+        'academic_years': len(year_ids),
+        'year_levels': year_levels.count(),
+        'semesters': semesters.count(),
+        'notes': notes.count(),
+    }
+    if dry_run or not year_ids:
+        return report
+
+    with transaction.atomic():
+        rows = list(notes.values_list(
+            'id', 'blob_id', 'file', 'preview_file', 'note_type', 'has_preview', 'is_premium'
+        ))
+        note_ids = [row[0] for row in rows]
+        current_years = AcademicYear.objects.filter(pk__in=year_ids, is_current=True).count()
+
+        # Rows that point at the notes go first (the cascade is done by hand so
+        # no per-row signals run; their side effects are applied in bulk below)
+        Payment.objects.filter(note__in=note_ids).delete()
+        StudentAccess.objects.filter(note__in=note_ids).delete()
+        UploadSession.objects.filter(note__in=note_ids).update(note=None)
+        sessions = UploadSession.objects.filter(semester__in=semesters)
+        staged = list(sessions.values_list('file_name', flat=True))
+        sessions.delete()
+
+        delete_rows(notes)
+        delete_rows(semesters)
+        delete_rows(year_levels)
+        delete_rows(AcademicYear.objects.filter(pk__in=year_ids))
+
+        release_blobs(Counter(row[1] for row in rows if row[1]))
+        deltas = Counter({'current_academic_years': -current_years})
+        for _, blob_id, file_name, preview_name, note_type, has_preview, is_premium in rows:
+            deltas.update(stats.note_delta(stats.note_contribution(note_type, has_preview, is_premium), None))
+            if file_name and not blob_id:
+                transaction.on_commit(lambda name=file_name: delete_later(name))
+            if preview_name:
+                transaction.on_commit(lambda name=preview_name: delete_later(name))
+        # Chunks of uploads into the pruned semesters
+        for name in staged:
+            transaction.on_commit(lambda name=name: delete_later(name))
+        if note_ids:
+            remove_notes(note_ids)
+            # No delete signals fired, so the in-memory indexes are rebuilt
+            fuzzy.rebuild_index()
+            suggest.rebuild_index()
+        stats.adjust_counters(deltas)
+        for course_id in course_ids:
+            transaction.on_commit(lambda course_id=course_id: invalidate_course_tree(course_id))
+
+    return report
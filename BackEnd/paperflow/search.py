@@ -0,0 +1,235 @@
+# search.py - Ranked full-text search over notes
+import bisect
+import math
+import re
+from collections import Counter, defaultdict
+
+from django.db import connection
+from django.db.models import Case, When, Value, IntegerField, FloatField
+from django.db.models.expressions import RawSQL
+
+from .cache import ProcessSnapshot, bump_generation
+from .models import Note
+
+
+FTS_TABLE = 'paperflow_note_fts'
+SEARCH_SCOPE = 'search-index'
+
+# Relative weight of each indexed column: title, description, course, faculty
+FIELD_WEIGHTS = (10.0, 1.0, 5.0, 3.0)
+
+# The pure-Python backend ranks in memory and hands the top hits to SQL
+MEMORY_RESULT_LIMIT = 1000
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+def note_documents(queryset=None):
+    """Yield (note_id, title, description, course, faculty) rows for indexing"""
+    if queryset is None:
+        queryset = Note.objects.all()
+    rows = queryset.values_list(
+        'id', 'title', 'description',
+        'semester__year_level__academic_year__course__code',
+        'semester__year_level__academic_year__course__name',
+        'semester__year_level__academic_year__course__faculty__code',
+        'semester__year_level__academic_year__course__faculty__name',
+    ).order_by()
+    for note_id, title, description, course_code, course_name, faculty_code, faculty_name in rows.iterator():
+        yield (
+            note_id,
+            title,
+            description or '',
+            f'{course_code} {course_name}',
+            f'{faculty_code} {faculty_name}',
+        )
+
+
+def no_matches(queryset):
+    # Still carries search_rank, so ordering and paging by it stay valid
+    return queryset.annotate(search_rank=Value(0.0, output_field=FloatField())).none()
+
+
+class FTS5Search:
+    """SQLite FTS5 index, ranked with bm25() and joined to the notes query"""
+
+    name = 'fts5'
+
+    def match_expression(self, query):
+        # Quote every token (FTS5 syntax stays out of user input) and prefix-match it
+        return ' '.join(f'"{token}"*' for token in tokenize(query))
+
+    def search(self, queryset, query):
+        expression = self.match_expression(query)
+        if not expression:
+            return no_matches(queryset)
+        weights = ', '.join(str(weight) for weight in FIELD_WEIGHTS)
+        # The rank is an annotation (not an extra select) so pages can filter on it
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = paperflow_note.id', f'{FTS_TABLE} MATCH %s'],
+            params=[expression],
+        ).annotate(
+            search_rank=RawSQL(f'bm25({FTS_TABLE}, {weights})', (), output_field=FloatField())
+        ).order_by('search_rank', '-uploaded_at', '-id')
+
+    def index(self, documents):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT OR REPLACE INTO {FTS_TABLE} (rowid, title, description, course, faculty) '
+                f'VALUES (%s, %s, %s, %s, %s)',
+                list(documents)
+            )
+
+    def remove(self, note_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(note_id,) for note_id in note_ids]
+            )
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        self.index(note_documents())
+
+
+class InvertedIndex:
+    """In-memory BM25 index with prefix lookups over a sorted term list"""
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self):
+        self.postings = defaultdict(dict)   # term -> {note_id: weighted term frequency}
+        self.doc_terms = {}                 # note_id -> Counter of weighted terms
+        self.doc_length = {}
+        self.total_length = 0.0
+        self.terms = []                     # sorted, for prefix matching
+
+    def add(self, note_id, *fields):
+        self.discard(note_id)
+        weighted = Counter()
+        for text, weight in zip(fields, FIELD_WEIGHTS):
+            for token in tokenize(text):
+                weighted[token] += weight
+        for term, frequency in weighted.items():
+            if term not in self.postings:
+                bisect.insort(self.terms, term)
+            self.postings[term][note_id] = frequency
+        self.doc_terms[note_id] = weighted
+        self.doc_length[note_id] = sum(weighted.values())
+        self.total_length += self.doc_length[note_id]
+
+    def discard(self, note_id):
+        weighted = self.doc_terms.pop(note_id, None)
+        if weighted is None:
+            return
+        for term in weighted:
+            postings = self.postings[term]
+            postings.pop(note_id, None)
+            if not postings:
+                del self.postings[term]
+                self.terms.pop(bisect.bisect_left(self.terms, term))
+        self.total_length -= self.doc_length.pop(note_id)
+
+    def expand(self, token):
+        start = bisect.bisect_left(self.terms, token)
+        end = bisect.bisect_left(self.terms, token + '\uffff')
+        return self.terms[start:end]
+
+    def search(self, query):
+        """Return {note_id: score} for notes matching every (prefix) token"""
+        tokens = tokenize(query)
+        if not tokens or not self.doc_terms:
+            return {}
+        doc_count = len(self.doc_terms)
+        average_length = self.total_length / doc_count
+        scores = None
+        for token in tokens:
+            token_scores = defaultdict(float)
+            for term in self.expand(token):
+                postings = self.postings[term]
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for note_id, frequency in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self.doc_length[note_id] / average_length)
+                    token_scores[note_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {note_id: score + token_scores[note_id]
+                          for note_id, score in scores.items() if note_id in token_scores}
+            if not scores:
+                return {}
+        return scores
+
+
+def _build_inverted_index():
+    index = InvertedIndex()
+    for document in note_documents():
+        index.add(*document)
+    return index
+
+
+def apply_changes(index, changes):
+    """Replay published ('index', documents) and ('discard', note ids) changes"""
+    for action, items in changes:
+        for item in items:
+            if action == 'index':
+                index.add(*item)
+            else:
+                index.discard(item)
+
+
+class MemorySearch:
+    """Pure-Python fallback for databases without FTS5"""
+
+    name = 'memory'
+
+    def __init__(self):
+        self.snapshot = ProcessSnapshot(SEARCH_SCOPE, _build_inverted_index, apply_changes, background=True)
+
+    def search(self, queryset, query):
+        scores = self.snapshot.get().search(query)
+        ranked = sorted(scores, key=scores.get, reverse=True)[:MEMORY_RESULT_LIMIT]
+        if not ranked:
+            return no_matches(queryset)
+        return queryset.filter(id__in=ranked).annotate(
+            search_rank=Case(
+                *[When(id=note_id, then=Value(position)) for position, note_id in enumerate(ranked)],
+                output_field=IntegerField()
+            )
+        ).order_by('search_rank', '-uploaded_at', '-id')
+
+    def index(self, documents):
+        self.snapshot.publish_on_commit(('index', list(documents)))
+
+    def remove(self, note_ids):
+        self.snapshot.publish_on_commit(('discard', list(note_ids)))
+
+    def rebuild(self):
+        # Every worker (this one included) reloads once it sees the new stamp
+        bump_generation(SEARCH_SCOPE)
+
+
+_backend = None
+
+
+def get_search_backend():
+    global _backend
+    if _backend is None:
+        with connection.cursor() as cursor:
+            tables = connection.introspection.table_names(cursor)
+        _backend = FTS5Search() if FTS_TABLE in tables else MemorySearch()
+    return _backend
+
+
+def index_notes(queryset):
+    get_search_backend().index(note_documents(queryset))
+
+
+def remove_notes(note_ids):
+    get_search_backend().remove(note_ids)
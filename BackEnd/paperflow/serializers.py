@@ -2,20 +2,27 @@
 from rest_framework import serializers
 from .models import (
     Student, SiteSettings, AboutUs, HowItWorks, Faculty, Course,
-    AcademicYear, YearLevel, Semester, Note, Payment, StudentAccess
+    AcademicYear, YearLevel, Semester, Note, Payment, StudentAccess, UploadSession
 )
+from .site import get_pricing
+from .uploads import max_chunk_size
+from .variants import image_srcset
 
 
 class SiteSettingsSerializer(serializers.ModelSerializer):
     site_logo = serializers.SerializerMethodField()
     backgroundimage = serializers.SerializerMethodField()
     backgroundimage2 = serializers.SerializerMethodField()
+    site_logo_srcset = serializers.SerializerMethodField()
+    backgroundimage_srcset = serializers.SerializerMethodField()
+    backgroundimage2_srcset = serializers.SerializerMethodField()
     
     class Meta:
         model = SiteSettings
         fields = [
             'id', 'site_name', 'site_logo', 'welcomemsg', 'backgroundimage', 
-            'backgroundimage2', 'contact_email', 'instagram_url', 'twitter_url',
+            'backgroundimage2', 'site_logo_srcset', 'backgroundimage_srcset',
+            'backgroundimage2_srcset', 'contact_email', 'instagram_url', 'twitter_url',
             'linkedin_url', 'telegram_url', 'whatsapp_number', 'facebook_url',
             'view_price', 'download_price', 'enable_payments', 'created_at', 'updated_at'
         ]
@@ -40,6 +47,16 @@ class SiteSettingsSerializer(serializers.ModelSerializer):
             if request:
                 return request.build_absolute_uri(obj.backgroundimage2.url)
         return None
+    
+    # Resized WebP/AVIF copies ({format: srcset}); null until rendered in the background
+    def get_site_logo_srcset(self, obj):
+        return image_srcset(obj.site_logo, self.context.get('request'))
+    
+    def get_backgroundimage_srcset(self, obj):
+        return image_srcset(obj.backgroundimage, self.context.get('request'))
+    
+    def get_backgroundimage2_srcset(self, obj):
+        return image_srcset(obj.backgroundimage2, self.context.get('request'))
 
 
 class StudentSerializer(serializers.ModelSerializer):
@@ -54,13 +71,14 @@ class StudentSerializer(serializers.ModelSerializer):
 
 class AboutUsSerializer(serializers.ModelSerializer):
     image = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
     team_members_list = serializers.SerializerMethodField()
     
     class Meta:
         model = AboutUs
         fields = [
             'id', 'title', 'subtitle', 'description', 'mission', 'vision',
-            'history', 'image', 'team_members', 'team_members_list', 'website',
+            'history', 'image', 'image_srcset', 'team_members', 'team_members_list', 'website',
             'created_at', 'updated_at'
         ]
     
@@ -71,6 +89,9 @@ class AboutUsSerializer(serializers.ModelSerializer):
                 return request.build_absolute_uri(obj.image.url)
         return None
     
+    def get_image_srcset(self, obj):
+        return image_srcset(obj.image, self.context.get('request'))
+    
     def get_team_members_list(self, obj):
         if obj.team_members:
             return [name.strip() for name in obj.team_members.split(',') if name.strip()]
@@ -79,12 +100,13 @@ class AboutUsSerializer(serializers.ModelSerializer):
 
 class HowItWorksSerializer(serializers.ModelSerializer):
     image = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
     
     class Meta:
         model = HowItWorks
         fields = [
             'id', 'step_number', 'step_title', 'description', 'image',
-            'created_at', 'updated_at'
+            'image_srcset', 'created_at', 'updated_at'
         ]
     
     def get_image(self, obj):
@@ -93,6 +115,9 @@ class HowItWorksSerializer(serializers.ModelSerializer):
             if request:
                 return request.build_absolute_uri(obj.image.url)
         return None
+    
+    def get_image_srcset(self, obj):
+        return image_srcset(obj.image, self.context.get('request'))
 
 
 class FacultyListSerializer(serializers.ModelSerializer):
@@ -223,14 +248,14 @@ class NoteWithAccessSerializer(serializers.ModelSerializer):
         """
     
     def get_access_info(self, obj):
-        site_settings = SiteSettings.objects.first()
+        pricing = get_pricing()
         
         return {
             'is_free_trial': True,
             'trial_message': 'Currently in free trial - all content viewable, downloads coming soon!',
-            'view_price': float(site_settings.view_price) if site_settings else 500.0,
-            'download_price': float(site_settings.download_price) if site_settings else 1000.0,
-            'payments_enabled': site_settings.enable_payments if site_settings else False
+            'view_price': float(pricing['view_price']),
+            'download_price': float(pricing['download_price']),
+            'payments_enabled': pricing['payments_enabled']
         }
 
 
@@ -281,19 +306,22 @@ class YearLevelWithCoursesSerializer(serializers.ModelSerializer):
         if not year:
             return []
         
-        try:
-            academic_year = obj.academic_years.get(year=year)
-            year_levels = academic_year.year_levels.all()
+        # Views can prefetch the matching academic year to avoid two queries per course
+        if hasattr(obj, 'selected_academic_years'):
+            academic_years = obj.selected_academic_years
+        else:
+            academic_years = obj.academic_years.filter(year=year).prefetch_related('year_levels')
+        
+        for academic_year in academic_years:
             return [
                 {
                     'id': yl.id,
                     'level': yl.level,
                     'name': yl.name
                 }
-                for yl in year_levels
+                for yl in academic_year.year_levels.all()
             ]
-        except AcademicYear.DoesNotExist:
-            return []
+        return []
 
 
 class DashboardSerializer(serializers.ModelSerializer):
@@ -424,6 +452,24 @@ class SearchResultSerializer(serializers.ModelSerializer):
         }
 
 
+def validate_note_file(name, size):
+    """Upload rules shared by single-request and chunked uploads"""
+    # Validate file size (max 50MB)
+    max_size = 50 * 1024 * 1024  # 50MB
+    if size > max_size:
+        raise serializers.ValidationError(
+            f"File size cannot exceed 50MB. Current size: {size / (1024*1024):.2f}MB"
+        )
+    
+    # Validate file type
+    allowed_extensions = ['.pdf', '.doc', '.docx', '.ppt', '.pptx', '.txt']
+    file_extension = name.lower().split('.')[-1]
+    if f'.{file_extension}' not in allowed_extensions:
+        raise serializers.ValidationError(
+            f"File type .{file_extension} not allowed. Allowed types: {', '.join(allowed_extensions)}"
+        )
+
+
 class NoteUploadSerializer(serializers.ModelSerializer):
     class Meta:
         model = Note
@@ -432,24 +478,45 @@ class NoteUploadSerializer(serializers.ModelSerializer):
         ]
     
     def validate_file(self, value):
-        # Validate file size (max 50MB)
-        max_size = 50 * 1024 * 1024  # 50MB
-        if value.size > max_size:
-            raise serializers.ValidationError(
-                f"File size cannot exceed 50MB. Current size: {value.size / (1024*1024):.2f}MB"
-            )
-        
-        # Validate file type
-        allowed_extensions = ['.pdf', '.doc', '.docx', '.ppt', '.pptx', '.txt']
-        file_extension = value.name.lower().split('.')[-1]
-        if f'.{file_extension}' not in allowed_extensions:
-            raise serializers.ValidationError(
-                f"File type .{file_extension} not allowed. Allowed types: {', '.join(allowed_extensions)}"
-            )
-        
+        validate_note_file(value.name, value.size)
         return value
 
 
+class UploadSessionSerializer(serializers.ModelSerializer):
+    """Starts a resumable chunked upload (the Note is created on finalize)"""
+    upload_url = serializers.SerializerMethodField()
+    finalize_url = serializers.SerializerMethodField()
+    chunk_size = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = UploadSession
+        fields = [
+            'id', 'title', 'description', 'note_type', 'semester', 'is_premium',
+            'filename', 'total_size', 'received_bytes', 'is_complete',
+            'chunk_size', 'upload_url', 'finalize_url', 'created_at'
+        ]
+        read_only_fields = ['received_bytes', 'is_complete', 'created_at']
+    
+    def validate(self, attrs):
+        validate_note_file(attrs['filename'], attrs['total_size'])
+        return attrs
+    
+    def get_upload_url(self, obj):
+        request = self.context.get('request')
+        if request:
+            return request.build_absolute_uri(f'/api/notes/uploads/{obj.id}/')
+        return None
+    
+    def get_finalize_url(self, obj):
+        request = self.context.get('request')
+        if request:
+            return request.build_absolute_uri(f'/api/notes/uploads/{obj.id}/finalize/')
+        return None
+    
+    def get_chunk_size(self, obj):
+        return max_chunk_size()
+
+
 # Payment System Serializers (for future use)
 class PaymentSerializer(serializers.ModelSerializer):
     student_name = serializers.CharField(source='student.full_name', read_only=True)
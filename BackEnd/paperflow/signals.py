@@ -0,0 +1,372 @@
+# signals.py - Keeps cached catalog data in step with model changes
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import SiteSettings, AboutUs, HowItWorks, Faculty, Course, AcademicYear, YearLevel, Semester, Note
+from .cache import (
+    bump_generation, invalidate_course_tree,
+    SITE_SETTINGS_SCOPE, ABOUT_US_SCOPE, HOW_IT_WORKS_SCOPE
+)
+from .hierarchy import HIERARCHY_SCOPE, note_hierarchy_keys, sync_note_hierarchy
+from . import stats
+from .search import index_notes, remove_notes
+from . import fuzzy, suggest
+from .blobs import release_blob
+from .reaper import delete_later
+from .variants import schedule_variants
+
+
+# Counter-only saves (view/download tracking) must not throw away cached trees,
+# so the counts inside a cached course tree are served stale until something
+# else retires it (at most COURSE_TREE_TIMEOUT)
+COUNTER_FIELDS = {'view_count', 'download_count'}
+
+# How each level below a course reaches it, to find the course a row is moved away from
+COURSE_PATHS = {
+    AcademicYear: 'course_id',
+    YearLevel: 'academic_year__course_id',
+    Semester: 'year_level__academic_year__course_id',
+}
+
+
+def _invalidate_on_commit(course_id):
+    transaction.on_commit(lambda: invalidate_course_tree(course_id))
+
+
+def _bump_on_commit(scope):
+    transaction.on_commit(lambda: bump_generation(scope))
+
+
+def _variants_on_commit(instance):
+    transaction.on_commit(lambda: schedule_variants(instance))
+
+
+@receiver(post_save, sender=SiteSettings)
+@receiver(post_delete, sender=SiteSettings)
+def site_settings_changed(sender, instance, **kwargs):
+    _bump_on_commit(SITE_SETTINGS_SCOPE)
+
+
+@receiver(post_save, sender=AboutUs)
+@receiver(post_delete, sender=AboutUs)
+def about_us_changed(sender, instance, **kwargs):
+    _bump_on_commit(ABOUT_US_SCOPE)
+
+
+@receiver(post_save, sender=HowItWorks)
+@receiver(post_delete, sender=HowItWorks)
+def how_it_works_changed(sender, instance, **kwargs):
+    _bump_on_commit(HOW_IT_WORKS_SCOPE)
+
+
+@receiver(post_save, sender=Faculty)
+@receiver(post_delete, sender=Faculty)
+def faculty_changed(sender, instance, **kwargs):
+    _bump_on_commit(HIERARCHY_SCOPE)
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def course_changed(sender, instance, **kwargs):
+    _bump_on_commit(HIERARCHY_SCOPE)
+    _invalidate_on_commit(instance.pk)
+
+
+def _invalidate_previous_course(instance, course_id):
+    # Set by remember_course / remember_note_course; a move retires both trees
+    previous = getattr(instance, '_previous_course_id', None)
+    if previous and previous != course_id:
+        _invalidate_on_commit(previous)
+
+
+@receiver(pre_save, sender=AcademicYear)
+@receiver(pre_save, sender=YearLevel)
+@receiver(pre_save, sender=Semester)
+def remember_course(sender, instance, **kwargs):
+    instance._previous_course_id = sender.objects.filter(pk=instance.pk).values_list(
+        COURSE_PATHS[sender], flat=True
+    ).first() if instance.pk else None
+
+
+@receiver(post_save, sender=AcademicYear)
+@receiver(post_delete, sender=AcademicYear)
+def academic_year_changed(sender, instance, **kwargs):
+    _invalidate_on_commit(instance.course_id)
+    _invalidate_previous_course(instance, instance.course_id)
+
+
+@receiver(post_save, sender=YearLevel)
+@receiver(post_delete, sender=YearLevel)
+def year_level_changed(sender, instance, **kwargs):
+    course_id = AcademicYear.objects.filter(
+        pk=instance.academic_year_id
+    ).values_list('course_id', flat=True).first()
+    _invalidate_on_commit(course_id)
+    _invalidate_previous_course(instance, course_id)
+
+
+@receiver(post_save, sender=Semester)
+@receiver(post_delete, sender=Semester)
+def semester_changed(sender, instance, **kwargs):
+    course_id = YearLevel.objects.filter(
+        pk=instance.year_level_id
+    ).values_list('academic_year__course_id', flat=True).first()
+    _invalidate_on_commit(course_id)
+    _invalidate_previous_course(instance, course_id)
+
+
+@receiver(pre_save, sender=Note)
+def remember_note_course(sender, instance, **kwargs):
+    # The denormalized key as loaded, before copy_note_hierarchy points it at the new semester's course
+    instance._previous_course_id = instance.course_id if instance.pk else None
+
+
+@receiver(post_save, sender=Note)
+@receiver(post_delete, sender=Note)
+def note_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= COUNTER_FIELDS:
+        return
+    course_id = instance.course_id or Semester.objects.filter(
+        pk=instance.semester_id
+    ).values_list('year_level__academic_year__course_id', flat=True).first()
+    _invalidate_on_commit(course_id)
+    _invalidate_previous_course(instance, course_id)
+
+
+# Statistics counters
+
+@receiver(post_save, sender=Faculty)
+def count_new_faculty(sender, instance, created, **kwargs):
+    if created:
+        stats.adjust_counters({'total_faculties': 1})
+
+
+@receiver(post_delete, sender=Faculty)
+def uncount_faculty(sender, instance, **kwargs):
+    stats.adjust_counters({'total_faculties': -1})
+
+
+@receiver(post_save, sender=Course)
+def count_new_course(sender, instance, created, **kwargs):
+    if created:
+        stats.adjust_counters({'total_courses': 1})
+
+
+@receiver(post_delete, sender=Course)
+def uncount_course(sender, instance, **kwargs):
+    stats.adjust_counters({'total_courses': -1})
+
+
+@receiver(post_save, sender=AcademicYear)
+@receiver(post_delete, sender=AcademicYear)
+def count_current_years(sender, instance, **kwargs):
+    # AcademicYear.save flips is_current on siblings with a queryset update that
+    # sends no signals, so this (small) counter is recounted instead
+    stats.set_counter(
+        'current_academic_years', AcademicYear.objects.filter(is_current=True).count()
+    )
+
+
+@receiver(pre_save, sender=Note)
+def remember_note_counts(sender, instance, update_fields=None, **kwargs):
+    instance._counted_as = None
+    if not instance.pk:
+        return
+    if update_fields is not None and not stats.NOTE_COUNTER_FIELDS & set(update_fields):
+        return
+    previous = Note.objects.filter(pk=instance.pk).values(*stats.NOTE_COUNTER_FIELDS).first()
+    if previous:
+        instance._counted_as = stats.note_contribution(**previous)
+
+
+@receiver(post_save, sender=Note)
+def count_note(sender, instance, created, update_fields=None, **kwargs):
+    if not created and getattr(instance, '_counted_as', None) is None:
+        return
+    after = stats.note_contribution(instance.note_type, instance.has_preview, instance.is_premium)
+    stats.adjust_counters(stats.note_delta(instance._counted_as, after))
+
+
+@receiver(post_delete, sender=Note)
+def uncount_note(sender, instance, **kwargs):
+    before = stats.note_contribution(instance.note_type, instance.has_preview, instance.is_premium)
+    stats.adjust_counters(stats.note_delta(before, None))
+
+
+# Search index
+
+@receiver(post_save, sender=Note)
+def index_note(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= COUNTER_FIELDS:
+        return
+    index_notes(Note.objects.filter(pk=instance.pk))
+
+
+@receiver(post_delete, sender=Note)
+def unindex_note(sender, instance, **kwargs):
+    remove_notes([instance.pk])
+
+
+@receiver(post_save, sender=Course)
+def reindex_course_notes(sender, instance, created, **kwargs):
+    if not created:
+        index_notes(Note.objects.filter(course=instance))
+
+
+@receiver(post_save, sender=Faculty)
+def reindex_faculty_notes(sender, instance, created, **kwargs):
+    if not created:
+        index_notes(Note.objects.filter(faculty=instance))
+
+
+# Typo-tolerant vocabulary (note titles, course and faculty codes and names)
+
+@receiver(pre_save, sender=Note)
+@receiver(pre_save, sender=Course)
+@receiver(pre_save, sender=Faculty)
+def remember_vocabulary_text(sender, instance, update_fields=None, **kwargs):
+    instance._stored_text = None
+    if not instance.pk:
+        return
+    if update_fields is not None and not set(fuzzy.INDEXED_FIELDS[sender]) & set(update_fields):
+        return
+    instance._stored_text = fuzzy.stored_text(sender, instance.pk)
+
+
+@receiver(post_save, sender=Note)
+@receiver(post_save, sender=Course)
+@receiver(post_save, sender=Faculty)
+def update_vocabulary(sender, instance, created, **kwargs):
+    text = fuzzy.indexed_text(instance)
+    if created:
+        fuzzy.update_index(added=[text])
+        return
+    previous = getattr(instance, '_stored_text', None)
+    if previous is not None and previous != text:
+        fuzzy.update_index(removed=[previous], added=[text])
+
+
+@receiver(post_delete, sender=Note)
+@receiver(post_delete, sender=Course)
+@receiver(post_delete, sender=Faculty)
+def remove_vocabulary(sender, instance, **kwargs):
+    fuzzy.update_index(removed=[fuzzy.indexed_text(instance)])
+
+
+# Search-as-you-type completions (notes patched in place, hierarchy changes rebuild)
+
+@receiver(post_save, sender=Note)
+def update_note_suggestions(sender, instance, created, **kwargs):
+    if created:
+        suggest.update_notes(added=[instance])
+        return
+    # The title before this save, remembered by remember_vocabulary_text
+    previous = getattr(instance, '_stored_text', None)
+    if previous is not None and previous != instance.title:
+        suggest.update_notes(removed=[(instance.pk, previous)], added=[instance])
+
+
+@receiver(post_delete, sender=Note)
+def remove_note_suggestion(sender, instance, **kwargs):
+    suggest.update_notes(removed=[(instance.pk, instance.title)])
+
+
+@receiver(pre_save, sender=Course)
+@receiver(pre_save, sender=Faculty)
+def remember_suggested_fields(sender, instance, **kwargs):
+    instance._suggested = suggest.stored_fields(sender, instance.pk) if instance.pk else None
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_save, sender=Faculty)
+def rebuild_changed_suggestions(sender, instance, created, **kwargs):
+    # Saves that leave every indexed field alone keep the index
+    if created or getattr(instance, '_suggested', None) != suggest.indexed_fields(instance):
+        suggest.rebuild_index()
+
+
+@receiver(post_delete, sender=Course)
+@receiver(post_delete, sender=Faculty)
+def rebuild_suggestions(sender, instance, **kwargs):
+    suggest.rebuild_index()
+
+
+# Hierarchy keys copied onto notes
+
+@receiver(pre_save, sender=Note)
+def copy_note_hierarchy(sender, instance, update_fields=None, **kwargs):
+    # Partial saves that leave the semester alone keep their keys
+    if update_fields is not None:
+        return
+    for field, value in note_hierarchy_keys(instance.semester_id).items():
+        setattr(instance, field, value)
+
+
+@receiver(post_save, sender=Note)
+def move_note_hierarchy(sender, instance, update_fields=None, **kwargs):
+    # update_fields is fixed before pre_save runs, so a partial save that
+    # moves the note cannot carry its new keys along
+    if update_fields is None or 'semester' not in update_fields:
+        return
+    keys = note_hierarchy_keys(instance.semester_id)
+    Note.objects.filter(pk=instance.pk).update(**keys)
+    for field, value in keys.items():
+        setattr(instance, field, value)
+    _invalidate_on_commit(keys.get('course_id'))
+
+
+@receiver(post_save, sender=Faculty)
+def sync_faculty_notes(sender, instance, created, **kwargs):
+    if not created:
+        sync_note_hierarchy(Note.objects.filter(faculty=instance))
+
+
+@receiver(post_save, sender=Course)
+def sync_course_notes(sender, instance, created, **kwargs):
+    if not created:
+        sync_note_hierarchy(Note.objects.filter(course=instance))
+
+
+@receiver(post_save, sender=AcademicYear)
+def sync_academic_year_notes(sender, instance, created, **kwargs):
+    if not created:
+        sync_note_hierarchy(Note.objects.filter(semester__year_level__academic_year=instance))
+
+
+@receiver(post_save, sender=YearLevel)
+def sync_year_level_notes(sender, instance, created, **kwargs):
+    if not created:
+        sync_note_hierarchy(Note.objects.filter(semester__year_level=instance))
+
+
+@receiver(post_save, sender=Semester)
+def sync_semester_notes(sender, instance, created, **kwargs):
+    if not created:
+        sync_note_hierarchy(Note.objects.filter(semester=instance))
+
+
+# Stored files
+
+@receiver(post_delete, sender=Note)
+def release_note_files(sender, instance, **kwargs):
+    # Runs for cascades and bulk deletes too, not only NoteDeleteAPIView;
+    # the files themselves are removed by the background reaper
+    if instance.blob_id:
+        release_blob(instance.blob_id)
+    elif instance.file:
+        # Notes uploaded before the blob store own their file outright
+        name = instance.file.name
+        transaction.on_commit(lambda: delete_later(name))
+    if instance.preview_file:
+        preview_name = instance.preview_file.name
+        transaction.on_commit(lambda: delete_later(preview_name))
+
+
+# Responsive image variants (the renderer skips images it has already seen)
+
+@receiver(post_save, sender=SiteSettings)
+@receiver(post_save, sender=AboutUs)
+@receiver(post_save, sender=HowItWorks)
+def render_image_variants(sender, instance, **kwargs):
+    _variants_on_commit(instance)
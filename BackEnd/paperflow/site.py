@@ -0,0 +1,27 @@
+# site.py - Process-wide SiteSettings snapshot and pricing
+from decimal import Decimal
+
+from .cache import ProcessSnapshot, SITE_SETTINGS_SCOPE
+from .models import SiteSettings
+
+
+DEFAULT_VIEW_PRICE = Decimal('500.00')
+DEFAULT_DOWNLOAD_PRICE = Decimal('1000.00')
+
+
+# Loaded once per worker and reloaded only after SiteSettings changes
+site_settings = ProcessSnapshot(SITE_SETTINGS_SCOPE, lambda: SiteSettings.objects.first())
+
+
+def get_site_settings():
+    """Return the SiteSettings row (or None) without querying on every call"""
+    return site_settings.get()
+
+
+def get_pricing():
+    settings = get_site_settings()
+    return {
+        'view_price': settings.view_price if settings else DEFAULT_VIEW_PRICE,
+        'download_price': settings.download_price if settings else DEFAULT_DOWNLOAD_PRICE,
+        'payments_enabled': settings.enable_payments if settings else False,
+    }
@@ -0,0 +1,96 @@
+# stats.py - Incrementally maintained catalog statistics
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from .models import Faculty, Course, AcademicYear, Note, StatCounter
+
+
+NOTE_COUNTER_FIELDS = {'note_type', 'has_preview', 'is_premium'}
+
+
+def note_type_counter(note_type):
+    return f'notes_by_type:{note_type}'
+
+
+def compute_totals():
+    """Count every statistic from scratch"""
+    note_totals = Note.objects.aggregate(
+        total=Count('id'),
+        previews=Count('id', filter=Q(has_preview=True)),
+        premium=Count('id', filter=Q(is_premium=True)),
+    )
+    totals = {
+        'total_faculties': Faculty.objects.count(),
+        'total_courses': Course.objects.count(),
+        'total_notes': note_totals['total'],
+        'current_academic_years': AcademicYear.objects.filter(is_current=True).count(),
+        'total_previews': note_totals['previews'],
+        'premium_notes': note_totals['premium'],
+    }
+    for note_type, _ in Note.NOTE_TYPES:
+        totals[note_type_counter(note_type)] = 0
+    for row in Note.objects.values('note_type').annotate(count=Count('id')).order_by():
+        totals[note_type_counter(row['note_type'])] = row['count']
+    return totals
+
+
+def rebuild_counters():
+    totals = compute_totals()
+    with transaction.atomic():
+        for name, value in totals.items():
+            StatCounter.objects.update_or_create(name=name, defaults={'value': value})
+        StatCounter.objects.exclude(name__in=totals).delete()
+    return totals
+
+
+def adjust_counters(deltas):
+    """Apply counter deltas atomically; missing rows trigger a full rebuild"""
+    with transaction.atomic():
+        for name, delta in deltas.items():
+            if not delta:
+                continue
+            updated = StatCounter.objects.filter(name=name).update(value=F('value') + delta)
+            if not updated:
+                rebuild_counters()
+                return
+
+
+def set_counter(name, value):
+    StatCounter.objects.update_or_create(name=name, defaults={'value': value})
+
+
+def note_contribution(note_type, has_preview, is_premium):
+    return {
+        'total_notes': 1,
+        note_type_counter(note_type): 1,
+        'total_previews': int(bool(has_preview)),
+        'premium_notes': int(bool(is_premium)),
+    }
+
+
+def note_delta(before, after):
+    """Difference between two note contributions (either side may be None)"""
+    deltas = {}
+    for contribution, sign in ((after, 1), (before, -1)):
+        for name, value in (contribution or {}).items():
+            deltas[name] = deltas.get(name, 0) + sign * value
+    return deltas
+
+
+def get_statistics():
+    """All counters in a single query"""
+    counters = dict(StatCounter.objects.values_list('name', 'value'))
+    if not counters:
+        counters = rebuild_counters()
+    return {
+        'total_faculties': counters.get('total_faculties', 0),
+        'total_courses': counters.get('total_courses', 0),
+        'total_notes': counters.get('total_notes', 0),
+        'current_academic_years': counters.get('current_academic_years', 0),
+        'notes_by_type': {
+            note_type: counters.get(note_type_counter(note_type), 0)
+            for note_type, _ in Note.NOTE_TYPES
+        },
+        'total_previews': counters.get('total_previews', 0),
+        'premium_notes': counters.get('premium_notes', 0),
+    }
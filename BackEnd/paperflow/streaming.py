@@ -0,0 +1,137 @@
+# streaming.py - File downloads with Range support and proxy offload
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def parse_range(header, size):
+    """
+    Parse a single-range `Range` header against a file size.
+    Returns (start, end) inclusive, None to serve the whole file (absent,
+    malformed or multi-range headers), or False when unsatisfiable.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if not length:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+def _range_still_valid(request, etag, last_modified):
+    # If-Range only honours the Range header while the representation is unchanged
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _offload(storage_name, path, filename, as_attachment):
+    """Build an X-Accel-Redirect / X-Sendfile response when a front proxy serves files"""
+    backend = getattr(settings, 'PAPERFLOW_SENDFILE_BACKEND', None)
+    if backend == 'nginx':
+        prefix = getattr(settings, 'PAPERFLOW_SENDFILE_URL_PREFIX', '/protected-media/')
+        response = HttpResponse()
+        response['X-Accel-Redirect'] = prefix + quote(storage_name)
+    elif backend in ('apache', 'lighttpd'):
+        response = HttpResponse()
+        response['X-Sendfile'] = path
+    else:
+        return None
+    # The proxy keeps the headers set here, so they must describe the file
+    response['Content-Type'] = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+    return response
+
+
+def serve_file(request, file_field, filename=None, as_attachment=True, etag=None):
+    """
+    Stream a stored file with ETag/Last-Modified validation and single
+    byte-range support (206 / 416). Open-ended ranges and whole files are
+    handed to the WSGI server's file wrapper, which uses sendfile() where
+    the platform has it. With PAPERFLOW_SENDFILE_BACKEND set the transfer
+    is offloaded to the proxy entirely.
+    """
+    try:
+        path = file_field.path
+        stat = os.stat(path)
+    except (ValueError, FileNotFoundError):
+        # No file attached, or it is gone from storage
+        raise Http404("File not found")
+    size = stat.st_size
+    last_modified = int(stat.st_mtime)
+    etag = etag or '"%x-%x"' % (stat.st_mtime_ns, size)
+    filename = filename or os.path.basename(file_field.name)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        return response
+
+    response = _offload(file_field.name, path, filename, as_attachment)
+    if response is None:
+        byte_range = None
+        if _range_still_valid(request, etag, last_modified):
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+        if byte_range is None:
+            response = FileResponse(open(path, 'rb'), as_attachment=as_attachment, filename=filename)
+        else:
+            start, end = byte_range
+            length = end - start + 1
+            if end == size - 1:
+                # Runs to the end of the file, so the zero-copy path still applies
+                f = open(path, 'rb')
+                f.seek(start)
+                response = FileResponse(f, as_attachment=as_attachment, filename=filename, status=206)
+            else:
+                response = StreamingHttpResponse(_read_range(path, start, length), status=206)
+                response['Content-Type'] = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+            response['Content-Length'] = str(length)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+        response['Accept-Ranges'] = 'bytes'
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, max-age=86400'
+    return response
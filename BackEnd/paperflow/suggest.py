@@ -0,0 +1,210 @@
+# suggest.py - Search-as-you-type completions from an in-memory prefix index
+import bisect
+import heapq
+import itertools
+from array import array
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import Sum
+
+from .cache import ProcessSnapshot
+from .models import Faculty, Course, Note
+from .search import tokenize
+
+
+SUGGEST_SCOPE = 'suggest-index'
+
+# Entry kinds (kept in a byte array; 0 marks a removed entry)
+REMOVED, NOTE, COURSE, FACULTY = 0, 1, 2, 3
+KIND_NAMES = {NOTE: 'note', COURSE: 'course', FACULTY: 'faculty'}
+
+MAX_SUGGESTIONS = 10
+# Entries a lookup may examine before it settles for fewer than `limit` hits
+MAX_SCANNED = 2000
+# Earlier query words starting more words than this are checked against labels instead
+MAX_EXPANSIONS = 16
+
+
+class PrefixIndex:
+    """
+    Completion entries (note titles, courses, faculties) numbered in
+    descending weight, with a sorted array of every distinct word. Each word
+    maps to an ascending array('I') of the entries containing it, so the
+    first entries of a posting are its heaviest and a prefix lookup merges
+    postings lazily until it has enough hits.
+    """
+
+    def __init__(self):
+        self.kinds = array('B')       # entry -> kind
+        self.refs = array('I')        # entry -> note / course / faculty id
+        self.labels = []              # entry -> display text
+        self.links = {}               # entry -> extra response fields (courses and faculties)
+        self.words = []               # sorted distinct words
+        self.postings = {}            # word -> array('I') of entries, ascending
+
+    def add(self, kind, ref, label, link=None, keep_sorted=True):
+        """
+        Append an entry. Entries added after a build (new notes, which
+        start at zero views) go after the heavier ones already there.
+        Bulk loads pass keep_sorted=False and call sort_words() at the end.
+        """
+        entry = len(self.labels)
+        self.kinds.append(kind)
+        self.refs.append(ref)
+        self.labels.append(label)
+        if link:
+            self.links[entry] = link
+        for word in set(tokenize(label)):
+            postings = self.postings.get(word)
+            if postings is None:
+                postings = self.postings[word] = array('I')
+                if keep_sorted:
+                    bisect.insort(self.words, word)
+            postings.append(entry)
+        return entry
+
+    def sort_words(self):
+        self.words = sorted(self.postings)
+
+    def remove(self, kind, ref, label):
+        """Mark the entry of `ref` removed; `label` is the text it was indexed under"""
+        words = tokenize(label)
+        for entry in self.postings.get(words[0], ()) if words else ():
+            if self.kinds[entry] == kind and self.refs[entry] == ref:
+                self.kinds[entry] = REMOVED
+                return
+
+    def complete(self, query, limit=MAX_SUGGESTIONS):
+        """
+        Entries containing every word of `query`, heaviest first. The last
+        word is matched as a prefix; so are earlier words that are not
+        whole words of the index ("intro prog").
+        """
+        words = tokenize(query)
+        if not words:
+            return []
+        *earlier, prefix = words
+        required = []   # per earlier word, the postings of the words it can stand for
+        partial = []    # earlier words that start too many words to check postings for
+        for word in earlier:
+            expansions = [word] if word in self.postings else self.word_range(word)
+            if not expansions:
+                return []
+            if len(expansions) > MAX_EXPANSIONS:
+                partial.append(word)
+            else:
+                required.append([self.postings[expansion] for expansion in expansions])
+        # Fewest entries first, so most misses are rejected by the first check
+        required.sort(key=lambda postings: sum(map(len, postings)))
+
+        results = []
+        seen = set()    # notes in different courses often share a title; offer it once
+        previous = None
+        candidates = heapq.merge(*(self.postings[word] for word in self.word_range(prefix)))
+        for entry in itertools.islice(candidates, MAX_SCANNED):
+            if entry == previous or not self.kinds[entry] or (self.kinds[entry], self.labels[entry]) in seen:
+                continue
+            previous = entry
+            if not all(any(contains(postings, entry) for postings in group) for group in required):
+                continue
+            if partial and not all(
+                any(word.startswith(start) for word in tokenize(self.labels[entry])) for start in partial
+            ):
+                continue
+            seen.add((self.kinds[entry], self.labels[entry]))
+            results.append(self.suggestion(entry))
+            if len(results) == limit:
+                break
+        return results
+
+    def word_range(self, prefix):
+        start = bisect.bisect_left(self.words, prefix)
+        return self.words[start:bisect.bisect_left(self.words, prefix + '\uffff', start)]
+
+    def suggestion(self, entry):
+        return {
+            'type': KIND_NAMES[self.kinds[entry]],
+            'id': self.refs[entry],
+            'label': self.labels[entry],
+            **self.links.get(entry, {}),
+        }
+
+
+def contains(postings, entry):
+    position = bisect.bisect_left(postings, entry)
+    return position < len(postings) and postings[position] == entry
+
+
+# Course and faculty fields their entries are built from
+INDEXED_FIELDS = {
+    Course: ('code', 'name', 'faculty_id'),
+    Faculty: ('code', 'name'),
+}
+
+
+def indexed_fields(instance):
+    return tuple(getattr(instance, field) for field in INDEXED_FIELDS[type(instance)])
+
+
+def stored_fields(model, pk):
+    """The indexed fields of a row as they are in the database (before a save)"""
+    return model.objects.filter(pk=pk).values_list(*INDEXED_FIELDS[model]).first()
+
+
+def _build_prefix_index():
+    course_views = Counter(dict(
+        Note.objects.values_list('course_id').annotate(views=Sum('view_count')).order_by()
+    ))
+    faculty_views = Counter()
+    entries = []
+    for course_id, code, name, faculty_id, faculty_code in Course.objects.values_list(
+        'id', 'code', 'name', 'faculty_id', 'faculty__code'
+    ):
+        faculty_views[faculty_id] += course_views[course_id]
+        entries.append((course_views[course_id], COURSE, course_id, f'{code} {name}',
+                        {'faculty_code': faculty_code, 'course_code': code}))
+    for faculty_id, code, name in Faculty.objects.values_list('id', 'code', 'name'):
+        entries.append((faculty_views[faculty_id], FACULTY, faculty_id, f'{code} {name}', {'faculty_code': code}))
+    entries.extend(
+        (view_count, NOTE, note_id, title, None)
+        for note_id, title, view_count in Note.objects.values_list('id', 'title', 'view_count').order_by().iterator()
+    )
+    # Numbering entries heaviest first keeps every posting sorted by weight
+    entries.sort(key=lambda entry: -entry[0])
+
+    index = PrefixIndex()
+    for _, kind, ref, label, link in entries:
+        index.add(kind, ref, label, link, keep_sorted=False)
+    index.sort_words()
+    return index
+
+
+def apply_changes(index, changes):
+    """Replay published (removed (id, title) pairs, added (id, title) pairs) of notes"""
+    for removed, added in changes:
+        for note_id, title in removed:
+            index.remove(NOTE, note_id, title)
+        for note_id, title in added:
+            index.add(NOTE, note_id, title)
+
+
+# Built once per worker (see gunicorn.conf.py); every worker replays note changes
+# onto its copy. Weights (view counts) are refreshed by a reload on a schedule
+prefix_index = ProcessSnapshot(
+    SUGGEST_SCOPE, _build_prefix_index, apply_changes, background=True,
+    max_age=getattr(settings, 'PAPERFLOW_SUGGEST_REFRESH_INTERVAL', 60 * 60) or None,
+)
+
+
+def update_notes(removed=(), added=()):
+    """`removed`: (note id, indexed title) pairs; `added`: notes"""
+    prefix_index.publish_on_commit((list(removed), [(note.pk, note.title) for note in added]))
+
+
+def rebuild_index():
+    prefix_index.reload_on_commit()
+
+
+def suggest(query, limit=MAX_SUGGESTIONS):
+    return prefix_index.get().complete(query, limit)
@@ -0,0 +1,88 @@
+# tasks.py - Bounded background execution outside the request/response cycle
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_pool = None
+_pool_pid = None
+_slots = None
+_queued = 0
+
+
+def task_workers():
+    return getattr(settings, 'PAPERFLOW_TASK_WORKERS', 2)
+
+
+def queue_limit():
+    return getattr(settings, 'PAPERFLOW_TASK_QUEUE_LIMIT', 64)
+
+
+def queue_depth():
+    """Jobs submitted to the process pool that have not finished yet"""
+    return _queued
+
+
+def _get_pool():
+    global _pool, _pool_pid, _slots
+    # Pools (and their threads) do not survive a fork, so each worker owns one
+    if _pool is None or _pool_pid != os.getpid():
+        _pool = ProcessPoolExecutor(
+            max_workers=task_workers(),
+            # Spawned children import only the job's own module, never Django state
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+        _pool_pid = os.getpid()
+        _slots = threading.BoundedSemaphore(queue_limit())
+    return _pool
+
+
+def run_in_process(func, *args, callback=None):
+    """
+    Run `func(*args)` on the worker's process pool and pass its result to
+    `callback` back in this process. `func` must be importable without
+    Django. Returns False when the queue is full and the job was dropped.
+    With PAPERFLOW_TASK_WORKERS = 0 the job runs inline (tests, commands).
+    """
+    global _queued
+    if task_workers() == 0:
+        try:
+            result = func(*args)
+            if callback:
+                callback(result)
+        except Exception:
+            logger.exception("Task %s%r failed", func.__name__, args)
+        return True
+
+    with _lock:
+        pool = _get_pool()
+        if not _slots.acquire(blocking=False):
+            logger.warning("Task queue full, dropping %s%r", func.__name__, args)
+            return False
+        _queued += 1
+
+    def done(future):
+        global _queued
+        try:
+            result = future.result()
+            if callback:
+                callback(result)
+        except Exception:
+            logger.exception("Background task %s%r failed", func.__name__, args)
+        finally:
+            with _lock:
+                _queued -= 1
+            _slots.release()
+            # Callbacks run on the pool's management thread, which owns its own connection
+            connection.close()
+
+    pool.submit(func, *args).add_done_callback(done)
+    return True
@@ -1,3 +1,1141 @@
-from django.test import TestCase
+# tests.py - Query-count and response-time budgets for every API route
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import unittest
+import uuid
+from array import array
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.db.models import ProtectedError
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver
+from pypdf import PdfWriter
+
+from . import benchmark, catalog, fuzzy, loadtest, metrics, previews, stats, suggest, urls
+from .cache import ProcessSnapshot, bump_generation, clear_caches, course_scope, get_generation
+from .counters import flush_counters
+from .management.commands import dedupe_note_files
+from .pagination import encode_cursor
+from .pdf import render_preview
+from .retention import prune_academic_years
+from .search import MemorySearch
+from .models import (
+    Faculty, Course, AcademicYear, YearLevel, Semester, Note, FileBlob, Student,
+    SiteSettings, AboutUs, HowItWorks, UploadSession, StatCounter, ResponsiveImage
+)
+from .stats import get_statistics
+
+
+METRICS_TOKEN = 'test-metrics-token'
+
+# Catalog seeded for every test: 2 faculties x 3 courses x 2 academic years
+# x 3 year levels x 2 semesters x 5 notes = 360 notes
+FACULTIES = 2
+COURSES_PER_FACULTY = 3
+ACADEMIC_YEARS = (2024, 2025)
+LEVELS = 3
+NOTES_PER_SEMESTER = 5
+
+STUB_CONTENT = b'Stub note used by the query budget tests\n'
+
+# Millisecond budgets depend on the machine, so they are only enforced on request
+# (PAPERFLOW_TIMING_BUDGETS=1); query budgets are always enforced
+TIMING_BUDGETS = os.environ.get('PAPERFLOW_TIMING_BUDGETS', '') not in ('', '0')
+
+
+def iter_route_names(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_route_names(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            yield pattern.name
+
+
+def add_notes(per_semester, blob):
+    """Bulk-add notes to every semester, sharing one stored file"""
+    semesters = list(Semester.objects.select_related('year_level__academic_year__course__faculty'))
+    catalog.add_notes(semesters, per_semester * len(semesters), blob)
+    catalog.refresh_derived()
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'paperflow-tests'}},
+    PAPERFLOW_TASK_WORKERS=0,
+    PAPERFLOW_COUNTER_FLUSH_INTERVAL=3600,
+    PAPERFLOW_METRICS_DIR=None,
+    PAPERFLOW_METRICS_TOKEN=METRICS_TOKEN,
+    PAPERFLOW_DOWNLOADS_ENABLED=True,
+    PAPERFLOW_SENDFILE_BACKEND=None,
+)
+class PaperFlowTestCase(TestCase):
+    """In-memory cache, a throwaway MEDIA_ROOT and background work run inline"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp(prefix='paperflow-tests-')
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media_root))
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+    def setUp(self):
+        # Worker snapshots loaded by earlier tests describe rolled-back rows
+        clear_caches()
+
+    def tearDown(self):
+        # Buffered view/download counts belong to this test's rolled-back data
+        flush_counters()
+
+    def file_cache(self):
+        """The production cache backend, in a directory of its own"""
+        return self.settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': tempfile.mkdtemp(dir=self.media_root),
+        }})
+
+    def other_worker(self, snapshot):
+        """A copy of `snapshot` as another worker holds it, counting its loads"""
+        loads = []
+        other = ProcessSnapshot(snapshot.scope, lambda: loads.append(None) or snapshot.loader(), snapshot.apply)
+        return other, loads
+
+
+class QueryBudgetTests(PaperFlowTestCase):
+    """
+    Every route gets a maximum query count and response time, measured with
+    cold caches (response times only count with TIMING_BUDGETS). Each route
+    is then measured again after the catalog has doubled in notes: any
+    query count that moved is an N+1 and fails.
+    """
+
+    # route name -> (max queries, max milliseconds)
+    BUDGETS = {
+        'api-root': (0, 100),
+        'student-list': (1, 100),
+        'student-detail': (1, 100),
+        'student-dashboard-api': (1, 100),
+        'check_or_register_student': (3, 250),
+        'site-settings': (1, 100),
+        'about-us': (1, 100),
+        'how-it-works-list': (1, 100),
+        'dashboard-api': (2, 100),
+        'statistics-api': (2, 100),
+        'faculty-list-api': (1, 100),
+        'faculty-detail-api': (2, 100),
+        'faculty-courses-year-api': (4, 100),
+        'course-detail-api': (8, 500),
+        'year-level-notes-api': (4, 250),
+        'search-api': (3, 250),
+        'search-suggest-api': (4, 100),
+        'note-preview-api': (1, 100),
+        'note-view-api': (1, 100),
+        'note-download-api': (1, 100),
+        'note-upload-api': (22, 500),
+        'note-delete-api': (15, 500),
+        'upload-session-create-api': (2, 100),
+        'upload-session-api': (2, 100),
+        'upload-session-finalize-api': (25, 500),
+        'request-diagnostics-api': (0, 100),
+        'metrics-api': (0, 100),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        SiteSettings.objects.create(site_name='PaperFlow', contact_email='hello@paperflow.test', whatsapp_number='+256700000000')
+        AboutUs.objects.create(title='About PaperFlow', description='Past papers for every course', team_members='Ann, Ben')
+        for step in range(1, 4):
+            HowItWorks.objects.create(step_number=step, step_title=f'Step {step}', description='Pick a course')
+
+        for f in range(FACULTIES):
+            faculty = Faculty.objects.create(name=f'Faculty {f}', code=f'F{f}')
+            for c in range(COURSES_PER_FACULTY):
+                course = Course.objects.create(
+                    faculty=faculty, name=f'Course {f}.{c}', code=f'C{f}{c}',
+                    course_type='bachelor', duration_years=LEVELS
+                )
+                for year in ACADEMIC_YEARS:
+                    academic_year = AcademicYear.objects.create(
+                        course=course, year=year, is_current=year == ACADEMIC_YEARS[-1]
+                    )
+                    for level in range(1, LEVELS + 1):
+                        year_level = YearLevel.objects.create(academic_year=academic_year, level=level, name=f'Year {level}')
+                        for number in (1, 2):
+                            Semester.objects.create(year_level=year_level, semester_number=number)
+
+        # One note goes through save() so the shared file is a real stored blob
+        cls.note = Note.objects.create(
+            semester=Semester.objects.first(), title='Introduction to Programming', note_type='lecture',
+            file=ContentFile(STUB_CONTENT, name='intro.txt')
+        )
+        Note.objects.filter(pk=cls.note.pk).update(has_preview=True, preview_file='previews/intro.png')
+        cls.blob = FileBlob.objects.get(pk=cls.note.blob_id)
+        add_notes(NOTES_PER_SEMESTER, cls.blob)
+
+        cls.student = Student.objects.create(full_name='Test Student', email='student@paperflow.test', course='C00', year=1)
+        cls.semester = Semester.objects.first()
+
+    def measure(self, send):
+        clear_caches()
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                start = time.perf_counter()
+                response = send()
+                elapsed_ms = (time.perf_counter() - start) * 1000
+        return response, len(queries), elapsed_ms, queries
+
+    def assertWithinBudget(self, name, prepare, expected_status=200):
+        """
+        `prepare()` sets up anything the request needs (not counted) and
+        returns a callable that sends it. The request is made once on the
+        seeded catalog and once after every semester gains as many notes again.
+        """
+        max_queries, max_ms = self.BUDGETS[name]
+
+        response, count, elapsed_ms, queries = self.measure(prepare())
+        self.assertEqual(response.status_code, expected_status, getattr(response, 'data', None))
+        sql = '\n'.join(query['sql'] for query in queries.captured_queries)
+        self.assertLessEqual(count, max_queries, f'{name} ran {count} queries (budget {max_queries}):\n{sql}')
+        if TIMING_BUDGETS:
+            self.assertLessEqual(elapsed_ms, max_ms, f'{name} took {elapsed_ms:.0f} ms (budget {max_ms} ms)')
+
+        add_notes(NOTES_PER_SEMESTER, self.blob)
+        response, grown_count, _, queries = self.measure(prepare())
+        self.assertEqual(response.status_code, expected_status)
+        sql = '\n'.join(query['sql'] for query in queries.captured_queries)
+        self.assertEqual(grown_count, count, f'{name} query count grows with the number of notes:\n{sql}')
+
+    def get(self, path, **extra):
+        return lambda: (lambda: self.client.get(path, **extra))
+
+    # Coverage
+
+    def test_every_route_has_a_budget(self):
+        missing = set(iter_route_names(urls.urlpatterns)) - set(self.BUDGETS)
+        self.assertFalse(missing, f'Routes without a query budget: {sorted(missing)}')
+
+    # Site content
+
+    def test_api_root(self):
+        self.assertWithinBudget('api-root', self.get('/api/'))
+
+    def test_site_settings(self):
+        self.assertWithinBudget('site-settings', self.get('/api/site-settings/'))
+
+    def test_about_us(self):
+        self.assertWithinBudget('about-us', self.get('/api/about-us/'))
+
+    def test_how_it_works(self):
+        self.assertWithinBudget('how-it-works-list', self.get('/api/how-it-works/'))
+
+    # Students
+
+    def test_student_list(self):
+        self.assertWithinBudget('student-list', self.get('/api/students/'))
+
+    def test_student_detail(self):
+        self.assertWithinBudget('student-detail', self.get(f'/api/students/{self.student.id}/'))
+
+    def test_student_dashboard(self):
+        self.assertWithinBudget('student-dashboard-api', self.get(f'/api/students/{self.student.id}/dashboard/'))
+
+    def test_check_or_register_student(self):
+        def prepare():
+            email = f'{uuid.uuid4().hex}@paperflow.test'
+            return lambda: self.client.post('/api/check_or_register/', {
+                'email': email, 'full_name': 'New Student', 'course': 'C00', 'year': 1
+            }, content_type='application/json')
+        self.assertWithinBudget('check_or_register_student', prepare, expected_status=201)
+
+    # Catalog browsing
+
+    def test_dashboard(self):
+        self.assertWithinBudget('dashboard-api', self.get('/api/dashboard/'))
+
+    def test_statistics(self):
+        self.assertWithinBudget('statistics-api', self.get('/api/statistics/'))
+
+    def test_faculty_list(self):
+        self.assertWithinBudget('faculty-list-api', self.get('/api/faculties/'))
+
+    def test_faculty_detail(self):
+        self.assertWithinBudget('faculty-detail-api', self.get('/api/faculties/F0/'))
+
+    def test_faculty_courses_year(self):
+        self.assertWithinBudget('faculty-courses-year-api', self.get('/api/faculties/F0/year/2025/'))
+
+    def test_course_detail(self):
+        self.assertWithinBudget('course-detail-api', self.get('/api/faculties/F0/courses/C00/'))
+
+    def test_year_level_notes(self):
+        self.assertWithinBudget('year-level-notes-api', self.get('/api/faculties/F0/courses/C00/2024/year/1/'))
+
+    def test_search(self):
+        self.assertWithinBudget('search-api', self.get('/api/search/?q=paper&faculty=F0&note_type=exam'))
+
+    def test_search_facets_count_every_match(self):
+        response = self.client.get('/api/search/?faculty=f0&note_type=exam')
+        facets = response.data['facets']
+        matches = Note.objects.filter(faculty_code='f0', note_type='exam').count()
+        self.assertEqual(facets['faculty'], [{'value': 'F0', 'label': 'Faculty 0', 'count': matches}])
+        self.assertEqual(sum(option['count'] for option in facets['course']), matches)
+        self.assertEqual({option['value'] for option in facets['year']}, set(ACADEMIC_YEARS))
+        self.assertEqual(facets['note_type'], [{'value': 'exam', 'label': 'Past Exam', 'count': matches}])
+
+    def walk(self, path):
+        """Follow `next` links from `path`; returns the ids seen and the queries of each page"""
+        ids, page_queries = [], []
+        while path:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(path)
+            self.assertEqual(response.status_code, 200, response.data)
+            ids += [row['id'] for row in response.data['results']]
+            page_queries.append(len(queries))
+            path = response.data['next']
+        return ids, page_queries
+
+    def test_search_pages_follow_the_cursor(self):
+        ids, page_queries = self.walk('/api/search/?faculty=F0&page_size=7')
+        expected = list(Note.objects.filter(faculty_code='f0').order_by('-uploaded_at', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+        # Facets are only counted for the first page; every later page is one query
+        self.assertEqual(set(page_queries[1:]), {1})
+
+    def test_ranked_search_pages_follow_the_cursor(self):
+        ids, _ = self.walk('/api/search/?q=programming&page_size=5')
+        first_page = self.client.get('/api/search/?q=programming&page_size=100').data['results']
+        self.assertEqual(ids, [row['id'] for row in first_page])
+        self.assertGreater(len(ids), 5)
+
+    def test_pagination_limits(self):
+        response = self.client.get('/api/search/?page_size=1000')
+        self.assertEqual(len(response.data['results']), 100)
+        self.assertEqual(self.client.get('/api/search/?cursor=not-a-cursor').status_code, 404)
+
+    def test_tampered_cursors_are_rejected(self):
+        for path, values in (
+            ('/api/search/', ['x', 1]),
+            ('/api/search/', [{'a': 1}, 1]),
+            ('/api/search/?q=programming', ['low', '2025-01-01T00:00:00+00:00', 1]),
+            ('/api/students/', ['abc']),
+            ('/api/faculties/', [None, 1]),
+        ):
+            separator = '&' if '?' in path else '?'
+            response = self.client.get(f'{path}{separator}cursor={encode_cursor(values)}')
+            self.assertEqual(response.status_code, 404, (path, values))
+
+    def test_students_and_faculties_are_paged(self):
+        Student.objects.bulk_create([
+            Student(full_name=f'Student {number}', email=f's{number}@paperflow.test', course='C00', year=1)
+            for number in range(4)
+        ])
+        ids, _ = self.walk('/api/students/?page_size=2')
+        self.assertEqual(ids, list(Student.objects.order_by('id').values_list('id', flat=True)))
+        response = self.client.get('/api/faculties/?page_size=1')
+        self.assertEqual([row['code'] for row in response.data['results']], ['F0'])
+        self.assertIsNotNone(response.data['next'])
+
+    def test_search_suggest(self):
+        self.assertWithinBudget('search-suggest-api', self.get('/api/search/suggest/?q=intro'))
+
+    def test_memory_search_replays_changes_under_the_file_cache(self):
+        backend = MemorySearch()
+        with self.file_cache():
+            index = backend.snapshot.get()
+            other, loads = self.other_worker(backend.snapshot)
+            other_index = other.get()
+            self.assertIn(self.note.pk, other_index.search('introduction'))
+            with self.captureOnCommitCallbacks(execute=True):
+                backend.remove([self.note.pk])
+            other.expire()
+            self.assertNotIn(self.note.pk, other.get().search('introduction'))
+            self.assertNotIn(self.note.pk, backend.snapshot.get().search('introduction'))
+            self.assertIs(backend.snapshot.get(), index)
+            self.assertIs(other.get(), other_index)
+            self.assertEqual(len(loads), 1)
+
+    # Notes
+
+    def test_note_preview(self):
+        self.assertWithinBudget('note-preview-api', self.get(f'/api/notes/{self.note.id}/preview/'))
+
+    def test_note_view(self):
+        self.assertWithinBudget('note-view-api', self.get(f'/api/notes/{self.note.id}/view/'))
+
+    def test_note_download(self):
+        self.assertWithinBudget('note-download-api', self.get(f'/api/notes/{self.note.id}/download/'))
+
+    def test_downloads_are_counted_once_per_transfer(self):
+        path = f'/api/notes/{self.note.id}/download/'
+        before = Note.objects.values_list('download_count', flat=True).get(pk=self.note.pk)
+        for headers, expected_status in (
+            ({}, 200),
+            ({'HTTP_RANGE': 'bytes=0-9'}, 206),
+            ({'HTTP_RANGE': 'bytes=10-'}, 206),
+            ({'HTTP_IF_NONE_MATCH': f'"{self.blob.sha256}"'}, 304),
+        ):
+            response = self.client.get(path, **headers)
+            self.assertEqual(response.status_code, expected_status, headers)
+            response.close()
+        flush_counters()
+        self.assertEqual(Note.objects.values_list('download_count', flat=True).get(pk=self.note.pk), before + 2)
+
+    def test_offloaded_downloads_describe_the_file(self):
+        with self.settings(PAPERFLOW_SENDFILE_BACKEND='nginx'):
+            response = self.client.get(f'/api/notes/{self.note.id}/download/')
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.note.file.name}')
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="Introduction to Programming.txt"')
+
+    def test_missing_download_file_is_not_found(self):
+        note = Note.objects.create(semester=self.note.semester, title='Lost paper',
+                                   file=ContentFile(uuid.uuid4().hex.encode(), name='lost.txt'))
+        os.remove(note.file.path)
+        self.assertEqual(self.client.get(f'/api/notes/{note.id}/download/').status_code, 404)
+
+    def test_note_upload(self):
+        def prepare():
+            upload = SimpleUploadedFile(f'{uuid.uuid4().hex}.txt', uuid.uuid4().hex.encode())
+            return lambda: self.client.post('/api/notes/upload/', {
+                'title': 'Uploaded paper', 'semester': self.semester.id, 'note_type': 'exam', 'file': upload
+            })
+        self.assertWithinBudget('note-upload-api', prepare, expected_status=201)
+
+    def test_note_delete(self):
+        def prepare():
+            note_id = Note.objects.filter(blob=self.blob).exclude(pk=self.note.pk).values_list('pk', flat=True).first()
+            return lambda: self.client.delete(f'/api/notes/{note_id}/delete/')
+        self.assertWithinBudget('note-delete-api', prepare, expected_status=204)
+
+    # Chunked uploads
+
+    def start_upload(self, content):
+        response = self.client.post('/api/notes/uploads/', {
+            'title': 'Chunked paper', 'semester': self.semester.id,
+            'filename': 'chunked.txt', 'total_size': len(content)
+        }, content_type='application/json')
+        return response.data['id']
+
+    def send_chunk(self, session_id, content):
+        return self.client.put(
+            f'/api/notes/uploads/{session_id}/', content, content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes 0-{len(content) - 1}/{len(content)}'
+        )
+
+    def test_upload_session_create(self):
+        self.assertWithinBudget('upload-session-create-api', lambda: lambda: self.client.post('/api/notes/uploads/', {
+            'title': 'Chunked paper', 'semester': self.semester.id, 'filename': 'chunked.txt', 'total_size': 1024
+        }, content_type='application/json'), expected_status=201)
+
+    def test_upload_session_chunk(self):
+        def prepare():
+            content = uuid.uuid4().hex.encode()
+            session_id = self.start_upload(content)
+            return lambda: self.send_chunk(session_id, content)
+        self.assertWithinBudget('upload-session-api', prepare)
+
+    def test_upload_session_rejects_bad_chunks(self):
+        content = uuid.uuid4().hex.encode()
+        session_id = self.start_upload(content)
+        empty = self.client.put(
+            f'/api/notes/uploads/{session_id}/', b'', content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE='bytes 0-4/32'
+        )
+        self.assertEqual(empty.status_code, 400)
+        wrong_total = self.client.put(
+            f'/api/notes/uploads/{session_id}/', content[:5], content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE='bytes 0-4/999'
+        )
+        self.assertEqual(wrong_total.status_code, 400)
+        self.assertEqual(self.client.get(f'/api/notes/uploads/{session_id}/').data['received_bytes'], 0)
+
+    def test_upload_session_finalize(self):
+        def prepare():
+            content = uuid.uuid4().hex.encode()
+            session_id = self.start_upload(content)
+            self.send_chunk(session_id, content)
+            return lambda: self.client.post(f'/api/notes/uploads/{session_id}/finalize/')
+        self.assertWithinBudget('upload-session-finalize-api', prepare, expected_status=201)
+
+    def test_failed_finalize_can_be_retried(self):
+        content = uuid.uuid4().hex.encode()
+        session_id = self.start_upload(content)
+        self.send_chunk(session_id, content)
+        path = f'/api/notes/uploads/{session_id}/finalize/'
+        with mock.patch.object(Note.objects, 'create', side_effect=DatabaseError('disk full')):
+            with self.assertRaises(DatabaseError):
+                self.client.post(path)
+        staged = UploadSession.objects.get(pk=session_id)
+        self.assertFalse(staged.is_complete)
+        self.assertTrue(default_storage.exists(staged.file_name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(path)
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(default_storage.exists(staged.file_name))
+        self.assertEqual(Note.objects.get(pk=response.data['id']).file.read(), content)
+
+    def test_finalize_without_the_staging_file_conflicts(self):
+        content = uuid.uuid4().hex.encode()
+        session_id = self.start_upload(content)
+        self.send_chunk(session_id, content)
+        default_storage.delete(UploadSession.objects.get(pk=session_id).file_name)
+        self.assertEqual(self.client.post(f'/api/notes/uploads/{session_id}/finalize/').status_code, 409)
+
+    # Diagnostics
+
+    def test_benchmark_leaves_real_notes_alone(self):
+        self.assertNotIn('note-view-api', dict(benchmark.sample_paths()))
+        views = Note.objects.values_list('view_count', flat=True).get(pk=self.note.pk)
+        benchmark.run_benchmark(iterations=1, warmup=0)
+        self.assertEqual(Note.objects.values_list('view_count', flat=True).get(pk=self.note.pk), views)
+
+    def test_request_diagnostics(self):
+        self.assertWithinBudget('request-diagnostics-api', self.get(
+            '/api/diagnostics/requests/', HTTP_AUTHORIZATION=f'Bearer {METRICS_TOKEN}'
+        ))
+
+    def test_metrics(self):
+        self.assertWithinBudget('metrics-api', self.get('/api/metrics', HTTP_AUTHORIZATION=f'Bearer {METRICS_TOKEN}'))
+
+
+class MetricsStoreTests(PaperFlowTestCase):
+    """Per-process metrics files are retired once their process is gone, even if its pid is reused"""
+
+    def write(self, directory, name, pid, started, requests):
+        with open(os.path.join(directory, name), 'w') as f:
+            json.dump({'pid': pid, 'started': started, 'written_at': time.time(), 'endpoints': {},
+                       'counters': [['paperflow_upload_bytes_total', {'kind': 'form'}, requests]],
+                       'gauges': []}, f)
+
+    def uploaded(self, totals):
+        return totals['counters'][('paperflow_upload_bytes_total', (('kind', 'form'),))]
+
+    @unittest.skipUnless(os.path.exists('/proc/self/stat'), "needs /proc start times")
+    def test_reused_pids_are_archived(self):
+        directory = tempfile.mkdtemp(dir=self.media_root)
+        pid, started = os.getpid(), metrics._start_time(os.getpid())
+        # Left by an earlier container whose worker had this process's pid
+        self.write(directory, f'{pid}-{started - 1}.json', pid, started - 1, 5)
+        with self.settings(PAPERFLOW_METRICS_DIR=directory):
+            totals = metrics.collect()
+        self.assertEqual((totals['workers'], self.uploaded(totals)), (1, 5))
+        self.assertEqual(set(os.listdir(directory)), {'.lock', 'archive.json', f'{pid}-{started}.json'})
+
+    def test_master_start_archives_files_without_a_start_time(self):
+        directory = tempfile.mkdtemp(dir=self.media_root)
+        pid = os.getpid()
+        self.write(directory, f'{pid}.json', pid, None, 3)
+        with self.settings(PAPERFLOW_METRICS_DIR=directory):
+            metrics.archive_stale_files()
+            self.assertEqual(set(os.listdir(directory)), {'.lock', 'archive.json'})
+            totals = metrics.collect()
+        self.assertEqual((totals['workers'], self.uploaded(totals)), (1, 3))
+
+
+class BlobStoreTests(PaperFlowTestCase):
+    """Notes with the same content share one reference-counted stored file"""
+
+    @classmethod
+    def setUpTestData(cls):
+        faculty = Faculty.objects.create(name='Computing', code='FCI')
+        course = Course.objects.create(faculty=faculty, name='Computer Science', code='BCS',
+                                       course_type='bachelor', duration_years=3)
+        cls.semester = Semester.objects.create(
+            year_level=YearLevel.objects.create(academic_year=AcademicYear.objects.create(course=course, year=2024),
+                                                level=1, name='Year 1'),
+            semester_number=1, name='Semester 1'
+        )
+
+    def upload(self, content, title='Shared paper'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Note.objects.create(semester=self.semester, title=title,
+                                       file=ContentFile(content, name='paper.txt'))
+
+    def delete(self, note):
+        with self.captureOnCommitCallbacks(execute=True):
+            note.delete()
+
+    def test_shared_blob_outlives_every_note_but_the_last(self):
+        for order in ((0, 1), (1, 0)):
+            content = uuid.uuid4().hex.encode()
+            notes = [self.upload(content), self.upload(content)]
+            blob = FileBlob.objects.get(sha256=notes[0].blob.sha256)
+            self.assertEqual((notes[1].blob_id, blob.ref_count), (blob.pk, 2))
+
+            self.delete(notes[order[0]])
+            blob.refresh_from_db()
+            self.assertEqual(blob.ref_count, 1)
+            self.assertTrue(default_storage.exists(blob.file.name))
+
+            self.delete(notes[order[1]])
+            self.assertFalse(FileBlob.objects.filter(pk=blob.pk).exists())
+            self.assertFalse(default_storage.exists(blob.file.name))
+
+    def test_replacing_a_file_releases_the_old_blob(self):
+        kept, replaced = uuid.uuid4().hex.encode(), uuid.uuid4().hex.encode()
+        other = self.upload(kept)
+        note = self.upload(kept)
+        with self.captureOnCommitCallbacks(execute=True):
+            note.file = ContentFile(replaced, name='paper.txt')
+            note.save()
+        self.assertEqual(FileBlob.objects.get(pk=other.blob_id).ref_count, 1)
+        self.assertEqual(FileBlob.objects.get(pk=note.blob_id).ref_count, 1)
+        self.assertEqual(Note.objects.get(pk=note.pk).file.read(), replaced)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            note.file = ContentFile(uuid.uuid4().hex.encode(), name='paper.txt')
+            old = note.blob
+            note.save()
+        self.assertFalse(FileBlob.objects.filter(pk=old.pk).exists())
+        self.assertFalse(default_storage.exists(old.file.name))
+        self.assertTrue(default_storage.exists(other.blob.file.name))
+
+    def test_blobs_in_use_cannot_be_deleted(self):
+        note = self.upload(uuid.uuid4().hex.encode())
+        with self.assertRaises(ProtectedError):
+            note.blob.delete()
+
+    def test_notes_sharing_a_blob_render_distinct_previews(self):
+        writer, content = PdfWriter(), io.BytesIO()
+        writer.add_blank_page(width=200, height=200)
+        writer.write(content)
+        # Created without running on_commit, so no preview has been rendered yet
+        notes = [Note.objects.create(semester=self.semester, title=f'Scan {number}',
+                                     file=ContentFile(content.getvalue(), name='scan.pdf'))
+                 for number in range(2)]
+        # Both jobs are prepared before either renders, as on two pool workers
+        jobs = [previews._preview_job(note.pk) for note in notes]
+        self.assertNotEqual(jobs[0][2], jobs[1][2])
+        for note, (source_path, output_path, preview_name) in zip(notes, jobs):
+            self.assertTrue(render_preview(source_path, output_path))
+            previews.attach_preview(note.pk, preview_name)
+        names = {Note.objects.get(pk=note.pk).preview_file.name for note in notes}
+        self.assertEqual(len(names), 2)
+        for name in names:
+            self.assertTrue(default_storage.open(name).read().startswith(b'%PDF'))
+
+    def test_dedupe_adopts_a_shared_legacy_file_once(self):
+        content = uuid.uuid4().hex.encode()
+        name = default_storage.save('notes/legacy.txt', ContentFile(content))
+        legacy = [Note.objects.create(semester=self.semester, title=f'Legacy {number}', file=name)
+                  for number in range(2)]
+        # Each adopted file leaves only when its note's transaction commits, so
+        # a second adopt_file of the same path would find nothing to move
+        with mock.patch('paperflow.management.commands.dedupe_note_files.adopt_file',
+                        wraps=dedupe_note_files.adopt_file) as adopt_file:
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command('dedupe_note_files', stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertEqual(adopt_file.call_count, 1)
+        blob = FileBlob.objects.get()
+        self.assertEqual(blob.ref_count, 2)
+        for note in legacy:
+            note.refresh_from_db()
+            self.assertEqual((note.blob_id, note.file.read()), (blob.pk, content))
+        self.assertFalse(default_storage.exists(name))
+
+
+class GcMediaTests(PaperFlowTestCase):
+    """gc_media only removes files nothing references, and only once they are old"""
+
+    @classmethod
+    def setUpTestData(cls):
+        faculty = Faculty.objects.create(name='Computing', code='FCI')
+        course = Course.objects.create(faculty=faculty, name='Computer Science', code='BCS',
+                                       course_type='bachelor', duration_years=3)
+        cls.semester = Semester.objects.create(
+            year_level=YearLevel.objects.create(academic_year=AcademicYear.objects.create(course=course, year=2024),
+                                                level=1, name='Year 1'),
+            semester_number=1, name='Semester 1'
+        )
+
+    def store(self, name, age=2 * 60 * 60):
+        name = default_storage.save(name, ContentFile(uuid.uuid4().hex.encode()))
+        then = time.time() - age
+        os.utime(default_storage.path(name), (then, then))
+        return name
+
+    def gc_media(self, *args):
+        out = io.StringIO()
+        call_command('gc_media', '--min-age', '3600', '--sleep', '0', *args, stdout=out)
+        return out.getvalue()
+
+    def test_only_old_unreferenced_files_are_removed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            note = Note.objects.create(semester=self.semester, title='Kept paper',
+                                       file=ContentFile(uuid.uuid4().hex.encode(), name='paper.txt'))
+        Note.objects.filter(pk=note.pk).update(preview_file=self.store('previews/kept.png'))
+
+        # Site images are updated in place so no variants are rendered here
+        image = self.store('about/team.jpg')
+        about = AboutUs.objects.create(title='About', description='Who we are')
+        AboutUs.objects.filter(pk=about.pk).update(image=image)
+        sha256 = uuid.uuid4().hex * 2
+        variant = self.store(f'variants/{sha256[:2]}/{sha256}/640w.webp')
+        ResponsiveImage.objects.create(source=image, sha256=sha256, size=1, width=1600, height=900,
+                                       variants=[{'format': 'webp', 'width': 640, 'height': 360,
+                                                  'name': variant, 'size': 32}])
+
+        then = time.time() - 2 * 60 * 60
+        os.utime(note.file.path, (then, then))
+        kept = [note.file.name, Note.objects.get(pk=note.pk).preview_file.name, image, variant,
+                self.store('previews/rendering.png', age=0), self.store('exports/report.csv')]
+        orphan = self.store('notes/forgotten.txt')
+
+        output = self.gc_media('--dry-run')
+        self.assertIn(f'{orphan} (', output)
+        self.assertIn('Would delete 1 orphaned files', output)
+        for name in kept + [orphan]:
+            self.assertTrue(default_storage.exists(name), name)
+
+        output = self.gc_media()
+        self.assertIn('Deleted 1 orphaned files', output)
+        self.assertFalse(default_storage.exists(orphan))
+        for name in kept:
+            self.assertTrue(default_storage.exists(name), name)
+
+
+class CounterTests(PaperFlowTestCase):
+    """Counters adjusted by signals match a recount after every kind of change"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.faculty = Faculty.objects.create(name='Computing', code='FCI')
+        cls.semesters = []
+        for code in ('BCS', 'BIT'):
+            course = Course.objects.create(faculty=cls.faculty, name=f'Course {code}', code=code,
+                                           course_type='bachelor', duration_years=3)
+            academic_year = AcademicYear.objects.create(course=course, year=2024, is_current=True)
+            level = YearLevel.objects.create(academic_year=academic_year, level=1, name='Year 1')
+            cls.semesters += [
+                Semester.objects.create(year_level=level, semester_number=number, name=f'Semester {number}')
+                for number in (1, 2)
+            ]
+        for number, semester in enumerate(cls.semesters * 2):
+            Note.objects.create(semester=semester, title=f'Paper {number}', note_type='lecture',
+                                file=ContentFile(STUB_CONTENT, name='paper.txt'))
+
+    def assertCountersMatch(self):
+        self.assertEqual(dict(StatCounter.objects.values_list('name', 'value')), stats.compute_totals())
+
+    def test_note_changes(self):
+        note = Note.objects.first()
+        note.note_type = 'exam'
+        note.save()
+        self.assertCountersMatch()
+
+        note.has_preview = True
+        note.save(update_fields=['has_preview'])
+        note.is_premium = True
+        note.note_type = 'assignment'
+        note.save(update_fields=['is_premium', 'note_type'])
+        self.assertCountersMatch()
+
+        # Counter-only and unrelated saves leave the totals alone
+        note.view_count = 7
+        note.save(update_fields=['view_count'])
+        note.semester = self.semesters[-1]
+        note.title = 'Moved paper'
+        note.save()
+        self.assertCountersMatch()
+
+        note.delete()
+        self.assertCountersMatch()
+
+    def test_cascaded_deletes(self):
+        Note.objects.filter(semester=self.semesters[0]).update(has_preview=True, note_type='exam')
+        stats.rebuild_counters()
+        self.semesters[0].delete()
+        self.assertCountersMatch()
+        Course.objects.get(code='BIT').delete()
+        self.assertCountersMatch()
+        self.faculty.delete()
+        self.assertCountersMatch()
+
+    def test_current_years_and_pruning(self):
+        course = Course.objects.get(code='BCS')
+        AcademicYear.objects.create(course=course, year=2025, is_current=True)
+        AcademicYear.objects.create(course=course, year=2026)
+        self.assertCountersMatch()
+        with self.captureOnCommitCallbacks(execute=True):
+            prune_academic_years(keep=1)
+        self.assertCountersMatch()
+
+
+class RetentionTests(PaperFlowTestCase):
+    """Pruning an academic year takes its unfinished uploads with it"""
+
+    @classmethod
+    def setUpTestData(cls):
+        faculty = Faculty.objects.create(name='Computing', code='FCI')
+        course = Course.objects.create(faculty=faculty, name='Computer Science', code='BCS',
+                                       course_type='bachelor', duration_years=3)
+        cls.semesters = [
+            Semester.objects.create(
+                year_level=YearLevel.objects.create(academic_year=AcademicYear.objects.create(course=course, year=year),
+                                                    level=1, name='Year 1'),
+                semester_number=1, name='Semester 1'
+            )
+            for year in (2023, 2024)
+        ]
+
+    def stage(self, semester):
+        session = UploadSession.objects.create(semester=semester, title='Draft', filename='draft.pdf',
+                                               file_name=f'uploads/{uuid.uuid4()}.part', total_size=4)
+        default_storage.save(session.file_name, ContentFile(b'half'))
+        return session
+
+    def test_pruned_upload_sessions_lose_their_staging_files(self):
+        pruned, kept = self.stage(self.semesters[0]), self.stage(self.semesters[1])
+        with self.captureOnCommitCallbacks(execute=True):
+            prune_academic_years(keep=1)
+        self.assertEqual(list(UploadSession.objects.values_list('pk', flat=True)), [kept.pk])
+        self.assertFalse(default_storage.exists(pruned.file_name))
+        self.assertTrue(default_storage.exists(kept.file_name))
+
+
+class NoteHierarchyTests(PaperFlowTestCase):
+    """The faculty/course/year keys copied onto notes follow the hierarchy"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.faculty = Faculty.objects.create(name='Computing', code='FCI')
+        cls.course = Course.objects.create(faculty=cls.faculty, name='Computer Science', code='BCS',
+                                           course_type='bachelor', duration_years=3)
+        academic_year = AcademicYear.objects.create(course=cls.course, year=2024)
+        cls.semester = Semester.objects.create(
+            year_level=YearLevel.objects.create(academic_year=academic_year, level=1, name='Year 1'),
+            semester_number=1, name='Semester 1'
+        )
+        cls.note = Note.objects.create(semester=cls.semester, title='Networks exam',
+                                       file=ContentFile(STUB_CONTENT, name='networks.txt'))
+
+    def assertKeys(self, faculty, course, year, faculty_code, course_code):
+        note = Note.objects.get(pk=self.note.pk)
+        self.assertEqual(
+            (note.faculty_id, note.course_id, note.academic_year, note.faculty_code, note.course_code),
+            (faculty.pk, course.pk, year, faculty_code, course_code)
+        )
+
+    def test_keys_are_copied_on_create(self):
+        self.assertKeys(self.faculty, self.course, 2024, 'fci', 'bcs')
+        response = self.client.get('/api/search/?faculty=fci&course=BcS&year=2024')
+        self.assertEqual([row['id'] for row in response.data['results']], [self.note.pk])
+
+    def test_keys_follow_renames_and_moves(self):
+        self.course.code = 'BSCS'
+        self.course.save()
+        self.assertKeys(self.faculty, self.course, 2024, 'fci', 'bscs')
+
+        other = Faculty.objects.create(name='Science', code='FOS')
+        self.course.faculty = other
+        self.course.save()
+        self.assertKeys(other, self.course, 2024, 'fos', 'bscs')
+
+        academic_year = AcademicYear.objects.get(course=self.course)
+        academic_year.year = 2025
+        academic_year.save()
+        self.assertKeys(other, self.course, 2025, 'fos', 'bscs')
+
+    def test_partial_save_moving_the_note(self):
+        course = Course.objects.create(faculty=self.faculty, name='Statistics', code='BST',
+                                       course_type='bachelor', duration_years=3)
+        semester = Semester.objects.create(
+            year_level=YearLevel.objects.create(
+                academic_year=AcademicYear.objects.create(course=course, year=2025), level=2, name='Year 2'
+            ),
+            semester_number=2, name='Semester 2'
+        )
+        note = Note.objects.get(pk=self.note.pk)
+        note.semester = semester
+        note.save(update_fields=['semester'])
+        self.assertKeys(self.faculty, course, 2025, 'fci', 'bst')
+
+    def test_moves_retire_both_course_trees(self):
+        course = Course.objects.create(faculty=self.faculty, name='Statistics', code='BST',
+                                       course_type='bachelor', duration_years=3)
+        year_level = YearLevel.objects.create(
+            academic_year=AcademicYear.objects.create(course=course, year=2025), level=1, name='Year 1'
+        )
+        semester = Semester.objects.create(year_level=year_level, semester_number=2, name='Semester 2')
+
+        def stamps():
+            return get_generation(course_scope(self.course.pk)), get_generation(course_scope(course.pk))
+
+        before = stamps()
+        with self.captureOnCommitCallbacks(execute=True):
+            note = Note.objects.get(pk=self.note.pk)
+            note.semester = semester
+            note.save()
+        after = stamps()
+        self.assertNotEqual(after[0], before[0])
+        self.assertNotEqual(after[1], before[1])
+
+        # A semester moved under another course takes its notes along
+        with self.captureOnCommitCallbacks(execute=True):
+            semester.year_level = self.semester.year_level
+            semester.save()
+        self.assertNotEqual(stamps()[1], after[1])
+        self.assertNotEqual(stamps()[0], after[0])
+
+    def test_backfill_command(self):
+        Note.objects.update(faculty=None, course=None, academic_year=None, faculty_code='', course_code='')
+        call_command('backfill_note_hierarchy', stdout=io.StringIO())
+        self.assertKeys(self.faculty, self.course, 2024, 'fci', 'bcs')
+
+
+class FuzzySearchTests(PaperFlowTestCase):
+    """Misspelled searches are corrected against the catalog vocabulary"""
+
+    @classmethod
+    def setUpTestData(cls):
+        faculty = Faculty.objects.create(name='Computing', code='FCI')
+        course = Course.objects.create(faculty=faculty, name='Web Development', code='BWD',
+                                       course_type='bachelor', duration_years=3)
+        academic_year = AcademicYear.objects.create(course=course, year=2024)
+        cls.semester = Semester.objects.create(
+            year_level=YearLevel.objects.create(academic_year=academic_year, level=1, name='Year 1'),
+            semester_number=1, name='Semester 1'
+        )
+        cls.note = Note.objects.create(semester=cls.semester, title='Assignment on Networking',
+                                       file=ContentFile(STUB_CONTENT, name='assignment.txt'))
+
+    def test_trigram_index(self):
+        index = fuzzy.TrigramIndex()
+        index.add('Assignment on Networking')
+        index.add('BWD Web Development')
+        self.assertEqual(index.correct('Assigment'), 'assignment')
+        self.assertEqual(index.correct('WEB DEVT'), 'web development')
+        self.assertIsNone(index.correct('web netw'))
+        self.assertIsInstance(index.postings['ass'], array)
+        index.remove('Assignment on Networking')
+        self.assertIsNone(index.correct('Assigment'))
+
+    def test_search_suggests_a_correction(self):
+        response = self.client.get('/api/search/?q=Asignment')
+        self.assertEqual(response.data['did_you_mean'], 'assignment')
+        self.assertEqual([row['id'] for row in response.data['results']], [self.note.pk])
+
+        response = self.client.get('/api/search/?q=networking')
+        self.assertIsNone(response.data['did_you_mean'])
+
+    def test_saves_and_deletes_update_the_index(self):
+        index = fuzzy.fuzzy_index.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            note = Note.objects.create(semester=self.semester, title='Thermodynamics Revision',
+                                       file=ContentFile(STUB_CONTENT, name='thermo.txt'))
+        self.assertEqual(fuzzy.suggest_query('thermodinamics'), 'thermodynamics')
+        with self.captureOnCommitCallbacks(execute=True):
+            note.title = 'Fluid Mechanics'
+            note.save()
+        self.assertIsNone(fuzzy.suggest_query('thermodinamics'))
+        with self.captureOnCommitCallbacks(execute=True):
+            note.delete()
+        self.assertIsNone(fuzzy.suggest_query('mechanis'))
+        # Patched in place, never rebuilt
+        self.assertIs(fuzzy.fuzzy_index.get(), index)
+
+    def test_changes_replay_in_every_worker_under_the_file_cache(self):
+        with self.file_cache():
+            index = fuzzy.fuzzy_index.get()
+            other, loads = self.other_worker(fuzzy.fuzzy_index)
+            other_index = other.get()
+            with self.captureOnCommitCallbacks(execute=True):
+                Note.objects.create(semester=self.semester, title='Thermodynamics Revision',
+                                    file=ContentFile(STUB_CONTENT, name='thermo.txt'))
+            other.expire()
+            self.assertEqual(fuzzy.suggest_query('thermodinamics'), 'thermodynamics')
+            self.assertTrue(other.get().known('thermodynamics'))
+            self.assertIs(fuzzy.fuzzy_index.get(), index)
+            self.assertIs(other.get(), other_index)
+            self.assertEqual(len(loads), 1)
+
+    def test_a_cascade_publishes_once(self):
+        course = Course.objects.create(faculty=Faculty.objects.get(), name='Mathematics', code='BMA',
+                                       course_type='bachelor', duration_years=3)
+        semester = Semester.objects.create(
+            year_level=YearLevel.objects.create(academic_year=AcademicYear.objects.create(course=course, year=2024),
+                                                level=1, name='Year 1'),
+            semester_number=1, name='Semester 1'
+        )
+        for title in ('Calculus Notes', 'Statistics Exam', 'Algebra Revision'):
+            Note.objects.create(semester=semester, title=title,
+                                file=ContentFile(uuid.uuid4().hex.encode(), name='maths.txt'))
+        with self.file_cache():
+            index = fuzzy.fuzzy_index.get()
+            generation = get_generation(fuzzy.FUZZY_SCOPE)
+            with self.captureOnCommitCallbacks(execute=True):
+                course.delete()
+            self.assertEqual(get_generation(fuzzy.FUZZY_SCOPE), generation + 1)
+            self.assertIsNone(fuzzy.suggest_query('calculsu'))
+            self.assertIs(fuzzy.fuzzy_index.get(), index)
+
+
+class SuggestTests(PaperFlowTestCase):
+    """Search-as-you-type completions, most viewed first"""
+
+    @classmethod
+    def setUpTestData(cls):
+        faculty = Faculty.objects.create(name='Computing', code='FCI')
+        course = Course.objects.create(faculty=faculty, name='Computer Science', code='BCS',
+                                       course_type='bachelor', duration_years=3)
+        academic_year = AcademicYear.objects.create(course=course, year=2024)
+        cls.semester = Semester.objects.create(
+            year_level=YearLevel.objects.create(academic_year=academic_year, level=1, name='Year 1'),
+            semester_number=1, name='Semester 1'
+        )
+        for title, views in (('Introduction to Programming', 5), ('Programming Paradigms', 50), ('Probability', 0)):
+            note = Note.objects.create(semester=cls.semester, title=title,
+                                       file=ContentFile(STUB_CONTENT, name='note.txt'))
+            Note.objects.filter(pk=note.pk).update(view_count=views)
+
+    def labels(self, query):
+        response = self.client.get('/api/search/suggest/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [row['label'] for row in response.data['suggestions']]
+
+    def test_completions_are_weighted_by_views(self):
+        self.assertEqual(self.labels('pro'), ['Programming Paradigms', 'Introduction to Programming', 'Probability'])
+        self.assertEqual(self.labels('intro prog'), ['Introduction to Programming'])
+        self.assertEqual(self.labels('paradigms intro'), [])
+
+    def test_courses_and_faculties_complete_with_their_codes(self):
+        response = self.client.get('/api/search/suggest/?q=bc')
+        self.assertEqual(response.data['suggestions'][0], {
+            'type': 'course', 'id': Course.objects.get().pk, 'label': 'BCS Computer Science',
+            'faculty_code': 'FCI', 'course_code': 'BCS',
+        })
+        self.assertEqual(set(self.labels('comp')), {'BCS Computer Science', 'FCI Computing'})
+
+    def test_served_from_memory(self):
+        self.labels('pro')
+        with self.assertNumQueries(0):
+            self.labels('prob')
+
+    def test_saves_and_deletes_patch_the_index(self):
+        index = suggest.prefix_index.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            note = Note.objects.create(semester=self.semester, title='Probabilistic Models',
+                                       file=ContentFile(STUB_CONTENT, name='models.txt'))
+        self.assertEqual(self.labels('probabilis'), ['Probabilistic Models'])
+        with self.captureOnCommitCallbacks(execute=True):
+            note.delete()
+        self.assertEqual(self.labels('probabilis'), [])
+        self.assertIs(suggest.prefix_index.get(), index)
+
+    def test_pruned_notes_leave_the_indexes(self):
+        course = Course.objects.get()
+        for year in (2022, 2023):
+            AcademicYear.objects.create(course=course, year=year)
+        semester = Semester.objects.create(
+            year_level=YearLevel.objects.create(academic_year=AcademicYear.objects.get(year=2022), level=1,
+                                                name='Year 1'),
+            semester_number=1, name='Semester 1'
+        )
+        Note.objects.create(semester=semester, title='Obsolete Compilers',
+                            file=ContentFile(STUB_CONTENT, name='compilers.txt'))
+        self.assertEqual(self.labels('obsolete'), ['Obsolete Compilers'])
+        with self.captureOnCommitCallbacks(execute=True):
+            report = prune_academic_years(keep=2)
+        self.assertEqual((report['academic_years'], report['notes']), (1, 1))
+        self.assertFalse(Note.objects.filter(title='Obsolete Compilers').exists())
+        self.assertEqual(self.labels('obsolete'), [])
+        self.assertFalse(fuzzy.fuzzy_index.get().known('obsolete'))
+
+    def test_changes_replay_in_every_worker_under_the_file_cache(self):
+        with self.file_cache():
+            index = suggest.prefix_index.get()
+            other, loads = self.other_worker(suggest.prefix_index)
+            other_index = other.get()
+            with self.captureOnCommitCallbacks(execute=True):
+                note = Note.objects.create(semester=self.semester, title='Probabilistic Models',
+                                           file=ContentFile(STUB_CONTENT, name='models.txt'))
+            with self.captureOnCommitCallbacks(execute=True):
+                note.title = 'Probabilistic Graphical Models'
+                note.save()
+            other.expire()
+            self.assertEqual(self.labels('probabilis'), ['Probabilistic Graphical Models'])
+            self.assertEqual([row['label'] for row in other.get().complete('probabilis')],
+                             ['Probabilistic Graphical Models'])
+            self.assertIs(suggest.prefix_index.get(), index)
+            self.assertIs(other.get(), other_index)
+            self.assertEqual(len(loads), 1)
+
+    def test_only_indexed_course_changes_rebuild(self):
+        index = suggest.prefix_index.get()
+        course = Course.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            course.duration_years = 4
+            course.save()
+        suggest.prefix_index.expire()
+        self.assertIs(suggest.prefix_index.get(), index)
+        with self.captureOnCommitCallbacks(execute=True):
+            course.name = 'Software Engineering'
+            course.save()
+        self.assertEqual(self.labels('software'), ['BCS Software Engineering'])
+
+    def test_stale_index_is_served_while_it_reloads(self):
+        loads = []
+        snapshot = ProcessSnapshot('background-test', lambda: loads.append(None) or len(loads), background=True)
+        self.assertEqual(snapshot.get(), 1)
+        bump_generation('background-test')
+        with self.settings(PAPERFLOW_TASK_WORKERS=1):
+            self.assertEqual(snapshot.get(), 1)
+            snapshot._loading.join()
+            self.assertEqual(snapshot.get(), 2)
+
+
+class SyntheticCatalogTests(PaperFlowTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.report = catalog.generate_catalog(
+            faculties=2, courses=5, academic_years=2, levels=3, semesters=2, notes=500, batch_size=200
+        )
+
+    def test_generates_the_requested_shape(self):
+        self.assertEqual(self.report, {
+            'faculties': 2, 'courses': 5, 'academic_years': 10, 'year_levels': 30, 'semesters': 60, 'notes': 500
+        })
+        self.assertEqual(Faculty.objects.filter(code__startswith=catalog.CODE_PREFIX).count(), 2)
+        self.assertFalse(Semester.objects.filter(notes__isnull=True).exists())
+
+    def test_notes_share_one_counted_blob(self):
+        blob = FileBlob.objects.get()
+        self.assertEqual(blob.ref_count, 500)
+        self.assertEqual(Note.objects.exclude(blob=blob).count(), 0)
+
+    def test_derived_data_is_rebuilt(self):
+        self.assertEqual(get_statistics()['total_notes'], 500)
+        word = Note.objects.values_list('title', flat=True).first().split()[0]
+        response = self.client.get(f'/api/search/?q={word}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['results'])
+
+    def test_benchmark_covers_the_catalog(self):
+        results = benchmark.run_benchmark(iterations=2, warmup=0)
+        for name in ('course-detail-api', 'year-level-notes-api', 'search-api', 'note-view-api'):
+            self.assertEqual(results[name]['status'], [200], name)
+            self.assertGreaterEqual(results[name]['p99_ms'], results[name]['p50_ms'])
+
+    def test_load_mix_requests_real_rows(self):
+        targets = loadtest.Targets()
+        rng = random.Random(0)
+        for scenario in ('hover', 'year-level', 'view', 'search'):
+            for label, path in targets.visit(scenario, rng):
+                self.assertEqual(self.client.get(path).status_code, 200, path)
+        with self.assertRaises(ValueError):
+            loadtest.parse_mix('browse=10')
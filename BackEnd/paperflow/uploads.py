@@ -0,0 +1,202 @@
+# uploads.py - Upload handling: hashing while streaming and resumable chunked uploads
+import hashlib
+import os
+import re
+import threading
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from . import metrics
+from .blobs import adopt_file, file_sha256
+from .models import Note, UploadSession
+
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+COPY_BUFFER = 64 * 1024
+MAX_TRACKED_HASHERS = 128
+
+
+class UploadConflict(Exception):
+    """The chunk does not continue the upload where the server left off"""
+
+
+def max_chunk_size():
+    return getattr(settings, 'PAPERFLOW_UPLOAD_CHUNK_SIZE', 5 * 1024 * 1024)
+
+
+class HashingUploadMixin:
+    """Computes the SHA-256 of each uploaded file as its chunks arrive"""
+
+    def new_file(self, *args, **kwargs):
+        # Set first: the memory handler ends new_file by raising StopFutureHandlers
+        self.hasher = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        remaining = super().receive_data_chunk(raw_data, start)
+        # None means this handler kept the chunk (rather than passing it on)
+        if remaining is None:
+            self.hasher.update(raw_data)
+        return remaining
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self.hasher.hexdigest()
+            metrics.inc('paperflow_upload_bytes_total', file_size, kind='form')
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin, TemporaryFileUploadHandler):
+    pass
+
+
+# Running SHA-256 per session in this worker. A chunk that lands on another
+# worker breaks the chain, and finalize then hashes the assembled file instead.
+_hashers = OrderedDict()
+_hashers_lock = threading.Lock()
+
+
+def _take_hasher(session_id, offset):
+    with _hashers_lock:
+        tracked = _hashers.pop(session_id, None)
+    if tracked and tracked[0] == offset:
+        return tracked[1]
+    return hashlib.sha256() if offset == 0 else None
+
+
+def _keep_hasher(session_id, offset, hasher):
+    with _hashers_lock:
+        _hashers[session_id] = (offset, hasher)
+        while len(_hashers) > MAX_TRACKED_HASHERS:
+            _hashers.popitem(last=False)
+
+
+def parse_content_range(header):
+    """
+    Return (start, end, total) from `Content-Range: bytes start-end/total`,
+    or None; total is None when the client sent `*`
+    """
+    match = CONTENT_RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+    total = None if match.group(3) == '*' else int(match.group(3))
+    return int(match.group(1)), int(match.group(2)), total
+
+
+def start_session(serializer):
+    """Create the session and its empty staging file"""
+    data = serializer.validated_data
+    session_id = uuid.uuid4()
+    file_name = f'uploads/{session_id}.part'
+    path = default_storage.path(file_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+    return serializer.save(
+        id=session_id,
+        filename=get_valid_filename(os.path.basename(data['filename'])),
+        file_name=file_name,
+    )
+
+
+def write_chunk(session, start, stream, length):
+    """
+    Write `length` bytes from `stream` at offset `start` of the session file.
+    Chunks must arrive in order; the stored offset only moves once the
+    whole chunk is on disk, so a dropped connection is simply retried.
+    """
+    if session.is_complete:
+        raise UploadConflict("Upload already finalized")
+    if start != session.received_bytes:
+        raise UploadConflict(f"Expected offset {session.received_bytes}")
+    if length <= 0 or length > max_chunk_size():
+        raise ValueError(f"Chunks must be between 1 and {max_chunk_size()} bytes")
+    if start + length > session.total_size:
+        raise ValueError("Chunk runs past the declared file size")
+
+    if stream is None:
+        # No request body at all (Django leaves request.stream unset)
+        raise ValueError(f"Chunk ended {length} bytes early")
+
+    hasher = _take_hasher(session.pk, start)
+    remaining = length
+    with open(default_storage.path(session.file_name), 'r+b') as f:
+        f.seek(start)
+        while remaining:
+            chunk = stream.read(min(COPY_BUFFER, remaining))
+            if not chunk:
+                break
+            f.write(chunk)
+            if hasher:
+                hasher.update(chunk)
+            remaining -= len(chunk)
+    if remaining:
+        raise ValueError(f"Chunk ended {remaining} bytes early")
+
+    received = start + length
+    updated = UploadSession.objects.filter(pk=session.pk, received_bytes=start).update(
+        received_bytes=received, updated_at=timezone.now()
+    )
+    if not updated:
+        raise UploadConflict("Another request advanced this upload")
+    if hasher:
+        _keep_hasher(session.pk, received, hasher)
+    session.received_bytes = received
+    metrics.inc('paperflow_upload_bytes_total', length, kind='chunked')
+    return received
+
+
+def finalize_session(session):
+    """Create the Note for a fully received upload (idempotent)"""
+    if session.received_bytes != session.total_size:
+        raise UploadConflict(f"Received {session.received_bytes} of {session.total_size} bytes")
+    if session.is_complete:
+        return session.note
+
+    path = default_storage.path(session.file_name)
+    if not os.path.exists(path):
+        # Finalized by a concurrent request, or the staging file was lost
+        session.refresh_from_db()
+        if session.is_complete:
+            return session.note
+        raise UploadConflict("The received bytes are no longer on the server; start a new upload")
+
+    hasher = _take_hasher(session.pk, session.total_size)
+    sha256 = hasher.hexdigest() if hasher else file_sha256(path)
+
+    with transaction.atomic():
+        if not UploadSession.objects.filter(pk=session.pk, is_complete=False).update(is_complete=True):
+            session.refresh_from_db()
+            return session.note
+        # The staging file goes into the blob store (or is dropped for known
+        # content) once this commits; a failure below leaves it for a retry
+        blob = adopt_file(path, sha256, session.filename)
+        note = Note.objects.create(
+            semester=session.semester,
+            title=session.title,
+            description=session.description,
+            note_type=session.note_type,
+            is_premium=session.is_premium,
+            blob=blob,
+            file=blob.file.name,
+            file_size=blob.size,
+        )
+        session.note = note
+        session.sha256 = sha256
+        session.is_complete = True
+        session.save(update_fields=['note', 'sha256', 'is_complete', 'updated_at'])
+
+    if note.file.name.lower().endswith('.pdf'):
+        note.generate_preview()
+    return note
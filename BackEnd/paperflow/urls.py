@@ -39,10 +39,18 @@ urlpatterns = [
 
     # File management
     path('notes/upload/', views.NoteUploadAPIView.as_view(), name='note-upload-api'),
+    path('notes/uploads/', views.UploadSessionCreateAPIView.as_view(), name='upload-session-create-api'),
+    path('notes/uploads/<uuid:session_id>/', views.UploadSessionAPIView.as_view(), name='upload-session-api'),
+    path('notes/uploads/<uuid:session_id>/finalize/', views.UploadSessionFinalizeAPIView.as_view(), name='upload-session-finalize-api'),
     path('notes/<int:note_id>/delete/', views.NoteDeleteAPIView.as_view(), name='note-delete-api'),
 
     # Search
     path('search/', views.SearchNotesAPIView.as_view(), name='search-api'),
+    path('search/suggest/', views.search_suggest_api, name='search-suggest-api'),
+
+    # Diagnostics (staff or PAPERFLOW_METRICS_TOKEN)
+    path('diagnostics/requests/', views.request_diagnostics_api, name='request-diagnostics-api'),
+    path('metrics', views.metrics_api, name='metrics-api'),
 
     # Student dashboard
     path('students/<int:student_id>/dashboard/', views.student_dashboard_api, name='student-dashboard-api'),
@@ -0,0 +1,101 @@
+# variants.py - Background responsive variants for site content images
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+from .cache import ProcessSnapshot, bump_generation, SITE_SETTINGS_SCOPE, ABOUT_US_SCOPE, HOW_IT_WORKS_SCOPE
+from .imaging import compact_formats, render_variants
+from .models import SiteSettings, AboutUs, HowItWorks, ResponsiveImage
+from .tasks import run_in_process
+
+
+VARIANTS_SCOPE = 'image-variants'
+
+# Image fields that get variants, and the cached content they appear in
+IMAGE_FIELDS = {
+    SiteSettings: (('site_logo', 'backgroundimage', 'backgroundimage2'), SITE_SETTINGS_SCOPE),
+    AboutUs: (('image',), ABOUT_US_SCOPE),
+    HowItWorks: (('image',), HOW_IT_WORKS_SCOPE),
+}
+
+
+def variant_widths():
+    return getattr(settings, 'PAPERFLOW_IMAGE_WIDTHS', (320, 640, 1024, 1600))
+
+
+def _load_variants():
+    return dict(ResponsiveImage.objects.values_list('source', 'variants'))
+
+
+# source name -> variants, so serializers never query per image
+variant_index = ProcessSnapshot(VARIANTS_SCOPE, _load_variants)
+
+
+def _stale_images(instance):
+    """The instance's image files that have no variants yet (or changed since)"""
+    fields, _ = IMAGE_FIELDS[type(instance)]
+    files = [getattr(instance, field) for field in fields if getattr(instance, field)]
+    known = dict(
+        ResponsiveImage.objects.filter(source__in=[f.name for f in files]).values_list('source', 'size')
+    )
+    stale = []
+    for file in files:
+        try:
+            size = file.size
+        except OSError:
+            continue
+        if known.get(file.name) != size:
+            stale.append((file.name, file.path, size))
+    return stale
+
+
+def _job_args(path):
+    return path, str(settings.MEDIA_ROOT), variant_widths(), compact_formats()
+
+
+def store_variants(source, size, manifest, scope):
+    ResponsiveImage.objects.update_or_create(source=source, defaults={
+        'sha256': manifest['sha256'],
+        'size': size,
+        'width': manifest['width'],
+        'height': manifest['height'],
+        'variants': manifest['variants'],
+    })
+    bump_generation(VARIANTS_SCOPE)
+    # The cached JSON of the page using this image now gains its srcset
+    bump_generation(scope)
+
+
+def schedule_variants(instance):
+    """Queue variant rendering for new or changed images on the process pool"""
+    _, scope = IMAGE_FIELDS[type(instance)]
+    for source, path, size in _stale_images(instance):
+        def store(manifest, source=source, size=size):
+            if manifest:
+                store_variants(source, size, manifest, scope)
+
+        run_in_process(render_variants, *_job_args(path), callback=store)
+
+
+def generate_variants_now(instance):
+    """Render missing variants in this process (maintenance commands); returns how many images"""
+    _, scope = IMAGE_FIELDS[type(instance)]
+    stale = _stale_images(instance)
+    for source, path, size in stale:
+        store_variants(source, size, render_variants(*_job_args(path)), scope)
+    return len(stale)
+
+
+def image_srcset(file, request):
+    """{format: 'url 320w, url 640w, ...'} for an image, or None until its variants exist"""
+    if not file or request is None:
+        return None
+    variants = variant_index.get().get(file.name)
+    if not variants:
+        return None
+    srcset = defaultdict(list)
+    for variant in variants:
+        url = request.build_absolute_uri(default_storage.url(variant['name']))
+        srcset[variant['format']].append(f"{url} {variant['width']}w")
+    return {fmt: ', '.join(entries) for fmt, entries in srcset.items()}
@@ -4,13 +4,16 @@ from rest_framework import viewsets, status, generics
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.decorators import api_view
-from django.db.models import Q, Prefetch
+from rest_framework.utils.urls import replace_query_param
+from django.db.models import Q, Prefetch, prefetch_related_objects
 from django.utils import timezone
+from django.conf import settings
+from django.http import HttpResponse
 from decimal import Decimal
 
 from .models import (
     Student, SiteSettings, AboutUs, HowItWorks, Faculty, Course, 
-    AcademicYear, YearLevel, Semester, Note, Payment, StudentAccess
+    AcademicYear, YearLevel, Semester, Note, Payment, StudentAccess, UploadSession
 )
 from .serializers import (
     StudentSerializer, SiteSettingsSerializer, AboutUsSerializer, 
@@ -18,19 +21,39 @@ from .serializers import (
     CourseDetailSerializer, DashboardSerializer, YearLevelWithCoursesSerializer, 
     NoteSerializer, NoteUploadSerializer, SearchResultSerializer, 
     YearLevelSerializer, SemesterSerializer, NoteWithAccessSerializer,
-    PaymentSerializer, StudentAccessSerializer
+    PaymentSerializer, StudentAccessSerializer, UploadSessionSerializer
 )
+from .cache import get_course_tree, SITE_SETTINGS_SCOPE, ABOUT_US_SCOPE, HOW_IT_WORKS_SCOPE
+from .conditional import ConditionalContent
+from .hierarchy import resolve_course, resolve_year_level
+from .site import get_site_settings, get_pricing
+from .stats import get_statistics
+from .search import get_search_backend
+from .facets import search_facets
+from .fuzzy import suggest_query
+from .suggest import suggest, MAX_SUGGESTIONS
+from .pagination import KeysetPagination, StudentPagination, FacultyPagination
+from .counters import view_counts, download_counts
+from .streaming import serve_file
+from .instrumentation import summarize, metrics_access_allowed
+from . import metrics
+from .uploads import UploadConflict, parse_content_range, start_session, write_chunk, finalize_session
+
+
+def build_site_settings(request):
+    site_settings = get_site_settings()
+    if site_settings:
+        serializer = SiteSettingsSerializer(site_settings, context={'request': request})
+        return status.HTTP_200_OK, serializer.data, site_settings.updated_at
+    return status.HTTP_404_NOT_FOUND, {"detail": "Site settings not configured."}, None
 
 
 class SiteSettingsView(APIView):
+    content = ConditionalContent(SITE_SETTINGS_SCOPE, build_site_settings)
+    
     def get(self, request):
         try:
-            site_settings = SiteSettings.objects.first()
-            if site_settings:
-                serializer = SiteSettingsSerializer(site_settings, context={'request': request})
-                return Response(serializer.data, status=status.HTTP_200_OK)
-            else:
-                return Response({"detail": "Site settings not configured."}, status=status.HTTP_404_NOT_FOUND)
+            return self.content.respond(request)
         except Exception as e:
             return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -38,6 +61,7 @@ class SiteSettingsView(APIView):
 class StudentViewSet(viewsets.ModelViewSet):
     queryset = Student.objects.all()
     serializer_class = StudentSerializer
+    pagination_class = StudentPagination
 
 
 @api_view(['POST'])
@@ -66,20 +90,33 @@ def check_or_register_student(request):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+def build_about_us(request):
+    about = AboutUs.objects.first()
+    if about:
+        serializer = AboutUsSerializer(about, context={'request': request})
+        return status.HTTP_200_OK, serializer.data, about.updated_at
+    return status.HTTP_404_NOT_FOUND, {"detail": "AboutUs information not configured."}, None
+
+
 class AboutUsView(APIView):
+    content = ConditionalContent(ABOUT_US_SCOPE, build_about_us)
+    
     def get(self, request):
-        about = AboutUs.objects.first()
-        if about:
-            serializer = AboutUsSerializer(about, context={'request': request})
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        return Response({"detail": "AboutUs information not configured."}, status=status.HTTP_404_NOT_FOUND)
+        return self.content.respond(request)
+
+
+def build_how_it_works(request):
+    steps = HowItWorks.objects.all().order_by('step_number')
+    serializer = HowItWorksSerializer(steps, many=True, context={'request': request})
+    last_modified = max((step.updated_at for step in steps), default=None)
+    return status.HTTP_200_OK, serializer.data, last_modified
 
 
 class HowItWorksListView(APIView):
+    content = ConditionalContent(HOW_IT_WORKS_SCOPE, build_how_it_works)
+    
     def get(self, request):
-        steps = HowItWorks.objects.all().order_by('step_number')
-        serializer = HowItWorksSerializer(steps, many=True, context={'request': request})
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return self.content.respond(request)
 
 
 # 🏠 DASHBOARD API
@@ -94,25 +131,23 @@ class CourseDetailAPIView(generics.RetrieveAPIView):
     lookup_url_kwarg = 'course_code'
     
     def get_object(self):
-        faculty_code = self.kwargs['faculty_code']
-        course_code = self.kwargs['course_code']
-        
-        faculty = get_object_or_404(Faculty, code__iexact=faculty_code)
-        course = get_object_or_404(
-            Course.objects.prefetch_related(
-                'academic_years__year_levels__semesters__notes'
-            ), 
-            faculty=faculty, 
-            code__iexact=course_code
+        return resolve_course(self.kwargs['faculty_code'], self.kwargs['course_code'])
+    
+    def build_course_tree(self, course):
+        prefetch_related_objects(
+            [course], 'academic_years__year_levels__semesters__notes'
         )
-        return course
+        return self.get_serializer(course).data
     
     def retrieve(self, request, *args, **kwargs):
         course = self.get_object()
         faculty = course.faculty
         
         all_courses = faculty.courses.all()
-        serializer = self.get_serializer(course)
+        # The nested tree is only rebuilt after something under this course changes
+        course_data = get_course_tree(
+            course, request, lambda: self.build_course_tree(course)
+        )
         
         return Response({
             'faculty': {
@@ -121,7 +156,7 @@ class CourseDetailAPIView(generics.RetrieveAPIView):
                 'code': faculty.code,
                 'description': faculty.description
             },
-            'course': serializer.data,
+            'course': course_data,
             'all_courses': [
                 {'id': c.id, 'name': c.name, 'code': c.code} 
                 for c in all_courses
@@ -133,7 +168,14 @@ class CourseDetailAPIView(generics.RetrieveAPIView):
 @api_view(['GET'])
 def faculty_courses_year_api(request, faculty_code, year):
     faculty = get_object_or_404(Faculty, code__iexact=faculty_code)
-    courses = faculty.courses.all()
+    # Year levels for every course of the faculty in one filtered prefetch
+    courses = faculty.courses.prefetch_related(
+        Prefetch(
+            'academic_years',
+            queryset=AcademicYear.objects.filter(year=year).prefetch_related('year_levels'),
+            to_attr='selected_academic_years'
+        )
+    )
     
     serializer = YearLevelWithCoursesSerializer(
         courses, 
@@ -155,12 +197,14 @@ def year_level_notes_api(request, faculty_code, course_code, year, level):
     """
     FIXED: Get all notes for a specific year level with correct semester separation
     """
-    faculty = get_object_or_404(Faculty, code__iexact=faculty_code)
-    course = get_object_or_404(Course, faculty=faculty, code__iexact=course_code)
-    academic_year = get_object_or_404(AcademicYear, course=course, year=year)
-    year_level = get_object_or_404(YearLevel, academic_year=academic_year, level=level)
+    # Faculty, course, academic year and year level come back from one joined query
+    year_level = resolve_year_level(faculty_code, course_code, year, level)
+    academic_year = year_level.academic_year
+    course = academic_year.course
+    faculty = course.faculty
     
-    # Get current student if logged in (for access control)
+    # COMMENTED OUT - Student lookup is only needed once access control is enabled
+    """
     student_id = request.query_params.get('student_id')
     student = None
     if student_id:
@@ -168,14 +212,17 @@ def year_level_notes_api(request, faculty_code, course_code, year, level):
             student = Student.objects.get(id=student_id)
         except Student.DoesNotExist:
             pass
+    """
     
     # Get semesters with their specific notes - FIXED THE BUG HERE
-    semesters = year_level.semesters.prefetch_related('notes').order_by('semester_number')
+    semesters = year_level.semesters.prefetch_related(
+        Prefetch('notes', queryset=Note.objects.order_by('-uploaded_at'))
+    ).order_by('semester_number')
     
     semester_data = []
     for semester in semesters:
-        # Get notes specifically for THIS semester only
-        semester_notes = semester.notes.all().order_by('-uploaded_at')
+        # Get notes specifically for THIS semester only (already ordered by the prefetch)
+        semester_notes = semester.notes.all()
         
         notes_with_access = []
         for note in semester_notes:
@@ -261,7 +308,7 @@ def note_preview_api(request, note_id):
     Get preview of a note (first page + sample question)
     Always free during trial period
     """
-    note = get_object_or_404(Note, id=note_id)
+    note = get_object_or_404(Note.objects.select_related('semester'), id=note_id)
     
     if not note.has_preview:
         return Response({
@@ -287,13 +334,12 @@ def note_preview_api(request, note_id):
                 'error': 'Preview access required',
                 'payment_required': True,
                 'preview_price': 0,  # Preview is always free
-                'view_price': SiteSettings.objects.first().view_price if SiteSettings.objects.exists() else 500
+                'view_price': get_pricing()['view_price']
             }, status=status.HTTP_402_PAYMENT_REQUIRED)
     """
     
-    # Track preview view
-    note.view_count += 1
-    note.save(update_fields=['view_count'])
+    # Track preview view (buffered, written in batches off the request thread)
+    view_counts.add(note.id)
     
     return Response({
         'id': note.id,
@@ -334,12 +380,12 @@ def note_view_api(request, note_id):
         ).first()
         
         if not view_access or not view_access.has_valid_access():
-            site_settings = SiteSettings.objects.first()
+            pricing = get_pricing()
             return Response({
                 'error': 'Payment required to view full document',
                 'payment_required': True,
-                'view_price': site_settings.view_price if site_settings else 500,
-                'download_price': site_settings.download_price if site_settings else 1000,
+                'view_price': pricing['view_price'],
+                'download_price': pricing['download_price'],
                 'payment_methods': ['mtn', 'airtel']
             }, status=status.HTTP_402_PAYMENT_REQUIRED)
         
@@ -349,9 +395,8 @@ def note_view_api(request, note_id):
         view_access.save()
     """
     
-    # Track view
-    note.view_count += 1
-    note.save(update_fields=['view_count'])
+    # Track view (buffered, written in batches off the request thread)
+    view_counts.add(note.id)
     
     # During free trial, provide access to view the document
     return Response({
@@ -372,18 +417,20 @@ def note_view_api(request, note_id):
 def note_download_api(request, note_id):
     """
     Download document - Disabled during free trial
+    Supports Range requests so interrupted downloads can resume
     """
-    note = get_object_or_404(Note, id=note_id)
+    note = get_object_or_404(Note.objects.select_related('blob'), id=note_id)
     
     # DISABLED FOR FREE TRIAL
-    return Response({
-        'error': 'Downloads are currently disabled during free trial period',
-        'message': 'Download functionality will be available after official launch',
-        'note_title': note.title,
-        'coming_soon': True
-    }, status=status.HTTP_423_LOCKED)
+    if not getattr(settings, 'PAPERFLOW_DOWNLOADS_ENABLED', False):
+        return Response({
+            'error': 'Downloads are currently disabled during free trial period',
+            'message': 'Download functionality will be available after official launch',
+            'note_title': note.title,
+            'coming_soon': True
+        }, status=status.HTTP_423_LOCKED)
     
-    # COMMENTED OUT - Future download logic
+    # COMMENTED OUT - Future payment check
     """
     student_id = request.query_params.get('student_id')
     
@@ -399,11 +446,10 @@ def note_download_api(request, note_id):
         ).first()
         
         if not download_access or not download_access.has_valid_access():
-            site_settings = SiteSettings.objects.first()
             return Response({
                 'error': 'Payment required to download document',
                 'payment_required': True,
-                'download_price': site_settings.download_price if site_settings else 1000,
+                'download_price': get_pricing()['download_price'],
                 'payment_methods': ['mtn', 'airtel']
             }, status=status.HTTP_402_PAYMENT_REQUIRED)
         
@@ -411,20 +457,25 @@ def note_download_api(request, note_id):
         download_access.last_accessed = timezone.now()
         download_access.access_count += 1
         download_access.save()
+    """
     
-    # Track download
-    note.download_count += 1
-    note.save(update_fields=['download_count'])
-    
-    # Return file for download
-    from django.http import FileResponse
-    response = FileResponse(
-        note.file.open('rb'),
+    response = serve_file(
+        request,
+        note.file,
+        filename=f"{note.title}{note.file_extension or ''}",
         as_attachment=True,
-        filename=f"{note.title}.{note.file_extension}"
+        # Identical content shares one validator, whichever note it is served from
+        etag=f'"{note.blob.sha256}"' if note.blob_id else None
     )
+    
+    # Count a download once per transfer: not for a 304, nor for a resumed range
+    range_header = request.META.get('HTTP_RANGE', '')
+    if response.status_code == 200 and (not range_header or range_header.startswith('bytes=0-')):
+        download_counts.add(note.id)
+    elif response.status_code == 206 and response['Content-Range'].startswith('bytes 0-'):
+        download_counts.add(note.id)
+    
     return response
-    """
 
 
 # 💳 PAYMENT APIS (Commented out for future use)
@@ -470,11 +521,11 @@ def initiate_payment_api(request):
             }, status=status.HTTP_400_BAD_REQUEST)
         
         # Get pricing
-        site_settings = SiteSettings.objects.first()
+        pricing = get_pricing()
         if payment_type == 'view':
-            amount = site_settings.view_price if site_settings else Decimal('500.00')
+            amount = pricing['view_price']
         else:  # download
-            amount = site_settings.download_price if site_settings else Decimal('1000.00')
+            amount = pricing['download_price']
         
         # Create payment record
         payment = Payment.objects.create(
@@ -586,45 +637,92 @@ def payment_status_api(request, payment_id):
 
 # 🔍 SEARCH API
 class SearchNotesAPIView(generics.ListAPIView):
+    '''
+    Matching notes a page at a time (follow `next`); the first page also
+    carries facet counts over every match for the filter sidebar. A query
+    that matches nothing is retried with misspelled words corrected, and
+    the correction is returned as `did_you_mean`.
+    '''
     serializer_class = SearchResultSerializer
-    
-    def get_queryset(self):
+    pagination_class = KeysetPagination
+    
+    @property
+    def cursor_ordering(self):
+        if self.request.query_params.get('q', '').strip():
+            return ('search_rank', '-uploaded_at', '-id')
+        return ('-uploaded_at', '-id')
+    
+    def list(self, request, *args, **kwargs):
+        queryset = self.get_queryset()
+        page = self.paginate_queryset(queryset)
+        
+        did_you_mean = None
+        search_query = request.query_params.get('q', '').strip()
+        if search_query and not page and not self.paginator.cursor:
+            did_you_mean = suggest_query(search_query)
+            if did_you_mean:
+                queryset = self.get_queryset(did_you_mean)
+                page = self.paginate_queryset(queryset)
+        
+        response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+        if did_you_mean and response.data['next']:
+            # Later pages continue the corrected search
+            response.data['next'] = replace_query_param(response.data['next'], 'q', did_you_mean)
+        if not self.paginator.cursor:
+            response.data['did_you_mean'] = did_you_mean
+            response.data['facets'] = search_facets(queryset)
+        return response
+    
+    def get_queryset(self, search_query=None):
         queryset = Note.objects.select_related(
             'semester__year_level__academic_year__course__faculty'
         ).all()
         
-        # Search query
-        search_query = self.request.query_params.get('q', '')
-        if search_query:
-            queryset = queryset.filter(
-                Q(title__icontains=search_query) | 
-                Q(description__icontains=search_query)
-            )
-        
-        # Filters
+        # Filters (on the hierarchy keys copied onto each note, stored lowercase)
         faculty_code = self.request.query_params.get('faculty', '')
         if faculty_code:
-            queryset = queryset.filter(
-                semester__year_level__academic_year__course__faculty__code__iexact=faculty_code
-            )
+            queryset = queryset.filter(faculty_code=faculty_code.lower())
         
         course_code = self.request.query_params.get('course', '')
         if course_code:
-            queryset = queryset.filter(
-                semester__year_level__academic_year__course__code__iexact=course_code
-            )
+            queryset = queryset.filter(course_code=course_code.lower())
         
         year = self.request.query_params.get('year', '')
         if year:
-            queryset = queryset.filter(
-                semester__year_level__academic_year__year=year
-            )
+            queryset = queryset.filter(academic_year=year)
         
         note_type = self.request.query_params.get('note_type', '')
         if note_type:
             queryset = queryset.filter(note_type=note_type)
         
-        return queryset.order_by('-uploaded_at')[:100]
+        # Search query - ranked full-text match with prefix support
+        if search_query is None:
+            search_query = self.request.query_params.get('q', '').strip()
+        if search_query:
+            queryset = get_search_backend().search(queryset, search_query)
+        else:
+            queryset = queryset.order_by('-uploaded_at', '-id')
+        
+        return queryset
+
+
+# 💡 SEARCH SUGGESTIONS (search-as-you-type)
+@api_view(['GET'])
+def search_suggest_api(request):
+    '''
+    Top completions of a prefix from note titles, courses and faculties,
+    most viewed first; served from worker memory without a query
+    GET /api/search/suggest/?q=intro+prog&limit=5
+    '''
+    query = request.query_params.get('q', '').strip()
+    try:
+        limit = min(max(int(request.query_params.get('limit', MAX_SUGGESTIONS)), 1), MAX_SUGGESTIONS)
+    except ValueError:
+        limit = MAX_SUGGESTIONS
+    return Response({
+        'query': query,
+        'suggestions': suggest(query, limit) if query else [],
+    })
 
 
 # 📤 FILE UPLOAD API
@@ -640,10 +738,83 @@ class NoteUploadAPIView(generics.CreateAPIView):
         return Response(response_serializer.data, status=status.HTTP_201_CREATED)
 
 
+# 🧩 CHUNKED UPLOAD API (resumable)
+class UploadSessionCreateAPIView(generics.CreateAPIView):
+    serializer_class = UploadSessionSerializer
+    
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        session = start_session(serializer)
+        return Response(self.get_serializer(session).data, status=status.HTTP_201_CREATED)
+
+
+class UploadSessionAPIView(APIView):
+    """GET reports how many bytes arrived; PUT appends the next chunk"""
+    
+    def get(self, request, session_id):
+        session = get_object_or_404(UploadSession, id=session_id)
+        return Response(UploadSessionSerializer(session, context={'request': request}).data)
+    
+    def put(self, request, session_id):
+        session = get_object_or_404(UploadSession, id=session_id)
+        
+        content_range = request.META.get('HTTP_CONTENT_RANGE')
+        if content_range:
+            byte_range = parse_content_range(content_range)
+            if byte_range is None:
+                return Response({'error': 'Invalid Content-Range header'}, status=status.HTTP_400_BAD_REQUEST)
+            start, end, total = byte_range
+            if total is not None and total != session.total_size:
+                return Response({
+                    'error': f'Content-Range total does not match the declared size of {session.total_size} bytes'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            length = end - start + 1
+        else:
+            try:
+                start = int(request.query_params.get('offset', session.received_bytes))
+                length = int(request.META.get('CONTENT_LENGTH') or 0)
+            except ValueError:
+                return Response({'error': 'Invalid offset or Content-Length'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            received = write_chunk(session, start, request.stream, length)
+        except UploadConflict as e:
+            return Response({
+                'error': str(e),
+                'received_bytes': session.received_bytes
+            }, status=status.HTTP_409_CONFLICT)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'received_bytes': received,
+            'total_size': session.total_size,
+            'complete': received == session.total_size
+        })
+
+
+class UploadSessionFinalizeAPIView(APIView):
+    
+    def post(self, request, session_id):
+        session = get_object_or_404(UploadSession, id=session_id)
+        try:
+            note = finalize_session(session)
+        except UploadConflict as e:
+            return Response({
+                'error': str(e),
+                'received_bytes': session.received_bytes
+            }, status=status.HTTP_409_CONFLICT)
+        
+        response_serializer = SearchResultSerializer(note, context={'request': request})
+        return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+
+
 # 📋 FACULTY LIST API
 class FacultyListAPIView(generics.ListAPIView):
     queryset = Faculty.objects.all()
     serializer_class = FacultyListSerializer
+    pagination_class = FacultyPagination
 
 
 # 🏫 FACULTY DETAIL API
@@ -657,24 +828,11 @@ class FacultyDetailAPIView(generics.RetrieveAPIView):
 # 📊 STATISTICS API
 @api_view(['GET'])
 def statistics_api(request):
-    stats = {
-        'total_faculties': Faculty.objects.count(),
-        'total_courses': Course.objects.count(),
-        'total_notes': Note.objects.count(),
-        'current_academic_years': AcademicYear.objects.filter(is_current=True).count(),
-        'notes_by_type': {},
-        'recent_uploads': [],
-        'total_previews': Note.objects.filter(has_preview=True).count(),
-        'premium_notes': Note.objects.filter(is_premium=True).count(),
-        # COMMENTED OUT - Payment stats for future
-        # 'total_payments': Payment.objects.filter(status='completed').count(),
-        # 'total_revenue': Payment.objects.filter(status='completed').aggregate(total=models.Sum('amount'))['total'] or 0,
-    }
-    
-    # Notes by type
-    for note_type, _ in Note.NOTE_TYPES:
-        count = Note.objects.filter(note_type=note_type).count()
-        stats['notes_by_type'][note_type] = count
+    # Totals come from the incrementally maintained counters table
+    stats = get_statistics()
+    # COMMENTED OUT - Payment stats for future
+    # stats['total_payments'] = Payment.objects.filter(status='completed').count()
+    # stats['total_revenue'] = Payment.objects.filter(status='completed').aggregate(total=models.Sum('amount'))['total'] or 0
     
     # Recent uploads
     recent_notes = Note.objects.select_related(
@@ -695,6 +853,35 @@ def statistics_api(request):
     return Response(stats)
 
 
+# 🩺 REQUEST DIAGNOSTICS API (staff or metrics token only)
+@api_view(['GET'])
+def request_diagnostics_api(request):
+    """
+    Latency, query and response-size aggregates per endpoint, summed over
+    every worker (see metrics.py)
+    """
+    if not metrics_access_allowed(request):
+        return Response({'error': 'Not allowed'}, status=status.HTTP_403_FORBIDDEN)
+    
+    totals = metrics.collect()
+    return Response({
+        'workers': totals['workers'],
+        'endpoints': summarize(totals['endpoints'])
+    })
+
+
+# 📈 PROMETHEUS METRICS (staff or metrics token only)
+@api_view(['GET'])
+def metrics_api(request):
+    if not metrics_access_allowed(request):
+        return Response({'error': 'Not allowed'}, status=status.HTTP_403_FORBIDDEN)
+    
+    return HttpResponse(
+        metrics.render(metrics.collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+
 # 🗑️ NOTE DELETE API
 class NoteDeleteAPIView(generics.DestroyAPIView):
     queryset = Note.objects.all()
@@ -702,11 +889,8 @@ class NoteDeleteAPIView(generics.DestroyAPIView):
     
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
-        # Delete the file from storage
-        if instance.file:
-            instance.file.delete()
-        if instance.preview_file:
-            instance.preview_file.delete()
+        # Stored files are released by the post_delete signal; a shared
+        # file is only removed once its last note is gone
         self.perform_destroy(instance)
         return Response(status=status.HTTP_204_NO_CONTENT)
 